@@ -0,0 +1,156 @@
+# answer_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Hashable, List, Optional
+
+import numpy as np
+
+from logging_config import get_logger
+
+logger = get_logger('answer_cache')
+
+# Semantic answer cache configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Minimum cosine similarity for a hit
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+@dataclass
+class _Entry:
+    context: Hashable
+    doc_ids: FrozenSet[str]
+    question: str
+    answer: str
+    expires_at: float
+    hits: int = 0
+
+
+def answer_context(instruction: str, doc_versions: Dict[str, str]) -> Hashable:
+    """Returns the part of the key that must match exactly: the instruction and the cited documents at their versions."""
+    return instruction, frozenset(doc_versions.items())
+
+
+class AnswerCache:
+    """Serves stored answers to questions that are near-duplicates of earlier ones.
+
+    Entries are keyed by the question's embedding plus the exact set of documents (and
+    their versions) the answer was grounded on. A lookup hits when an entry with the same
+    context has cosine similarity of at least `threshold`; re-indexing a document changes
+    its version, so answers built on the old text stop matching. Embeddings live in one
+    preallocated matrix, so a lookup is a single matrix-vector product.
+    """
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._live = np.zeros(self.max_entries, dtype=bool)
+        self._entries: Dict[int, _Entry] = {}
+        # Slots in least-recently-used order
+        self._order: "OrderedDict[int, None]" = OrderedDict()
+        self._free: List[int] = list(range(self.max_entries - 1, -1, -1))
+        self._stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0, "invalidations": 0, "stores": 0}
+        self._hit_similarity = 0.0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def get(self, embedding: List[float], context: Hashable) -> Optional[str]:
+        """Returns the cached answer of the most similar question with the same context, or None."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or not self._entries or query.shape[0] != self._vectors.shape[1]:
+                self._stats["misses"] += 1
+                return None
+            similarities = self._vectors @ query
+            similarities[~self._live] = -1.0
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            for slot in candidates[np.argsort(-similarities[candidates])].tolist():
+                entry = self._entries[slot]
+                if entry.context != context:
+                    continue
+                if entry.expires_at < now:
+                    self._drop(slot)
+                    self._stats["expirations"] += 1
+                    continue
+                entry.hits += 1
+                self._order.move_to_end(slot)
+                self._stats["hits"] += 1
+                self._hit_similarity += float(similarities[slot])
+                logger.info(f"Answer cache hit (similarity {similarities[slot]:.4f}, {entry.hits} hit(s)) for cached question '{entry.question}'.")
+                return entry.answer
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, embedding: List[float], context: Hashable, doc_ids: FrozenSet[str], question: str, answer: str):
+        """Stores an answer, evicting the least recently used entry when full."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start over at the new width
+                self._reset(vector.shape[0])
+            if not self._free:
+                self._drop(next(iter(self._order)))
+                self._stats["evictions"] += 1
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._live[slot] = True
+            self._entries[slot] = _Entry(context, doc_ids, question, answer, time.monotonic() + self.ttl_seconds)
+            self._order[slot] = None
+            self._stats["stores"] += 1
+
+    def invalidate_document(self, doc_id: Optional[str]):
+        """Drops every answer grounded on a document, e.g. after it was re-indexed or deleted (all answers if None)."""
+        if doc_id is None:
+            self.clear()
+            return
+        with self._lock:
+            stale = [slot for slot, entry in self._entries.items() if doc_id in entry.doc_ids]
+            for slot in stale:
+                self._drop(slot)
+            self._stats["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._reset(self._vectors.shape[1])
+
+    def _reset(self, dimensions: int):
+        self._vectors = np.zeros((self.max_entries, dimensions), dtype=np.float32)
+        self._live[:] = False
+        self._entries = {}
+        self._order = OrderedDict()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _drop(self, slot: int):
+        del self._entries[slot]
+        del self._order[slot]
+        self._live[slot] = False
+        self._free.append(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            hits_avg = self._hit_similarity / stats["hits"] if stats["hits"] else 0.0
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["avg_hit_similarity"] = round(hits_avg, 4)
+        stats["max_entries"] = self.max_entries
+        stats["threshold"] = self.threshold
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["enabled"] = ANSWER_CACHE_ENABLED
+        return stats
+
+
+answer_cache = AnswerCache()
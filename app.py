@@ -1,29 +1,48 @@
 # app.py
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, File, UploadFile, Form
+import time
+
+# Start of the import phase in the startup report
+_IMPORT_STARTED = time.monotonic()
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
 from pathlib import Path
 import logging
-from database import Database, database
+from database import Database, database, get_engine
+from migrate import run_migrations
 from models import meta_table, sessions, questions, file_groups, group_files, chat_history
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, page_size, set_next_cursor
 import openai
 import os
 from logging_config import get_logger
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import asyncio
-from rag import query_cases, query_cases_by_group, process_file, is_document_present
-from sqlalchemy import insert, select
+import bisect
+from contextlib import contextmanager
+from blocking_pools import chroma_pool, retrieval_pool, ingest_pool, get_pool_stats, shutdown_pools
+from extraction import shutdown_process_pool
+from group_cache import group_cache
+import group_store
+from prompt_builder import PromptBuilder
+from session_summary import SessionSummarizer
+from write_buffer import write_buffer
+from answer_cache import ANSWER_CACHE_ENABLED, answer_cache, answer_context
+from ingestion_queue import ingestion_queue
+from coordination import coordinator
+from rag import CHROMA_SERVER_HOST, get_collection, refresh_document, query_cases, query_cases_by_group, process_file, sync_folder, documents_present, add_index_listener, get_embedding_stats, get_embedding_cache_stats, get_vector_index_stats, get_query_cache_stats, get_ingest_pipeline_stats, get_text_store_stats, get_lexical_index_stats, try_query_embedding, document_versions
+from sqlalchemy import select, tuple_
 import uuid
 import json
 from pydantic import BaseModel
 import traceback
 from logging.handlers import RotatingFileHandler
 from concurrent.futures import ThreadPoolExecutor
-from elasticapm.contrib.starlette import ElasticAPM, make_apm_client
+from elasticapm.contrib.starlette import ElasticAPM
 from elasticapm import capture_span
 from elasticapm.handlers.logging import LoggingFilter
 
@@ -38,49 +57,148 @@ load_dotenv()
 # Initialize logging
 logger = get_logger('app')
 
+# Chat completion configuration
+OPENAI_CHAT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CHAT_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_CONCURRENT_CHATS = int(os.getenv("OPENAI_MAX_CONCURRENT_CHATS", "32"))
+OPENAI_CHAT_MAX_TOKENS = int(os.getenv("OPENAI_CHAT_MAX_TOKENS", "150"))
+# Longest wait for the next token of a streamed answer; the whole answer is still bounded by OPENAI_CHAT_TIMEOUT_SECONDS
+OPENAI_STREAM_CHUNK_TIMEOUT_SECONDS = float(os.getenv("OPENAI_STREAM_CHUNK_TIMEOUT_SECONDS", "15"))
+# Sent when the chat model fails; never cached
+FALLBACK_ANSWER = "I'm sorry, I couldn't process your request at the moment."
+PROMPT_HISTORY_MESSAGES = int(os.getenv("PROMPT_HISTORY_MESSAGES", "5"))  # Recent messages sent verbatim; older ones are summarized
+
+# Startup configuration
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"  # Apply pending schema migrations at startup
+STARTUP_SYNC = os.getenv("STARTUP_SYNC", "immediate")  # Upload folder sync at startup: 'immediate', 'deferred' or 'off'
+STARTUP_SYNC_DELAY_SECONDS = float(os.getenv("STARTUP_SYNC_DELAY_SECONDS", "30"))  # Wait before a deferred sync
+APM_ENABLED = os.getenv("APM_ENABLED", "true").lower() == "true"
+APM_SERVER_URL = os.getenv("APM_SERVER_URL", "http://apm-server:8200")
+
+# Prompts are assembled within the model's context window minus the reply allowance
+prompt_builder = PromptBuilder(reply_tokens=OPENAI_CHAT_MAX_TOKENS)
+# Older conversation is carried as a rolling per-session summary updated after each reply
+session_summarizer = SessionSummarizer(prompt_builder, recent_messages=PROMPT_HISTORY_MESSAGES)
+
+class CompletionStatus:
+    """Filled in by the chat manager: whether the completion finished normally rather than failing or being cut short."""
+    def __init__(self):
+        self.complete = False
+
 class OpenAIChatManager:
     """Handles communication with the OpenAI API."""
     def __init__(self, api_key: str):
         openai.api_key = api_key
-
-    def get_response(self, user_input: str) -> str:
-        """Fetches the response from OpenAI for a given input."""
+        # Bounds concurrent completions so a burst of chats cannot exhaust sockets or rate limits;
+        # created on first use so it binds to the server's event loop
+        self._semaphore = None
+
+    async def get_response(self, user_input: str, status: Optional[CompletionStatus] = None) -> str:
+        """Fetches the response from OpenAI for a given input without blocking the event loop."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENT_CHATS)
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": user_input}],
-                max_tokens=150
-            )
+            async with self._semaphore:
+                response = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(
+                        model="gpt-3.5-turbo",
+                        messages=[{"role": "user", "content": user_input}],
+                        max_tokens=OPENAI_CHAT_MAX_TOKENS,
+                        request_timeout=OPENAI_CHAT_TIMEOUT_SECONDS
+                    ),
+                    OPENAI_CHAT_TIMEOUT_SECONDS
+                )
+            if status is not None:
+                status.complete = response.choices[0].get('finish_reason') == "stop"
             return response.choices[0].message['content'].strip()
+        except asyncio.CancelledError:
+            # The client went away; let the cancellation propagate
+            raise
         except Exception as e:
             logger.error("Error getting OpenAI response: %s", str(e))
-            return "I'm sorry, I couldn't process your request at the moment."
+            return FALLBACK_ANSWER
+
+    async def stream_response(self, user_input: str, status: Optional[CompletionStatus] = None) -> AsyncIterator[str]:
+        """Yields the response from OpenAI token by token as it is generated.
+
+        A stream that stalls for OPENAI_STREAM_CHUNK_TIMEOUT_SECONDS, or runs past
+        OPENAI_CHAT_TIMEOUT_SECONDS in total, is abandoned as a failed completion.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENT_CHATS)
+        produced = False
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + OPENAI_CHAT_TIMEOUT_SECONDS
+        try:
+            async with self._semaphore:
+                stream = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(
+                        model="gpt-3.5-turbo",
+                        messages=[{"role": "user", "content": user_input}],
+                        max_tokens=OPENAI_CHAT_MAX_TOKENS,
+                        stream=True,
+                        request_timeout=OPENAI_CHAT_TIMEOUT_SECONDS
+                    ),
+                    OPENAI_CHAT_TIMEOUT_SECONDS
+                )
+                chunks = stream.__aiter__()
+                while True:
+                    timeout = min(OPENAI_STREAM_CHUNK_TIMEOUT_SECONDS, max(deadline - loop.time(), 0))
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    delta = chunk.choices[0].delta.get('content')
+                    if delta:
+                        produced = True
+                        yield delta
+                    if status is not None and chunk.choices[0].get('finish_reason') is not None:
+                        status.complete = chunk.choices[0].get('finish_reason') == "stop"
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.error("OpenAI response stream stalled; answer is incomplete.")
+            if status is not None:
+                status.complete = False
+            if not produced:
+                yield FALLBACK_ANSWER
+        except Exception as e:
+            logger.error("Error streaming OpenAI response: %s", str(e))
+            if status is not None:
+                status.complete = False
+            if not produced:
+                yield FALLBACK_ANSWER
 
 class FileManager:
     """Manages file uploads to the server."""
     def __init__(self, upload_folder: str):
         self.upload_folder = upload_folder
-        self._ensure_upload_folder()
+        # Sorted file names and the folder mtime they were listed at
+        self._listing: Tuple[Optional[int], List[str]] = (None, [])
 
-    def _ensure_upload_folder(self):
+    def ensure_upload_folder(self):
         """Creates the upload folder if it doesn't exist."""
         if not os.path.exists(self.upload_folder):
             os.makedirs(self.upload_folder)
             logger.info("Created uploads folder: %s", self.upload_folder)
 
     async def get_existing_files(self) -> List[str]:
-        """Returns a list of existing files in the upload folder."""
-        return [f for f in os.listdir(self.upload_folder) if os.path.isfile(os.path.join(self.upload_folder, f))]
+        """Returns the files in the upload folder in name order, listed again only after the folder changed."""
+        mtime_ns = os.stat(self.upload_folder).st_mtime_ns
+        if self._listing[0] != mtime_ns:
+            names = sorted(f for f in os.listdir(self.upload_folder) if os.path.isfile(os.path.join(self.upload_folder, f)))
+            self._listing = (mtime_ns, names)
+        return self._listing[1]
     
     async def save_files(self, files: List[UploadFile]) -> dict:
-        """Saves uploaded files to the server, stores metadata in the database, and processes for ChromaDB."""
+        """Saves uploaded files to the server, stores metadata in the database, and queues them for ChromaDB ingestion."""
         try:
+            jobs = []
             for file in files:
                 file_location = os.path.join(self.upload_folder, file.filename)
                 
-                # Save the file to the filesystem
-                with open(file_location, "wb") as f:
-                    f.write(await file.read())
+                # Save the file to the filesystem without blocking the event loop
+                content = await file.read()
+                await asyncio.to_thread(self._write_file, file_location, content)
                 logger.info("File uploaded successfully: %s", file.filename)
 
                 # Get file metadata
@@ -97,18 +215,20 @@ class FileManager:
                 await database.execute(query)
                 logger.info("File metadata stored in the database for: %s", file.filename)
 
-                # Process the file for ChromaDB
-                try:
-                    process_file(file_location)
-                    logger.info(f"File {file.filename} processed and added to ChromaDB")
-                except Exception as e:
-                    logger.error(f"Error processing file {file.filename} for ChromaDB: {str(e)}")
+                # Extraction and embedding happen in the background; /ingest-status reports progress
+                job_id = await ingestion_queue.enqueue(file.filename, file_location)
+                jobs.append({"file_name": file.filename, "job_id": job_id})
 
-            return {"success": True, "details": [file.filename for file in files]}
+            return {"success": True, "details": [file.filename for file in files], "jobs": jobs}
 
         except Exception as e:
-            logger.error("Error uploading files, saving metadata, or processing for ChromaDB: %s", str(e))
+            logger.error("Error uploading files, saving metadata, or queueing for ChromaDB: %s", str(e))
             return {"success": False, "error": f"Failed to upload: {str(e)}"}
+
+    @staticmethod
+    def _write_file(file_location: str, content: bytes):
+        with open(file_location, "wb") as f:
+            f.write(content)
         
 
 class WebSocketManager:
@@ -117,209 +237,289 @@ class WebSocketManager:
         self.chat_manager = chat_manager
 
     async def handle_websocket(self, websocket: WebSocket):
-        """Manages the WebSocket lifecycle and communication."""
+        """Manages the WebSocket lifecycle and communication.
+
+        Messages are read by a separate task so a disconnect is noticed while a turn is
+        still generating; the in-progress turn is then cancelled instead of finishing
+        work nobody will receive.
+        """
         await websocket.accept()
         logger.info("WebSocket connection accepted")
+        incoming = asyncio.Queue()
+        reader = asyncio.create_task(self._read_messages(websocket, incoming))
         try:
             while True:
-                data = await websocket.receive_text()
-                logger.debug(f"Received message: {data}")
-
-                # Parse the JSON message to extract session_id, message, and group_ids
-                try:
-                    message_data = json.loads(data)
-                    session_id = message_data.get('session_id')
-                    message = message_data.get('message')
-                    group_ids = message_data.get('group_ids')  # Get group IDs if provided
-                except json.JSONDecodeError:
-                    logger.error("Invalid JSON received")
-                    continue
-
-                if not session_id:
-                    # Generate a new session ID if not provided
-                    session_id = str(uuid.uuid4())
-                    await self.store_session(session_id)
-                else:
-                    # Check if the session exists; if not, create it
-                    existing_session = await self.get_session(session_id)
-                    if not existing_session:
-                        await self.store_session(session_id)
-
-                question_id = str(uuid.uuid4())  # Generate a unique question ID
-                await self.store_question(session_id, question_id, message)  # Store the question
-
-                # Store user message in chat_history
-                await self.store_chat_message(session_id, 'user', message)
-
-                # Retrieve last N messages for context (e.g., last 5 messages)
-                chat_history_records = await self.get_recent_chat_history(session_id, limit=5)
-                context = "\n".join([
-                    f"{record['sender'].capitalize()}: {record['message']}" for record in chat_history_records
-                ])
-
-                # Prepare the prompt with context
-                prompt = f"{context}\nUser: {message}\nAI:"
-
-                # Initialize variables for ChromaDB results
-                ids = []
-                texts = []
-                similarities = []
-
-                # Handle group-based queries
-                if group_ids:
-                    # Fetch the file names associated with the group IDs from the database
-                    query = group_files.select().where(group_files.c.group_id.in_(group_ids))
-                    group_file_records = await database.fetch_all(query)
-                    file_names = [record['file_name'] for record in group_file_records]
-
-                    # Log the file names fetched
-                    logger.info(f"Fetched file names for group IDs {group_ids}: {file_names}")
-
-                    if not file_names:
-                        logger.error("No files found for the selected groups.")
-                        # Instead of sending a static message, generate a response via OpenAI
-                        openai_prompt = f"{context}\nYou mentioned specific groups, but no documents were found associated with those groups.\n\nPlease provide an appropriate response based on the available information."
-                        openai_response = self.chat_manager.get_response(openai_prompt)
-                        answer = openai_response
-                        logger.info(f"Sending answer: {answer}")
-                        await websocket.send_text(answer)
-                        # Store bot response in chat_history
-                        await self.store_chat_message(session_id, 'bot', answer)
-                        continue
-
-                    # Now check if these documents are in ChromaDB, and process if not
-                    missing_files = []
-                    for file_name in file_names:
-                        if not is_document_present(file_name):
-                            missing_files.append(file_name)
-                            logger.info(f"Document '{file_name}' is missing from ChromaDB and will be processed.")
-
-                    if missing_files:
-                        logger.info(f"Processing missing files: {missing_files}")
-                        for file_name in missing_files:
-                            file_path = os.path.join("./uploads", file_name)
-                            if os.path.exists(file_path):
-                                try:
-                                    # Run process_file in an executor to avoid blocking
-                                    loop = asyncio.get_event_loop()
-                                    await loop.run_in_executor(None, process_file, file_path)
-                                    logger.info(f"Processed and added '{file_name}' to ChromaDB.")
-                                except Exception as e:
-                                    logger.error(f"Failed to process '{file_name}': {str(e)}")
-                            else:
-                                logger.error(f"File '{file_name}' does not exist in uploads folder.")
-
-                    # Now all documents should be in ChromaDB
-                    # Proceed to query ChromaDB with these documents
-                    existing_files = []
-                    for file_name in file_names:
-                        if is_document_present(file_name):
-                            existing_files.append(file_name)
-                        else:
-                            logger.warning(f"Document '{file_name}' is still missing from ChromaDB after processing.")
-
-                    if not existing_files:
-                        logger.error("No documents found in ChromaDB after processing.")
-                        # Generate response via OpenAI
-                        openai_prompt = f"{context}\nYou attempted to query specific groups, but no relevant documents were found in ChromaDB after processing.\n\nPlease provide an appropriate response based on the available information."
-                        openai_response = self.chat_manager.get_response(openai_prompt)
-                        answer = openai_response
-                        logger.info(f"Sending answer: {answer}")
-                        await websocket.send_text(answer)
-                        # Store bot response in chat_history
-                        await self.store_chat_message(session_id, 'bot', answer)
-                        continue
-
-                    # Query ChromaDB with the existing files
-                    ids, texts, similarities = query_cases_by_group(existing_files, message, threshold=0.8)
-
-                    if not ids:
-                        logger.error("No documents found with the given criteria after querying ChromaDB.")
-                        # Generate response via OpenAI
-                        openai_prompt = f"{context}\nYou queried specific groups, but ChromaDB returned no relevant documents.\n\nPlease provide an appropriate response based on the available information."
-                        openai_response = self.chat_manager.get_response(openai_prompt)
-                        answer = openai_response
-                        logger.info(f"Sending answer: {answer}")
-                        await websocket.send_text(answer)
-                        # Store bot response in chat_history
-                        await self.store_chat_message(session_id, 'bot', answer)
-                        continue
-
-                    # Log the query results
-                    logger.info(f"Query results: IDs={ids}, Similarities={similarities}")
-
-                else:
-                    # Query ChromaDB for relevant cases
-                    ids, texts, similarities = query_cases(message)
-
-                # At this point, regardless of query type, we have ids, texts, similarities
-                # Now generate a unified response using OpenAI
-                if texts and len(texts) > 0:
-                    # Combine all relevant information into a prompt for OpenAI
-                    chroma_info = "\n".join([
-                        f"Case ID: {id_}\nText: {text}\nSimilarity: {similarity}"
-                        for id_, text, similarity in zip(ids, texts, similarities)
-                    ])
-                    combined_prompt = f"{context}\nRelevant Cases:\n{chroma_info}\n\nPlease provide a refined response based on the above information."
+                data = await incoming.get()
+                if data is None:
+                    break
+                turn = asyncio.create_task(self.handle_message(websocket, data))
+                done, _ = await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if turn not in done:
+                    # The reader finished first, meaning the client disconnected mid-turn
+                    logger.warning("WebSocket client disconnected, cancelling in-progress turn")
+                    turn.cancel()
+                    await asyncio.gather(turn, return_exceptions=True)
+                    break
+                if turn.exception() is not None:
+                    raise turn.exception()
+        except WebSocketDisconnect:
+            logger.warning("WebSocket client disconnected")
+        except Exception as e:
+            logger.error(f"WebSocket error: {str(e)}")
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
 
-                    openai_response = self.chat_manager.get_response(combined_prompt)
-                    answer = openai_response
-                else:
-                    # No relevant cases found, prompt OpenAI accordingly
-                    openai_prompt = f"{context}\nNo relevant cases found for your query.\n\nPlease provide a response based on the available information."
-                    openai_response = self.chat_manager.get_response(openai_prompt)
-                    answer = openai_response
+    async def _read_messages(self, websocket: WebSocket, incoming: asyncio.Queue):
+        """Forwards received messages to the queue, ending with None when the socket closes."""
+        try:
+            while True:
+                incoming.put_nowait(await websocket.receive_text())
+        except WebSocketDisconnect:
+            logger.warning("WebSocket client disconnected")
+        except Exception as e:
+            logger.error(f"WebSocket receive error: {str(e)}")
+        finally:
+            incoming.put_nowait(None)
 
-                logger.info(f"Sending answer: {answer}")
-                await websocket.send_text(answer)
+    async def handle_message(self, websocket: WebSocket, data: str):
+        """Answers a single chat message."""
+        logger.debug(f"Received message: {data}")
 
-                # Store bot response in chat_history
-                await self.store_chat_message(session_id, 'bot', answer)
+        # Parse the JSON message to extract session_id, message, and group_ids
+        try:
+            message_data = json.loads(data)
+            session_id = message_data.get('session_id')
+            message = message_data.get('message')
+            group_ids = message_data.get('group_ids')  # Get group IDs if provided
+            stream = bool(message_data.get('stream'))  # Stream the answer as start/delta/end frames
+        except json.JSONDecodeError:
+            logger.error("Invalid JSON received")
+            return
+        if not isinstance(message, str):
+            logger.error("Chat message without text received; ignoring it.")
+            return
+
+        if not session_id:
+            # Generate a new session ID if not provided
+            session_id = str(uuid.uuid4())
+            await self.store_session(session_id)
+            session_summarizer.new_session(session_id)
+        else:
+            # Create the session if it does not exist; known sessions are not re-queried
+            await write_buffer.ensure_session(session_id)
+
+        question_id = str(uuid.uuid4())  # Generate a unique question ID
+        await self.store_question(session_id, question_id, message)  # Store the question
+
+        # Store user message in chat_history
+        await self.store_chat_message(session_id, 'user', message)
+
+        # Retrieve the session summary and the messages not yet folded into it
+        summary, history = await session_summarizer.context(session_id)
+
+        # Initialize variables for ChromaDB results
+        ids = []
+        texts = []
+        similarities = []
+
+        # Handle group-based queries
+        if group_ids:
+            # Resolve the group IDs to file names, from cache unless a group was edited
+            file_names = await group_cache.files_for(group_ids)
+
+            # Log the file names fetched
+            logger.info(f"Fetched file names for group IDs {group_ids}: {file_names}")
+
+            if not file_names:
+                logger.error("No files found for the selected groups.")
+                # Instead of sending a static message, generate a response via OpenAI
+                await self.answer(websocket, session_id, question_id, history, "You mentioned specific groups, but no documents were found associated with those groups.\n\nPlease provide an appropriate response based on the available information.", None, stream, summary)
+                return
+
+            # Now check which of these documents are in ChromaDB in one bulk lookup, and process the rest
+            present = group_cache.ingested_for(group_ids)
+            if present is None:
+                generation = group_cache.ingested_generation
+                try:
+                    present = await chroma_pool.run(documents_present, file_names)
+                    group_cache.store_ingested(group_ids, present, generation)
+                except asyncio.TimeoutError:
+                    # Retrieval only returns indexed documents anyway; don't ingest on a guess
+                    logger.error("Document presence check timed out; querying all of the group's files.")
+                    present = set(file_names)
+            missing_files = [file_name for file_name in file_names if file_name not in present]
+
+            if missing_files and not coordinator.is_leader:
+                # Only the leader writes to the index; it ingests them for later turns
+                logger.info(f"Handing missing files to the ingestion leader: {missing_files}")
+                for file_name in missing_files:
+                    file_path = os.path.join("./uploads", file_name)
+                    if os.path.exists(file_path):
+                        await ingestion_queue.enqueue(file_name, file_path)
+                    else:
+                        logger.error(f"File '{file_name}' does not exist in uploads folder.")
+            elif missing_files:
+                logger.info(f"Processing missing files: {missing_files}")
+                for file_name in missing_files:
+                    file_path = os.path.join("./uploads", file_name)
+                    if os.path.exists(file_path):
+                        try:
+                            # Run process_file in the ingest pool to avoid blocking
+                            await ingest_pool.run(process_file, file_path)
+                            logger.info(f"Processed and added '{file_name}' to ChromaDB.")
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception as e:
+                            logger.error(f"Failed to process '{file_name}': {str(e)}")
+                    else:
+                        logger.error(f"File '{file_name}' does not exist in uploads folder.")
+                try:
+                    present = await chroma_pool.run(documents_present, file_names)
+                except asyncio.TimeoutError:
+                    logger.error("Document presence check timed out; querying all of the group's files.")
+                    present = set(file_names)
+
+            # Proceed to query ChromaDB with the documents that are now present
+            existing_files = [file_name for file_name in file_names if file_name in present]
+            for file_name in missing_files:
+                if file_name not in present:
+                    logger.warning(f"Document '{file_name}' is still missing from ChromaDB after processing.")
+
+            if not existing_files:
+                logger.error("No documents found in ChromaDB after processing.")
+                # Generate response via OpenAI
+                await self.answer(websocket, session_id, question_id, history, "You attempted to query specific groups, but no relevant documents were found in ChromaDB after processing.\n\nPlease provide an appropriate response based on the available information.", None, stream, summary)
+                return
+
+            # Query ChromaDB with the existing files
+            try:
+                ids, texts, similarities = await retrieval_pool.run(query_cases_by_group, existing_files, message, threshold=0.8)
+            except asyncio.TimeoutError:
+                logger.error("Group retrieval timed out; answering without retrieved cases.")
 
+            if not ids:
+                logger.error("No documents found with the given criteria after querying ChromaDB.")
+                # Generate response via OpenAI
+                await self.answer(websocket, session_id, question_id, history, "You queried specific groups, but ChromaDB returned no relevant documents.\n\nPlease provide an appropriate response based on the available information.", None, stream, summary)
+                return
 
-        except WebSocketDisconnect:
-            logger.warning("WebSocket client disconnected")
-        except Exception as e:
-            logger.error(f"WebSocket error: {str(e)}")
+            # Log the query results
+            logger.info(f"Query results: IDs={ids}, Similarities={similarities}")
 
-    async def get_session(self, session_id: str):
-        """Checks if a session exists in the database."""
-        query = select(sessions).where(sessions.c.session_id == session_id)
-        result = await database.fetch_one(query)
-        return result
+        else:
+            # Query ChromaDB for relevant cases
+            try:
+                ids, texts, similarities = await retrieval_pool.run(query_cases, message)
+            except asyncio.TimeoutError:
+                logger.error("Retrieval timed out; answering without retrieved cases.")
+
+        # At this point, regardless of query type, we have ids, texts, similarities
+        # Now generate a unified response using OpenAI
+        if texts and len(texts) > 0:
+            # Combine the best-ranked cases that fit the prompt budget
+            passages = list(zip(ids, texts, similarities))
+            await self.answer(websocket, session_id, question_id, history, "Please provide a refined response based on the above information.", passages, stream, summary)
+        else:
+            # No relevant cases found, prompt OpenAI accordingly
+            await self.answer(websocket, session_id, question_id, history, "No relevant cases found for your query.\n\nPlease provide a response based on the available information.", None, stream, summary)
+
+    async def answer(self, websocket: WebSocket, session_id: str, question_id: str, history: List[Tuple[str, str]], instruction: str, passages: Optional[List[Tuple[str, str, float]]], stream: bool, summary: str = ""):
+        """Assembles the prompt within the token budget, logs its breakdown and responds."""
+        prompt, breakdown = prompt_builder.build(history, instruction, passages, summary=summary)
+        logger.info(f"Prompt for question {question_id}: {breakdown}")
+        # Only standalone questions are cached; a follow-up's answer depends on the conversation
+        cache_entry, cached = None, None
+        if ANSWER_CACHE_ENABLED and passages and len(history) == 1 and not summary:
+            try:
+                cache_entry, cached = await retrieval_pool.run(self._lookup_cached_answer, history[-1][1], instruction, passages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Answer cache lookup failed: {str(e)}")
+        answer, complete = await self.respond(websocket, session_id, question_id, prompt, stream, cached_answer=cached)
+        # Failed, stalled or truncated completions are never cached
+        if cache_entry is not None and cached is None and answer and complete:
+            embedding, context, doc_ids = cache_entry
+            answer_cache.put(embedding, context, doc_ids, history[-1][1], answer)
+        # Fold aged-out messages into the summary off the request path
+        session_summarizer.schedule(session_id)
+
+    @staticmethod
+    def _lookup_cached_answer(question: str, instruction: str, passages: List[Tuple[str, str, float]]):
+        """Returns ((embedding, context, doc_ids), cached answer or None); the key part is None without an embedding."""
+        embedding = try_query_embedding(question)
+        if embedding is None:
+            return None, None
+        doc_ids = frozenset(case_id for case_id, _, _ in passages)
+        context = answer_context(instruction, document_versions(list(doc_ids)))
+        return (embedding, context, doc_ids), answer_cache.get(embedding, context)
+
+    async def respond(self, websocket: WebSocket, session_id: str, question_id: str, prompt: str, stream: bool, cached_answer: Optional[str] = None) -> Tuple[str, bool]:
+        """Generates the bot's answer for a prompt, sends it and stores it in chat_history.
+
+        In streaming mode the answer is sent as JSON frames: one "start", a "delta" per
+        token and an "end" carrying the full answer, all tagged with session_id and
+        question_id. The answer is persisted once, after the last token. A cached answer
+        is sent the same way without calling the chat model. Returns the answer and
+        whether it was complete.
+        """
+        status = CompletionStatus()
+        if cached_answer is not None:
+            status.complete = True
+        if not stream:
+            answer = cached_answer if cached_answer is not None else await self.chat_manager.get_response(prompt, status)
+            logger.info(f"Sending answer: {answer}")
+            await websocket.send_text(answer)
+            await self.store_chat_message(session_id, 'bot', answer)
+            return answer, status.complete
+
+        frame = {"session_id": session_id, "question_id": question_id}
+        await websocket.send_text(json.dumps({"type": "start", **frame}))
+        if cached_answer is not None:
+            answer = cached_answer
+            await websocket.send_text(json.dumps({"type": "delta", "content": answer, **frame}))
+        else:
+            parts = []
+            async for delta in self.chat_manager.stream_response(prompt, status):
+                parts.append(delta)
+                await websocket.send_text(json.dumps({"type": "delta", "content": delta, **frame}))
+            answer = "".join(parts).strip()
+        await websocket.send_text(json.dumps({"type": "end", "answer": answer, **frame}))
+        logger.info(f"Streamed answer: {answer}" if status.complete else f"Streamed incomplete answer: {answer}")
+        await self.store_chat_message(session_id, 'bot', answer)
+        return answer, status.complete
 
     async def store_session(self, session_id: str):
-        """Stores a new chat session in the database."""
-        query = insert(sessions).values(
-            session_id=session_id,
-            is_archived=False  # Ensure that is_archived is set to False for new sessions
-        )
-        await database.execute(query)
+        """Queues a new chat session for the next batched write."""
+        await write_buffer.create_session(session_id)
 
     async def store_question(self, session_id: str, question_id: str, question_text: str):
-        """Stores a question in the database."""
-        query = "INSERT INTO questions (session_id, question_id, question_text) VALUES (:session_id, :question_id, :question_text)"
-        await database.execute(query, values={"session_id": session_id, "question_id": question_id, "question_text": question_text})
-
-    async def get_chat_history(self, session_id: str):
-        """Fetches the entire chat history for a given session ID."""
-        query = select(chat_history).where(chat_history.c.session_id == session_id).order_by(chat_history.c.timestamp)
-        results = await database.fetch_all(query)
-        return results
+        """Queues a question for the next batched write."""
+        await write_buffer.add_question(session_id, question_id, question_text)
+
+    async def get_chat_history(self, session_id: str, limit: Optional[int] = None, before_id: Optional[int] = None):
+        """Fetches a session's chat history in chronological order.
+
+        With a limit only the newest `limit` messages (older than `before_id`, if given) are returned.
+        """
+        await write_buffer.flush()
+        query = select(chat_history).where(chat_history.c.session_id == session_id)
+        if before_id is not None:
+            query = query.where(chat_history.c.id < before_id)
+        if limit is None:
+            return await database.fetch_all(query.order_by(chat_history.c.id))
+        results = await database.fetch_all(query.order_by(chat_history.c.id.desc()).limit(limit))
+        return results[::-1]
 
     async def store_chat_message(self, session_id: str, sender: str, message: str):
-        """Stores a chat message in the chat_history table."""
-        query = chat_history.insert().values(
-            session_id=session_id,
-            sender=sender,
-            message=message,
-            timestamp=datetime.now()
-        )
-        await database.execute(query)
+        """Queues a chat message for the next batched write to the chat_history table."""
+        await write_buffer.add_message(session_id, sender, message)
 
     async def get_recent_chat_history(self, session_id: str, limit: int = 5):
         """Retrieves the most recent chat messages for a session."""
-        query = select(chat_history).where(chat_history.c.session_id == session_id).order_by(chat_history.c.timestamp.desc()).limit(limit)
+        await write_buffer.flush()
+        query = select(chat_history).where(chat_history.c.session_id == session_id).order_by(chat_history.c.id.desc()).limit(limit)
         results = await database.fetch_all(query)
         # Reverse to maintain chronological order
         return results[::-1]
@@ -330,16 +530,16 @@ class Application:
         # Instantiate FastAPI app
         self.app = FastAPI()
 
-        # Elastic APM integration
-        apm_config = {
-            'SERVICE_NAME': 'projects_trace',
-            'SERVER_URL': 'http://apm-server:8200',  # Ensure this matches your APM server URL (use apm-server in Docker)
-            'ENVIRONMENT': 'production',
-            'DEBUG': True,  # Set this to True to help with any issues while debugging
-            'TRANSACTION_SAMPLE_RATE': 1.0  # Capture all transactions
-        }
-        self.apm_client = make_apm_client(apm_config)
-        self.app.add_middleware(ElasticAPM, client=self.apm_client)
+        # Elastic APM integration; the middleware builds its client when the server starts, not at import
+        if APM_ENABLED:
+            apm_config = {
+                'SERVICE_NAME': 'projects_trace',
+                'SERVER_URL': APM_SERVER_URL,  # Ensure this matches your APM server URL (use apm-server in Docker)
+                'ENVIRONMENT': 'production',
+                'DEBUG': True,  # Set this to True to help with any issues while debugging
+                'TRANSACTION_SAMPLE_RATE': 1.0  # Capture all transactions
+            }
+            self.app.add_middleware(ElasticAPM, config=apm_config)
 
         # Initialize components
         self.file_manager = FileManager(upload_folder="./uploads")
@@ -348,17 +548,34 @@ class Application:
 
         self.folder_path = r"./uploads"
 
+        # Ingestion changes which files of a group are queryable
+        add_index_listener(group_cache.invalidate_ingested)
+        # and makes answers grounded on the old text stale
+        add_index_listener(answer_cache.invalidate_document)
+
         # Initialize a ThreadPoolExecutor for running synchronous tasks
         self.executor = ThreadPoolExecutor(max_workers=5)
 
+        # Other server workers hear of index and group changes made here, and the reverse
+        add_index_listener(lambda doc_id: coordinator.publish_threadsafe("document", doc_id), local_only=True)
+        coordinator.subscribe("document", lambda doc_id: asyncio.get_event_loop().run_in_executor(self.executor, refresh_document, doc_id))
+        coordinator.subscribe("group", group_cache.invalidate_group)
+        coordinator.subscribe("ingest_job", lambda job_id: ingestion_queue.resume())
+        coordinator.subscribe("sync_folder", self._sync_folder_requested)
+        coordinator.subscribe("summary", session_summarizer.forget)
+        coordinator.subscribe("missed", self._events_missed)
+        # Only the leader ingests
+        coordinator.on_leadership(self._lead, self._stop_leading)
+
         # Set up middleware and routes
         self._setup_middleware()
         self._setup_routes()
-        
-        @self.app.on_event("startup")
-        async def startup_event():
-            logger.info("Server startup: processing folder.")
-            asyncio.create_task(self.process_folder_async())
+
+        # Seconds spent in each startup phase, reported once startup is done and in /rag-stats
+        self.startup_phases: Dict[str, float] = {}
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._folder_sync_task: Optional[asyncio.Task] = None
+        self.startup_phases["import"] = round(time.monotonic() - _IMPORT_STARTED, 3)
 
     def _setup_middleware(self):
         """Sets up CORS middleware."""
@@ -368,6 +585,7 @@ class Application:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=[NEXT_CURSOR_HEADER],
         )
 
     def _setup_routes(self):
@@ -376,7 +594,14 @@ class Application:
         self.app.mount("/static", StaticFiles(directory="static"), name="static")
         
         @self.app.get("/get-group-files/{group_id}")
-        async def get_group_files(group_id: int):
+        async def get_group_files(response: Response, group_id: int, limit: Optional[int] = None, cursor: Optional[str] = None):
+            """Returns a page of the group's files and of all files, both in name order.
+
+            Each list continues after its own position in the cursor; a list that is already
+            exhausted comes back empty on later pages.
+            """
+            size = page_size(limit)
+            position = decode_cursor(cursor, 2) or ["", ""]
             try:
                 # Get the group name
                 group_query = file_groups.select().where(file_groups.c.id == group_id)
@@ -384,21 +609,43 @@ class Application:
                 if not group:
                     raise HTTPException(status_code=404, detail="Group not found")
                 
-                # Get the files in the group
-                files_query = group_files.select().where(group_files.c.group_id == group_id)
-                group_files_result = await database.fetch_all(files_query)
-                group_file_names = [row['file_name'] for row in group_files_result]
+                # Get the next page of files in the group
+                group_file_names = []
+                if position[0] is not None:
+                    files_query = (
+                        select(group_files.c.file_name)
+                        .where(group_files.c.group_id == group_id, group_files.c.file_name > position[0])
+                        .order_by(group_files.c.file_name).limit(size + 1)
+                    )
+                    group_file_names = [row['file_name'] for row in await database.fetch_all(files_query)]
                 
-                # Get all files in the database
-                all_files_query = meta_table.select()
-                all_files_result = await database.fetch_all(all_files_query)
-                all_file_names = [row['file_name'] for row in all_files_result]
+                # Get the next page of all files in the database
+                all_file_names = []
+                if position[1] is not None:
+                    all_files_query = (
+                        select(meta_table.c.file_name).distinct()
+                        .where(meta_table.c.file_name > position[1])
+                        .order_by(meta_table.c.file_name).limit(size + 1)
+                    )
+                    all_file_names = [row['file_name'] for row in await database.fetch_all(all_files_query)]
+
+                more_group = len(group_file_names) > size
+                more_all = len(all_file_names) > size
+                group_file_names = group_file_names[:size]
+                all_file_names = all_file_names[:size]
+                if more_group or more_all:
+                    set_next_cursor(response, [
+                        group_file_names[-1] if more_group else None,
+                        all_file_names[-1] if more_all else None,
+                    ])
                 
                 return {
                     "group_name": group['group_name'],
                     "group_files": group_file_names,
                     "all_files": all_file_names
                 }
+            except HTTPException:
+                raise
             except Exception as e:
                 logging.error(f"Error getting group files: {str(e)}")
                 raise HTTPException(status_code=500, detail="An error occurred while fetching group files")
@@ -410,18 +657,10 @@ class Application:
             files: List[str] = Form(...)
         ):
             try:
-                # Update group name
-                update_group_query = file_groups.update().where(file_groups.c.id == group_id).values(group_name=group_name)
-                await database.execute(update_group_query)
-                
-                # Delete existing file associations
-                delete_files_query = group_files.delete().where(group_files.c.group_id == group_id)
-                await database.execute(delete_files_query)
-                
-                # Add new file associations
-                for file in files:
-                    insert_file_query = group_files.insert().values(group_id=group_id, file_name=file)
-                    await database.execute(insert_file_query)
+                # Rename the group and apply only the membership changes, in one transaction
+                await group_store.update_group(group_id, group_name, files)
+                group_cache.invalidate_group(group_id)
+                await coordinator.publish("group", group_id)
                 
                 return JSONResponse(content={"success": True, "message": "Group updated successfully"})
             except Exception as e:
@@ -452,13 +691,10 @@ class Application:
                 raise HTTPException(status_code=400, detail="Group ID is required.")
             
             try:
-                # First, delete associated files from group_files table
-                delete_files_query = group_files.delete().where(group_files.c.group_id == group_id)
-                await database.execute(delete_files_query)
-                
-                # Then, delete the group from file_groups table
-                delete_group_query = file_groups.delete().where(file_groups.c.id == group_id)
-                await database.execute(delete_group_query)
+                # Delete the file associations and the group together
+                await group_store.delete_group(group_id)
+                group_cache.invalidate_group(group_id)
+                await coordinator.publish("group", group_id)
                 
                 return {"success": True, "message": "Group deleted successfully."}
             except Exception as e:
@@ -466,8 +702,15 @@ class Application:
                 raise HTTPException(status_code=500, detail="An error occurred while deleting the group.")
         
         @self.app.get("/get-existing-files")
-        async def get_existing_files():
-            return await self.file_manager.get_existing_files()
+        async def get_existing_files(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None):
+            """Returns a page of the uploaded file names in name order."""
+            size = page_size(limit)
+            position = decode_cursor(cursor, 1)
+            names = await self.file_manager.get_existing_files()
+            start = bisect.bisect_right(names, position[0]) if position else 0
+            page = names[start:start + size]
+            set_next_cursor(response, [page[-1]] if start + size < len(names) else None)
+            return page
 
         @self.app.get("/get-file-groups")
         async def get_file_groups():
@@ -485,22 +728,17 @@ class Application:
                 raise HTTPException(status_code=400, detail="Group name and at least one file must be provided.")
 
             try:
-                existing_files = await self.file_manager.get_existing_files()
+                existing_files = set(await self.file_manager.get_existing_files())
                 if not all(file in existing_files for file in files):
                     raise HTTPException(status_code=400, detail="One or more selected files do not exist in the database.")
-                # Insert the new group into the database
-                query = file_groups.insert().values(group_name=group_name)
-                result = await database.execute(query)
-                group_id = result
+                # Insert the new group and its files in one transaction
+                group_id = await group_store.create_group(group_name, files)
 
                 # Check if group_id was created successfully
                 if not group_id:
                     raise HTTPException(status_code=500, detail="Failed to create file group.")
-
-                # Associate files with the group
-                for file in files:
-                    query = group_files.insert().values(group_id=group_id, file_name=file)
-                    await database.execute(query)
+                group_cache.invalidate_group(group_id)
+                await coordinator.publish("group", group_id)
 
                 return {"success": True, "message": "File group created successfully."}
             
@@ -515,10 +753,17 @@ class Application:
         async def upload_files(files: List[UploadFile] = File(...)):
             result = await self.file_manager.save_files(files)
             if result["success"]:
-                return create_json_response(True, "Files uploaded and processed successfully", {"files": result["details"]})
+                return create_json_response(True, "Files uploaded and queued for processing", {"files": result["details"], "jobs": result["jobs"]})
             else:
                 return create_json_response(False, "Error occurred during upload or processing", {"error": result["error"]})
         
+        @self.app.get("/ingest-status")
+        async def ingest_status(job_ids: Optional[List[str]] = Query(None)):
+            """Reports the state of the given ingestion jobs, or counts per state if none are given."""
+            if job_ids:
+                return {"jobs": await ingestion_queue.get_jobs(job_ids)}
+            return await ingestion_queue.summary()
+
         # Serve the main HTML page
         @self.app.get("/", response_class=HTMLResponse)
         async def get_index():
@@ -534,6 +779,10 @@ class Application:
         # Add an endpoint to process the folder on demand
         @self.app.post("/process-folder/")
         async def process_folder():
+            if not coordinator.is_leader:
+                # Only the leader ingests; hand the sync to it instead of racing it
+                await coordinator.publish("sync_folder")
+                return JSONResponse(status_code=202, content={"message": "Folder sync forwarded to the ingestion leader."})
             await self.process_folder_async()
             return {"message": "Files processed successfully."}
         
@@ -544,13 +793,21 @@ class Application:
 
         # Define /get-chat-history endpoint once
         @self.app.get("/get-chat-history")
-        async def get_chat_history(session_id: str):
-            history = await self.websocket_manager.get_chat_history(session_id)
+        async def get_chat_history(response: Response, session_id: str, limit: Optional[int] = None, cursor: Optional[str] = None):
+            """Returns the newest page of a session's messages, oldest first; the cursor leads to older messages."""
+            size = page_size(limit)
+            position = decode_cursor(cursor, 1)
+            history = await self.websocket_manager.get_chat_history(session_id, limit=size + 1, before_id=position[0] if position else None)
+            if len(history) > size:
+                history = history[1:]
+                set_next_cursor(response, [history[0]['id']])
             return [{"sender": row.sender, "message": row.message, "timestamp": row.timestamp} for row in history]
         
         @self.app.post("/archive-session/")
         async def archive_session(session_id: str = Form(...)):
             """Archives a chat session."""
+            # Sessions may still be waiting in the write buffer
+            await write_buffer.flush()
             query = sessions.update().where(sessions.c.session_id == session_id).values(is_archived=True)
             result = await database.execute(query)
             if result:
@@ -563,6 +820,7 @@ class Application:
         @self.app.post("/unarchive-session/")
         async def unarchive_session(session_id: str = Form(...)):
             """Unarchives a chat session."""
+            await write_buffer.flush()
             query = sessions.update().where(sessions.c.session_id == session_id).values(is_archived=False)
             result = await database.execute(query)
             if result:
@@ -572,23 +830,39 @@ class Application:
                 logger.error(f"Failed to unarchive session {session_id}.")
                 return create_json_response(False, "Failed to unarchive session.")
 
-        @self.app.get("/get-active-sessions/")
-        async def get_active_sessions():
-            """Fetches all active (non-archived) chat sessions."""
-            query = sessions.select().where(sessions.c.is_archived == False).order_by(sessions.c.created_at.desc())
+        async def session_page(response: Response, archived: bool, limit: Optional[int], cursor: Optional[str]):
+            """Returns a page of sessions with the given archive state, newest first."""
+            size = page_size(limit)
+            position = decode_cursor(cursor, 2)
+            await write_buffer.flush()
+            query = sessions.select().where(sessions.c.is_archived == archived)
+            if position:
+                try:
+                    after = (datetime.fromisoformat(position[0]), int(position[1]))
+                except (TypeError, ValueError):
+                    raise HTTPException(status_code=400, detail="Invalid cursor.")
+                query = query.where(tuple_(sessions.c.created_at, sessions.c.id) < after)
+            query = query.order_by(sessions.c.created_at.desc(), sessions.c.id.desc()).limit(size + 1)
             results = await database.fetch_all(query)
+            if len(results) > size:
+                results = results[:size]
+                set_next_cursor(response, [results[-1]['created_at'].isoformat(), results[-1]['id']])
             return [{"session_id": row['session_id'], "created_at": row['created_at']} for row in results]
 
+        @self.app.get("/get-active-sessions/")
+        async def get_active_sessions(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None):
+            """Fetches a page of active (non-archived) chat sessions."""
+            return await session_page(response, False, limit, cursor)
+
         @self.app.get("/get-archived-sessions/")
-        async def get_archived_sessions():
-            """Fetches all archived chat sessions."""
-            query = sessions.select().where(sessions.c.is_archived == True).order_by(sessions.c.created_at.desc())
-            results = await database.fetch_all(query)
-            return [{"session_id": row['session_id'], "created_at": row['created_at']} for row in results]
+        async def get_archived_sessions(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None):
+            """Fetches a page of archived chat sessions."""
+            return await session_page(response, True, limit, cursor)
         
         @self.app.post("/rename-session/")
         async def rename_session(session_id: str = Form(...), new_name: str = Form(...)):
             """Renames a chat session."""
+            await write_buffer.flush()
             try:
                 query = sessions.update().where(sessions.c.session_id == session_id).values(session_name=new_name)
                 result = await database.execute(query)
@@ -602,32 +876,140 @@ class Application:
                 logger.error(f"Error renaming session {session_id}: {str(e)}")
                 return create_json_response(False, "Failed to rename session.", {"error": str(e)})
 
+        @self.app.get("/rag-stats")
+        async def rag_stats():
+            """Reports throughput statistics for the retrieval pipeline."""
+            return {
+                "embeddings": get_embedding_stats(),
+                "embedding_cache": get_embedding_cache_stats(),
+                "pools": get_pool_stats(),
+                "vector_index": get_vector_index_stats(),
+                "group_cache": group_cache.stats(),
+                "query_caches": get_query_cache_stats(),
+                "ingest_pipeline": get_ingest_pipeline_stats(),
+                "text_store": get_text_store_stats(),
+                "lexical_index": get_lexical_index_stats(),
+                "prompts": prompt_builder.stats(),
+                "summaries": session_summarizer.stats(),
+                "answer_cache": answer_cache.stats(),
+                "chat_writes": write_buffer.stats(),
+                "database": database.pool_stats(),
+                "startup": self.startup_phases,
+                "coordination": coordinator.stats(),
+            }
+
         # The /query endpoint is no longer needed for this process
         # All processing happens when a prompt is sent via WebSocket
 
+    async def _events_missed(self, key):
+        """Drops all state other workers may have changed while their events could not be received."""
+        group_cache.invalidate_group()
+        session_summarizer.forget()
+        await asyncio.get_event_loop().run_in_executor(self.executor, refresh_document, None)
+        await ingestion_queue.resume()
+
+    def _sync_folder_requested(self, key):
+        """Runs a folder sync another worker was asked for, if this worker is the leader."""
+        if coordinator.is_leader:
+            asyncio.create_task(self.process_folder_async())
+
     async def process_folder_async(self):
         """Process folder asynchronously without blocking the server."""
         try:
             logger.info(f"Starting to process folder: {self.folder_path}")
-            for filename in os.listdir(self.folder_path):
-                file_path = os.path.join(self.folder_path, filename)
-                if os.path.isfile(file_path):
-                    # Run the synchronous process_file in a separate thread
-                    loop = asyncio.get_event_loop()
-                    await loop.run_in_executor(self.executor, process_file, file_path)
-            logger.info("Finished processing all files in folder.")
+            # Run the synchronous sync in a separate thread; only new or changed
+            # files are embedded and vectors of deleted files are removed
+            loop = asyncio.get_event_loop()
+            summary = await loop.run_in_executor(self.executor, sync_folder, self.folder_path)
+            logger.info(f"Finished processing all files in folder: {summary}")
         except Exception as e:
             logger.error(f"Error processing folder: {str(e)}")
 
+    @contextmanager
+    def _startup_phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.startup_phases[name] = round(time.monotonic() - started, 3)
+
     async def startup(self):
-        """Connect to the database on app startup."""
-        await database.connect()
+        """Connect to the database on app startup.
+
+        Only what requests need is done before the server accepts connections; ChromaDB is
+        opened and, by the ingestion leader, the upload folder synced in the background afterwards.
+        """
+        started = time.monotonic()
+        if openai.api_key:
+            logger.info("OpenAI API key loaded.")
+        else:
+            logger.error("OpenAI API key not found in environment variables.")
+        self.file_manager.ensure_upload_folder()
+        with self._startup_phase("database"):
+            await database.connect()
         logger.info("Database connected")
+        if DB_AUTO_MIGRATE:
+            with self._startup_phase("migrations"):
+                loop = asyncio.get_event_loop()
+                applied = await loop.run_in_executor(self.executor, run_migrations, get_engine())
+            logger.info(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+        with self._startup_phase("workers"):
+            await write_buffer.start()
+            await ingestion_queue.start()
+        with self._startup_phase("coordination"):
+            await coordinator.start()
+        if not coordinator.is_leader and not CHROMA_SERVER_HOST:
+            logger.warning("Several workers are sharing a local ChromaDB store; set CHROMA_SERVER_HOST to share a server instead.")
+        self.startup_phases["startup"] = round(time.monotonic() - started, 3)
+        logger.info(f"Server startup finished: {self.startup_phases}")
+        self._warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        """Opens ChromaDB so the first query does not wait for it."""
+        try:
+            with self._startup_phase("chroma"):
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(self.executor, get_collection)
+        except Exception as e:
+            logger.error(f"Error opening ChromaDB: {str(e)}")
+
+    async def _lead(self):
+        """Takes on the ingestion leader's work: running ingestion jobs and syncing the upload folder."""
+        await ingestion_queue.start_workers()
+        self._folder_sync_task = asyncio.create_task(self._sync_folder())
+
+    async def _stop_leading(self):
+        if self._folder_sync_task is not None:
+            self._folder_sync_task.cancel()
+        await ingestion_queue.stop_workers()
+
+    async def _sync_folder(self):
+        """Syncs the upload folder as STARTUP_SYNC says."""
+        if STARTUP_SYNC == "off":
+            logger.info("Startup folder sync disabled.")
+            return
+        if STARTUP_SYNC == "deferred":
+            logger.info(f"Startup folder sync deferred by {STARTUP_SYNC_DELAY_SECONDS}s.")
+            await asyncio.sleep(STARTUP_SYNC_DELAY_SECONDS)
+        logger.info("Server startup: processing folder.")
+        with self._startup_phase("folder_sync"):
+            await self.process_folder_async()
 
     async def shutdown(self):
         """Disconnect from the database on app shutdown."""
+        # A folder sync already running in its thread finishes on its own
+        tasks = [task for task in (self._warm_up_task, self._folder_sync_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await ingestion_queue.stop()
+        await coordinator.stop()
+        await session_summarizer.stop()
+        await write_buffer.stop()
         await database.disconnect()
         logger.info("Database disconnected")
+        shutdown_pools()
+        shutdown_process_pool()
 
 # Instantiate the application
 application = Application()
@@ -0,0 +1,106 @@
+# bench_ann.py
+#
+# Offline recall-vs-latency benchmark for approximate search. Builds a synthetic corpus
+# of clustered unit vectors, takes the exact NumPy scan as ground truth and reports
+# recall@k and query latency for IVF-flat at several nprobe values and, optionally,
+# for Chroma's HNSW index at several search_ef values.
+#
+#   python bench_ann.py --rows 200000 --dimensions 384 --queries 200
+#   python bench_ann.py --rows 50000 --chroma
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("ANN_MIN_ROWS", "0")
+os.environ.setdefault("ANN_EXACT_MAX_ROWS", "0")
+
+import numpy as np
+
+from vector_index import VectorIndex, normalize_rows
+
+
+def make_corpus(rows: int, dimensions: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Builds normalized vectors drawn around random cluster centres, like topical document chunks."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    noise = rng.standard_normal((rows, dimensions)).astype(np.float32) * 0.6
+    return normalize_rows(centres[labels] + noise)
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Builds queries near random corpus rows."""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, corpus.shape[0], count)]
+    return normalize_rows(picks + rng.standard_normal(picks.shape).astype(np.float32) * 0.3)
+
+
+def measure(search, queries: np.ndarray, truth, k: int) -> dict:
+    """Runs every query through `search` and returns recall@k and latency percentiles."""
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        ids = search(query)
+        latencies.append(time.perf_counter() - started)
+        found += len(set(ids) & expected)
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": round(found / (k * len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def bench_chroma(corpus: np.ndarray, queries: np.ndarray, truth, k: int, search_efs):
+    """Benchmarks an in-memory Chroma collection per search_ef value."""
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    ids = [f"row-{i}" for i in range(corpus.shape[0])]
+    for search_ef in search_efs:
+        name = f"bench_ef_{search_ef}"
+        collection = client.create_collection(name=name, metadata={"hnsw:space": "cosine", "hnsw:search_ef": search_ef})
+        for start in range(0, corpus.shape[0], 5000):
+            collection.add(ids=ids[start:start + 5000], embeddings=corpus[start:start + 5000].tolist())
+        result = measure(
+            lambda query: collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0],
+            queries, truth, k,
+        )
+        print(f"{'hnsw ef=' + str(search_ef):>16} {result['recall']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8}")
+        client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark approximate search recall and latency offline.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists; 0 uses the index default")
+    parser.add_argument("--chroma", action="store_true", help="Also benchmark Chroma's HNSW index")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.rows, args.dimensions, args.clusters)
+    queries = make_queries(corpus, args.queries)
+    chunk_ids = [f"row-{i}" for i in range(args.rows)]
+
+    index = VectorIndex(initial_capacity=args.rows)
+    index._add(chunk_ids, [f"doc-{i // 100}" for i in range(args.rows)], corpus)
+    started = time.perf_counter()
+    index.train(nlist=args.nlist or None)
+    print(f"IVF training: {time.perf_counter() - started:.2f}s, {index.stats()['ann_lists']} lists")
+
+    truth = [{chunk for chunk, _, _ in index.search(query, args.k, exact=True)} for query in queries]
+
+    print(f"{'method':>16} {'recall':>8} {'p50_ms':>8} {'p95_ms':>8}")
+    result = measure(lambda query: [c for c, _, _ in index.search(query, args.k, exact=True)], queries, truth, args.k)
+    print(f"{'exact':>16} {result['recall']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8}")
+    for nprobe in (1, 2, 4, 8, 16, 32, 64):
+        result = measure(lambda query: [c for c, _, _ in index.search(query, args.k, nprobe=nprobe)], queries, truth, args.k)
+        print(f"{'ivf nprobe=' + str(nprobe):>16} {result['recall']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8}")
+
+    if args.chroma:
+        bench_chroma(corpus, queries, truth, args.k, (10, 50, 100, 200))
@@ -0,0 +1,55 @@
+# bench_embeddings.py
+#
+# Offline benchmark for the embedding batcher. Uses the fake embedding backend with a
+# simulated per-call latency so packing and concurrency settings can be compared
+# without calling OpenAI.
+#
+#   python bench_embeddings.py --texts 5000 --latency 0.2
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("EMBEDDING_BACKEND", "fake")
+
+from rag import EmbeddingBatcher, fake_embedding_fn
+
+
+def make_texts(count: int, words_per_text: int):
+    """Builds synthetic chunk-sized texts."""
+    vocabulary = ["court", "appeal", "contract", "breach", "section", "damages", "plaintiff", "defendant", "judgment", "clause"]
+    return [
+        " ".join(vocabulary[(i * 7 + j) % len(vocabulary)] for j in range(words_per_text))
+        for i in range(count)
+    ]
+
+
+def run(texts, latency: float, max_batch_tokens: int, max_in_flight: int) -> dict:
+    """Embeds the texts once with the given settings and returns the batcher stats."""
+    def slow_fake(batch):
+        time.sleep(latency)
+        return fake_embedding_fn(batch)
+
+    batcher = EmbeddingBatcher(slow_fake, max_batch_tokens=max_batch_tokens, max_in_flight=max_in_flight)
+    started = time.perf_counter()
+    batcher.embed(texts)
+    elapsed = time.perf_counter() - started
+    stats = batcher.stats()
+    stats["wall_seconds"] = round(elapsed, 3)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the embedding batcher offline.")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per embedding call")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.words)
+    print(f"{'batch_tokens':>12} {'in_flight':>9} {'calls':>6} {'wall_s':>8} {'texts/s':>10}")
+    for max_batch_tokens in (1000, 8000, 50000):
+        for max_in_flight in (1, 4, 8):
+            stats = run(texts, args.latency, max_batch_tokens, max_in_flight)
+            print(f"{max_batch_tokens:>12} {max_in_flight:>9} {stats['calls']:>6} {stats['wall_seconds']:>8} "
+                  f"{round(args.texts / stats['wall_seconds'], 1):>10}")
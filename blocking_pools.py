@@ -0,0 +1,137 @@
+# blocking_pools.py
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from logging_config import get_logger
+
+logger = get_logger('blocking_pools')
+
+
+class BlockingPool:
+    """A bounded thread pool dedicated to one blocking dependency, awaited with a per-call timeout.
+
+    Keeping each dependency in its own pool means a slow Chroma or embedding call can
+    only exhaust its own workers, never the event loop or another dependency's pool.
+    """
+    def __init__(self, name: str, max_workers: int, timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "in_flight": 0, "completed": 0, "failed": 0, "timeouts": 0, "cancelled": 0}
+
+    def _tracked(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            self._stats["in_flight"] += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs fn in the pool and awaits it, raising asyncio.TimeoutError after the timeout.
+
+        A timed-out or cancelled call stops being awaited immediately; the worker thread
+        finishes the call in the background because Python threads cannot be interrupted.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["submitted"] += 1
+        future = loop.run_in_executor(self._executor, functools.partial(self._tracked, fn, *args, **kwargs))
+        try:
+            result = await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            logger.error(f"Call to {getattr(fn, '__name__', fn)} in pool '{self.name}' timed out.")
+            raise
+        except asyncio.CancelledError:
+            with self._lock:
+                self._stats["cancelled"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+
+    async def run_to_completion(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs fn in the pool like run, but a call past the timeout is logged and still awaited.
+
+        For work that must not be started again while a previous call is still running,
+        e.g. ingesting the same document twice at once.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["submitted"] += 1
+        future = loop.run_in_executor(self._executor, functools.partial(self._tracked, fn, *args, **kwargs))
+        try:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                logger.error(f"Call to {getattr(fn, '__name__', fn)} in pool '{self.name}' is past its timeout; waiting for it to finish.")
+                result = await future
+        except asyncio.CancelledError:
+            with self._lock:
+                self._stats["cancelled"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_workers"] = self.max_workers
+        stats["timeout_seconds"] = self.timeout
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Vector store lookups (presence checks)
+chroma_pool = BlockingPool(
+    "chroma",
+    int(os.getenv("CHROMA_POOL_SIZE", "8")),
+    float(os.getenv("CHROMA_TIMEOUT_SECONDS", "10")),
+)
+
+# Retrieval: query embedding plus vector search
+retrieval_pool = BlockingPool(
+    "retrieval",
+    int(os.getenv("RETRIEVAL_POOL_SIZE", "8")),
+    float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "30")),
+)
+
+# Document extraction and embedding; kept separate so ingestion cannot starve chat
+ingest_pool = BlockingPool(
+    "ingest",
+    int(os.getenv("INGEST_POOL_SIZE", "2")),
+    float(os.getenv("INGEST_TIMEOUT_SECONDS", "600")),
+)
+
+
+def get_pool_stats() -> dict:
+    """Returns counters for every blocking pool."""
+    return {pool.name: pool.stats() for pool in (chroma_pool, retrieval_pool, ingest_pool)}
+
+
+def shutdown_pools():
+    for pool in (chroma_pool, retrieval_pool, ingest_pool):
+        pool.shutdown()
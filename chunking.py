@@ -0,0 +1,181 @@
+# chunking.py
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Chunk windows are measured either in characters or in approximate tokens
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "tokens")  # 'tokens' or 'chars'
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+
+# Rough average for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# A section is a (page_number, text) pair; page_number is None for formats without pages
+Section = Tuple[Optional[int], str]
+
+
+@dataclass
+class Chunk:
+    """A contiguous window of a document's text with its offsets."""
+    index: int
+    text: str
+    start_char: int
+    end_char: int
+    page: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Returns an approximate token count for the given text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _to_chars(size: int, unit: str) -> int:
+    """Converts a window size expressed in the given unit to characters."""
+    if unit == "tokens":
+        return size * CHARS_PER_TOKEN
+    if unit == "chars":
+        return size
+    raise ValueError(f"Unsupported chunk unit: {unit}")
+
+
+def _paragraph_spans(section_text: str) -> List[Tuple[int, int]]:
+    """Returns the (start, end) offsets of every non-blank paragraph of a section."""
+    spans = []
+    position = 0
+    for match in _PARAGRAPH_BREAK.finditer(section_text):
+        if section_text[position:match.start()].strip():
+            spans.append((position, match.start()))
+        position = match.end()
+    if section_text[position:].strip():
+        spans.append((position, len(section_text)))
+    return spans
+
+
+def _window_end(text: str, start: int, limit: int) -> int:
+    """Returns an end offset no later than `limit`, preferring a whitespace boundary in the second half of the window."""
+    if limit >= len(text):
+        return len(text)
+    midpoint = start + (limit - start) // 2
+    cut = max(text.rfind(" ", midpoint, limit), text.rfind("\n", midpoint, limit))
+    return cut if cut > start else limit
+
+
+def _overlap_start(text: str, end: int, overlap: int, floor: int) -> int:
+    """Returns where the next window starts so that it repeats roughly `overlap` characters."""
+    position = max(end - overlap, floor + 1)
+    if position >= end:
+        return end
+    match = re.search(r"\s", text[position:end])
+    if match:
+        return position + match.end()
+    return position
+
+
+def iter_chunks(
+    sections: Iterable[Section],
+    separator: str = "",
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    unit: Optional[str] = None,
+) -> Iterator[Chunk]:
+    """Yields overlapping, paragraph-aligned chunks that never span a page boundary.
+
+    Sections are consumed lazily and only the text of the window being built is kept,
+    so memory stays bounded by the chunk size rather than the document size.
+    """
+    unit = unit or CHUNK_UNIT
+    size = _to_chars(chunk_size or CHUNK_SIZE, unit)
+    overlap = _to_chars(CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap, unit)
+    # Keep the overlap below half a window so every window makes progress
+    overlap = max(0, min(overlap, size // 2 - 1))
+
+    # `buffer` holds the document text from offset `base` onwards
+    buffer = ""
+    base = 0
+    length = 0
+    index = 0
+
+    def make_chunk(start: int, end: int, page: Optional[int]) -> Optional[Chunk]:
+        nonlocal index
+        segment = buffer[start - base:end - base]
+        stripped = segment.strip()
+        if not stripped:
+            return None
+        leading = len(segment) - len(segment.lstrip())
+        chunk = Chunk(
+            index=index,
+            text=stripped,
+            start_char=start + leading,
+            end_char=start + leading + len(stripped),
+            page=page,
+        )
+        index += 1
+        return chunk
+
+    def overlap_start(end: int, floor: int) -> int:
+        return _overlap_start(buffer, end - base, overlap, floor=floor - base) + base
+
+    current_start = None
+    current_end = None
+    current_page = None
+    for i, (page, section_text) in enumerate(sections):
+        if i > 0:
+            buffer += separator
+            length += len(separator)
+        section_offset = length
+        buffer += section_text
+        length += len(section_text)
+
+        for start, end in _paragraph_spans(section_text):
+            start += section_offset
+            end += section_offset
+            if current_start is not None and (page != current_page or end - current_start > size):
+                chunk = make_chunk(current_start, current_end, current_page)
+                if chunk:
+                    yield chunk
+                if page == current_page and overlap:
+                    current_start = overlap_start(current_end, floor=current_start)
+                else:
+                    current_start = None
+            if current_start is None:
+                current_start = start
+                current_page = page
+
+            # Paragraphs longer than a window are split on whitespace
+            while end - current_start > size:
+                cut = _window_end(buffer, current_start - base, current_start - base + size) + base
+                chunk = make_chunk(current_start, cut, current_page)
+                if chunk:
+                    yield chunk
+                current_start = overlap_start(cut, floor=current_start) if overlap else cut
+            current_end = end
+
+        # Text before the open window can no longer be part of any chunk
+        keep = length if current_start is None else current_start
+        buffer = buffer[keep - base:]
+        base = keep
+
+    if current_start is not None:
+        chunk = make_chunk(current_start, current_end, current_page)
+        if chunk:
+            yield chunk
+
+
+def chunk_sections(sections: Sequence[Section], separator: str = "", **kwargs) -> List[Chunk]:
+    """Splits a document into overlapping, paragraph-aligned chunks that never span a page boundary."""
+    return list(iter_chunks(sections, separator, **kwargs))
+
+
+def chunk_text(text: str, **kwargs) -> List[Chunk]:
+    """Splits plain text without page information into chunks."""
+    return chunk_sections([(None, text)], **kwargs)
+
+
+def chunk_id(doc_id: str, index: int) -> str:
+    """Builds the vector store ID for a chunk of a document."""
+    return f"{doc_id}::chunk-{index}"
@@ -0,0 +1,193 @@
+# coordination.py
+
+import asyncio
+import inspect
+import json
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import database
+from logging_config import get_logger
+
+logger = get_logger('coordination')
+
+# Cross-worker coordination configuration (Postgres only)
+COORDINATION_CHANNEL = os.getenv("COORDINATION_CHANNEL", "rag_events")
+LEADER_LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", "824731"))  # Advisory lock held by the ingestion leader
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "5"))  # How often followers try to take over
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Coordinator:
+    """Coordinates the uvicorn workers of a deployment through Postgres.
+
+    The worker holding a session-level advisory lock is the ingestion leader: only it
+    syncs the upload folder and runs ingestion jobs, so every document is embedded once.
+    If it dies its connection closes, the lock is released and a follower takes over
+    within LEADER_RETRY_SECONDS. Changes that leave other workers' in-process state
+    stale are broadcast with NOTIFY and handed, in order, to the handlers subscribed
+    to their kind. After the listener reconnects a local "missed" event is dispatched,
+    since events sent while it was down are not replayed. Without Postgres there is
+    one process, and it is always the leader.
+    """
+    def __init__(self):
+        self.worker_id = WORKER_ID
+        self.is_leader = False
+        self._handlers: Dict[str, List[Callable[[Any], Any]]] = {}
+        self._leadership: List[Tuple[Callable[[], Awaitable[None]], Optional[Callable[[], Awaitable[None]]]]] = []
+        self._listener = None
+        self._lock_connection = None
+        self._events: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"published": 0, "publish_errors": 0, "received": 0, "handler_errors": 0, "leader_elections": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return database.is_postgres
+
+    def subscribe(self, kind: str, handler: Callable[[Any], Any]):
+        """Registers a handler for events of this kind from other workers; it gets the event key and may return an awaitable."""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def on_leadership(self, acquired: Callable[[], Awaitable[None]], lost: Optional[Callable[[], Awaitable[None]]] = None):
+        """Registers coroutine functions run when this worker becomes the leader and when it stops being it."""
+        self._leadership.append((acquired, lost))
+
+    async def start(self):
+        """Starts listening for events and, when the lock is free, takes the lead."""
+        self._loop = asyncio.get_running_loop()
+        if not self.enabled:
+            logger.info("Coordination is off without Postgres; this process is the leader.")
+            await self._set_leader(True)
+            return
+        self._events = asyncio.Queue()
+        await self._listen()
+        self._lock_connection = await database.dedicated_connection()
+        await self._try_lead()
+        self._tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._campaign())]
+        logger.info(f"Worker {self.worker_id} started as {'leader' if self.is_leader else 'follower'}.")
+
+    async def stop(self):
+        """Stops listening and gives up the lead; closing the lock connection releases the lock."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for connection in (self._listener, self._lock_connection):
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        self._listener = self._lock_connection = None
+        self.is_leader = False
+
+    async def _listen(self):
+        self._listener = await database.dedicated_connection()
+        await self._listener.add_listener(COORDINATION_CHANNEL, self._on_notification)
+
+    async def _try_lead(self):
+        if await self._lock_connection.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK_KEY):
+            await self._set_leader(True)
+
+    async def _set_leader(self, leader: bool):
+        self.is_leader = leader
+        if leader:
+            self._stats["leader_elections"] += 1
+            logger.info(f"Worker {self.worker_id} is now the ingestion leader.")
+        else:
+            logger.error(f"Worker {self.worker_id} lost the ingestion lead.")
+        for acquired, lost in self._leadership:
+            callback = acquired if leader else lost
+            if callback is None:
+                continue
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Leadership callback {callback.__name__} failed: {str(e)}")
+
+    async def _campaign(self):
+        """Followers retry the lock; the leader checks that the connection holding it is alive."""
+        while True:
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+            try:
+                if self._listener.is_closed():
+                    logger.warning("Event listener connection closed; reconnecting.")
+                    await self._listen()
+                    # Whatever was published meanwhile is lost; handlers of "missed" drop all derived state
+                    self._events.put_nowait(("missed", None))
+                if self._lock_connection.is_closed():
+                    if self.is_leader:
+                        # The lock went with the connection; another worker may hold it by now
+                        await self._set_leader(False)
+                    self._lock_connection = await database.dedicated_connection()
+                if self.is_leader:
+                    await self._lock_connection.fetchval("SELECT 1")
+                else:
+                    await self._try_lead()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Coordination connection failed: {str(e)}")
+                if self.is_leader:
+                    # Make sure the lock is gone before handing over
+                    try:
+                        await self._lock_connection.close()
+                    except Exception:
+                        pass
+                    await self._set_leader(False)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.error(f"Ignoring malformed coordination event: {payload!r}")
+            return
+        if event.get("worker") == self.worker_id:
+            return
+        self._stats["received"] += 1
+        self._events.put_nowait((event.get("kind"), event.get("key")))
+
+    async def _dispatch(self):
+        # One event at a time, so changes to the same document apply in the order they were made
+        while True:
+            kind, key = await self._events.get()
+            for handler in self._handlers.get(kind, ()):
+                try:
+                    result = handler(key)
+                    if inspect.isawaitable(result):
+                        await result
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._stats["handler_errors"] += 1
+                    logger.error(f"Handler for '{kind}' event {key!r} failed: {str(e)}")
+
+    async def publish(self, kind: str, key: Any = None):
+        """Tells the other workers about a change; a no-op without Postgres."""
+        if not self.enabled or self._loop is None:
+            return
+        payload = json.dumps({"worker": self.worker_id, "kind": kind, "key": key})
+        try:
+            await database.execute("SELECT pg_notify(:channel, :payload)", {"channel": COORDINATION_CHANNEL, "payload": payload})
+            self._stats["published"] += 1
+        except Exception as e:
+            self._stats["publish_errors"] += 1
+            logger.error(f"Error publishing '{kind}' event {key!r}: {str(e)}")
+
+    def publish_threadsafe(self, kind: str, key: Any = None):
+        """Publishes from any thread, e.g. an ingestion worker, without waiting for delivery."""
+        if not self.enabled or self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self.publish(kind, key)))
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["worker"] = self.worker_id
+        stats["enabled"] = self.enabled
+        stats["leader"] = self.is_leader
+        stats["pending_events"] = self._events.qsize() if self._events else 0
+        return stats
+
+
+coordinator = Coordinator()
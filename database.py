@@ -1,13 +1,201 @@
 #database.py
 
+import asyncio
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.dialects.postgresql.psycopg2 import dialect as psycopg_dialect
 from databases import Database
 
-# Replace 'your_password' with the actual password for your 'postgres' user
-DATABASE_URL = "postgresql://postgres:7722@db:5432/doc_db"
+from logging_config import get_logger
+
+logger = get_logger('database')
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:7722@db:5432/doc_db")
+
+# Async connection pool configuration (Postgres)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("DB_ACQUIRE_TIMEOUT_SECONDS", "5"))  # Longest wait for a free connection
+DB_COMMAND_TIMEOUT_SECONDS = float(os.getenv("DB_COMMAND_TIMEOUT_SECONDS", "30"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))  # Prepared statements kept per connection
+DB_MAX_INACTIVE_CONNECTION_SECONDS = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_SECONDS", "300"))
+DB_SLOW_ACQUIRE_SECONDS = float(os.getenv("DB_SLOW_ACQUIRE_SECONDS", "0.5"))  # Waits longer than this are logged
+
+
+class _TimedConnection:
+    """Backend connection whose pool acquire is bounded by a timeout and measured."""
+    def __init__(self, inner, database: "PooledDatabase"):
+        self._inner = inner
+        self._database = database
+
+    async def acquire(self) -> None:
+        stats = self._database.pool_stats_counters
+        stats["waiting"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._inner.acquire(), self._database.acquire_timeout)
+        except asyncio.TimeoutError:
+            stats["acquire_timeouts"] += 1
+            logger.error(f"No database connection free after {self._database.acquire_timeout}s "
+                         f"({stats['in_use']} in use, {stats['waiting']} waiting).")
+            raise
+        finally:
+            stats["waiting"] -= 1
+        waited = time.monotonic() - started
+        stats["acquires"] += 1
+        stats["in_use"] += 1
+        stats["peak_in_use"] = max(stats["peak_in_use"], stats["in_use"])
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        if waited > DB_SLOW_ACQUIRE_SECONDS:
+            stats["slow_acquires"] += 1
+            logger.warning(f"Waited {waited:.2f}s for a database connection.")
+
+    async def release(self) -> None:
+        try:
+            await self._inner.release()
+        finally:
+            self._database.pool_stats_counters["in_use"] -= 1
+
+    def __getattr__(self, name: str):
+        return getattr(self._inner, name)
+
+
+class PooledDatabase(Database):
+    """`databases.Database` with pool settings from the environment and pool saturation metrics.
+
+    Every connection checkout is bounded by DB_ACQUIRE_TIMEOUT_SECONDS, so a saturated
+    pool fails fast instead of queueing requests indefinitely.
+    """
+    def __init__(self, url: str, acquire_timeout: float = DB_ACQUIRE_TIMEOUT_SECONDS, **options: Any):
+        if url.startswith("postgresql"):
+            options = {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                "command_timeout": DB_COMMAND_TIMEOUT_SECONDS,
+                "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                "max_inactive_connection_lifetime": DB_MAX_INACTIVE_CONNECTION_SECONDS,
+                **options,
+            }
+        super().__init__(url, **options)
+        self.acquire_timeout = acquire_timeout
+        self.pool_stats_counters: Dict[str, Any] = {
+            "acquires": 0, "acquire_timeouts": 0, "slow_acquires": 0, "waiting": 0,
+            "in_use": 0, "peak_in_use": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+        }
+        backend_connection = self._backend.connection
+        self._backend.connection = lambda: _TimedConnection(backend_connection(), self)
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.url.dialect == "postgresql"
+
+    async def dedicated_connection(self):
+        """Opens a raw asyncpg connection outside the pool, for sessions that must stay open (LISTEN, advisory locks)."""
+        # Imported here so other backends do not need asyncpg installed
+        import asyncpg
+
+        return await asyncpg.connect(
+            host=self.url.hostname,
+            port=self.url.port,
+            user=self.url.username,
+            password=self.url.password,
+            database=self.url.database,
+            command_timeout=DB_COMMAND_TIMEOUT_SECONDS,
+        )
+
+    def pool_stats(self) -> dict:
+        """Returns connection checkout counters and, on Postgres, the pool's size and idle connections."""
+        stats = dict(self.pool_stats_counters)
+        stats["avg_wait_ms"] = round(stats["wait_seconds"] / stats["acquires"] * 1000, 2) if stats["acquires"] else 0.0
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        stats["acquire_timeout_seconds"] = self.acquire_timeout
+        pool = getattr(self._backend, "_pool", None)
+        if pool is not None and hasattr(pool, "get_size"):
+            stats["pool_size"] = pool.get_size()
+            stats["pool_idle"] = pool.get_idle_size()
+            stats["pool_max_size"] = pool.get_max_size()
+            stats["saturation"] = round(stats["in_use"] / pool.get_max_size(), 3)
+        return stats
+
+
+# Placeholders of the pyformat paramstyle the statements are compiled with
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s")
+
+# Rows per multi-row INSERT where statements are not prepared
+_FALLBACK_INSERT_ROWS = 1000
+
+
+class PreparedQuery:
+    """A hot statement compiled once and, on Postgres, run as a prepared statement.
+
+    The SQLAlchemy construct is compiled to SQL text a single time; asyncpg keeps a
+    prepared statement per connection for each distinct text, so repeated calls skip both
+    query compilation and server-side planning. Other backends run the construct through
+    `databases` as usual. Parameters are named with `bindparam` in queries; inserts are
+    given as a bare `table.insert()` plus the columns each row supplies.
+    """
+    def __init__(self, statement, db: PooledDatabase, columns: Optional[List[str]] = None):
+        self.statement = statement
+        self.db = db
+        compiled = statement.compile(
+            dialect=psycopg_dialect(paramstyle="pyformat"), column_keys=columns, compile_kwargs={"render_postcompile": True}
+        )
+        # Values fixed in the construct, e.g. a literal LIMIT, are bound from here
+        self.defaults = dict(compiled.params)
+        self.names = sorted(self.defaults)
+        positions = {name: f"${i}" for i, name in enumerate(self.names, start=1)}
+        # Only the named placeholders are rewritten; a literal % (LIKE 'x%', modulo) is left alone
+        self.sql = _PLACEHOLDER.sub(lambda match: positions[match.group(1)], compiled.string).replace("%%", "%")
+
+    def _args(self, values: Dict[str, Any]) -> List[Any]:
+        return [values[name] if name in values else self.defaults[name] for name in self.names]
+
+    async def fetch_all(self, **values: Any) -> list:
+        if not self.db.is_postgres:
+            return await self.db.fetch_all(self.statement.params(**values))
+        async with self.db.connection() as connection:
+            return await connection.raw_connection.fetch(self.sql, *self._args(values))
+
+    async def fetch_one(self, **values: Any) -> Optional[Any]:
+        if not self.db.is_postgres:
+            return await self.db.fetch_one(self.statement.params(**values))
+        async with self.db.connection() as connection:
+            return await connection.raw_connection.fetchrow(self.sql, *self._args(values))
+
+    async def execute_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Inserts the rows; asyncpg pipelines them over one prepared statement.
+
+        Other backends get multi-row INSERTs of at most _FALLBACK_INSERT_ROWS rows, which
+        keeps their bound parameters under the driver's limit after a backlog.
+        """
+        if not rows:
+            return
+        if not self.db.is_postgres:
+            for i in range(0, len(rows), _FALLBACK_INSERT_ROWS):
+                await self.db.execute(self.statement.values(rows[i:i + _FALLBACK_INSERT_ROWS]))
+            return
+        async with self.db.connection() as connection:
+            await connection.raw_connection.executemany(self.sql, [self._args(row) for row in rows])
+
+
+_engine = None
+
+
+def get_engine():
+    """Returns the synchronous engine used for schema changes, created on first use."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+    return _engine
+
 
-engine = create_engine(DATABASE_URL)
 metadata = MetaData()
 
 # Initialize the Database object for async DB operations
-database = Database(DATABASE_URL)
+database = PooledDatabase(DATABASE_URL)
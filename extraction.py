@@ -0,0 +1,129 @@
+# extraction.py
+#
+# Worker functions here run in child processes, so this module must stay free of
+# import-time side effects (no ChromaDB, OpenAI or database clients).
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import fitz  # For PDF processing
+from docx import Document  # For Word document processing
+
+from logging_config import get_logger
+
+logger = get_logger('extraction')
+
+# Extraction engine configuration
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", str(os.cpu_count() or 2)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+# Smaller PDFs are parsed in the calling thread; shipping them to a worker costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))
+# Page ranges parsed ahead of the consumer; bounds the extracted text held in memory
+PDF_RANGES_AHEAD = int(os.getenv("PDF_RANGES_AHEAD", str(max(2, EXTRACTION_PROCESSES * 2))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Returns the shared extraction process pool, created on first use; None when disabled."""
+    global _pool
+    if EXTRACTION_PROCESSES <= 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned workers do not inherit the parent's threads and client connections
+                _pool = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"Extraction process pool started with {EXTRACTION_PROCESSES} worker(s).")
+    return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def extract_pdf_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Returns (1-based page number, text) for pages [start, end) of a PDF."""
+    document = fitz.open(file_path)
+    try:
+        return [(number + 1, document[number].get_text()) for number in range(start, end)]
+    finally:
+        document.close()
+
+
+def extract_docx_paragraphs(file_path: str) -> List[str]:
+    """Returns the text of every paragraph of a Word (.docx) file."""
+    return [paragraph.text for paragraph in Document(file_path).paragraphs]
+
+
+def pdf_page_count(file_path: str) -> int:
+    document = fitz.open(file_path)
+    try:
+        return document.page_count
+    finally:
+        document.close()
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) for a PDF in page order without holding the whole document.
+
+    Large PDFs are split into ranges of PDF_PAGES_PER_TASK pages parsed in parallel by
+    the process pool; at most PDF_RANGES_AHEAD ranges are parsed ahead of the consumer.
+    Ranges finish in any order but are handed on in page order, because chunk offsets
+    run across the whole document; a slow range holds back the ones parsed after it.
+    """
+    page_count = pdf_page_count(file_path)
+    pool = get_process_pool()
+    if pool is None or page_count < PDF_PARALLEL_MIN_PAGES:
+        document = fitz.open(file_path)
+        try:
+            for page in document:
+                yield page.number + 1, page.get_text()
+        finally:
+            document.close()
+        return
+
+    starts = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    futures = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            futures.append(pool.submit(extract_pdf_range, file_path, start, min(start + PDF_PAGES_PER_TASK, page_count)))
+
+    try:
+        for _ in range(PDF_RANGES_AHEAD):
+            submit_next()
+        while futures:
+            pages = futures.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        # Stop queued ranges if the consumer gave up early
+        for future in futures:
+            future.cancel()
+
+
+def extract_pdf_pages(file_path: str) -> List[Tuple[int, str]]:
+    """Returns every page of a PDF in page order."""
+    return list(iter_pdf_pages(file_path))
+
+
+def extract_word_paragraphs(file_path: str) -> List[str]:
+    """Parses a Word (.docx) file in a worker process so several files can be parsed on different cores."""
+    pool = get_process_pool()
+    if pool is None:
+        return extract_docx_paragraphs(file_path)
+    return pool.submit(extract_docx_paragraphs, file_path).result()
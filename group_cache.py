@@ -0,0 +1,105 @@
+# group_cache.py
+
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from database import database
+from models import group_files
+from logging_config import get_logger
+
+logger = get_logger('group_cache')
+
+
+class GroupCache:
+    """Caches which files belong to each group and which of those are ingested.
+
+    File membership is invalidated by group edits; the ingested subset is invalidated
+    by ingestion events, so a group-scoped chat turn normally needs no database or
+    vector store round-trips to resolve its documents.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files: Dict[int, FrozenSet[str]] = {}
+        self._ingested: Dict[FrozenSet[int], FrozenSet[str]] = {}
+        self._files_generation = 0
+        self._ingested_generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def files_for(self, group_ids: Iterable[int]) -> List[str]:
+        """Returns the sorted file names of the given groups, querying only groups not yet cached."""
+        group_ids = {int(group_id) for group_id in group_ids}
+        with self._lock:
+            missing = [group_id for group_id in group_ids if group_id not in self._files]
+            generation = self._files_generation
+            self.hits += len(group_ids) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            query = group_files.select().where(group_files.c.group_id.in_(missing))
+            records = await database.fetch_all(query)
+            fetched: Dict[int, Set[str]] = {group_id: set() for group_id in missing}
+            for record in records:
+                fetched[record['group_id']].add(record['file_name'])
+            with self._lock:
+                # Skip the fill if a group edit landed while we were querying
+                if generation == self._files_generation:
+                    for group_id, names in fetched.items():
+                        self._files[group_id] = frozenset(names)
+            resolved = {group_id: frozenset(names) for group_id, names in fetched.items()}
+        else:
+            resolved = {}
+
+        with self._lock:
+            names = set()
+            for group_id in group_ids:
+                names |= resolved.get(group_id) or self._files.get(group_id, frozenset())
+        return sorted(names)
+
+    @property
+    def ingested_generation(self) -> int:
+        return self._ingested_generation
+
+    def ingested_for(self, group_ids: Iterable[int]) -> Optional[FrozenSet[str]]:
+        """Returns the cached set of ingested files for this group selection, if known."""
+        with self._lock:
+            return self._ingested.get(frozenset(int(group_id) for group_id in group_ids))
+
+    def store_ingested(self, group_ids: Iterable[int], present: Iterable[str], generation: int):
+        """Caches the ingested files for a group selection unless an invalidation happened since `generation`."""
+        with self._lock:
+            if generation == self._ingested_generation:
+                self._ingested[frozenset(int(group_id) for group_id in group_ids)] = frozenset(present)
+
+    def invalidate_group(self, group_id: Optional[int] = None):
+        """Drops cached membership after a group is created, edited or deleted (all groups if None)."""
+        with self._lock:
+            if group_id is None:
+                self._files.clear()
+            else:
+                self._files.pop(int(group_id), None)
+            self._files_generation += 1
+            # Selections that include the group may now resolve to different files
+            self._ingested.clear()
+            self._ingested_generation += 1
+        logger.info(f"Group cache invalidated for group {group_id if group_id is not None else 'all'}.")
+
+    def invalidate_ingested(self, doc_id: Optional[str] = None):
+        """Drops cached ingested sets after a document is added to or removed from the index."""
+        with self._lock:
+            self._ingested.clear()
+            self._ingested_generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "groups": len(self._files),
+                "selections": len(self._ingested),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+group_cache = GroupCache()
@@ -0,0 +1,68 @@
+# group_store.py
+
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import select
+
+from database import database
+from logging_config import get_logger
+from models import file_groups, group_files
+
+logger = get_logger('group_store')
+
+# Rows per statement; keeps bound parameters well under the driver's limit
+GROUP_WRITE_BATCH = 5000
+
+
+def _unique(files: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(file for file in files if file))
+
+
+async def _insert_files(group_id: int, files: List[str]):
+    for i in range(0, len(files), GROUP_WRITE_BATCH):
+        rows = [{"group_id": group_id, "file_name": file} for file in files[i:i + GROUP_WRITE_BATCH]]
+        await database.execute(group_files.insert().values(rows))
+
+
+async def create_group(group_name: str, files: Iterable[str]) -> int:
+    """Creates a group with its files in one transaction and returns the new group ID."""
+    files = _unique(files)
+    async with database.transaction():
+        group_id = await database.execute(file_groups.insert().values(group_name=group_name))
+        await _insert_files(group_id, files)
+    logger.info(f"Created group {group_id} with {len(files)} file(s).")
+    return group_id
+
+
+async def update_group(group_id: int, group_name: str, files: Iterable[str]) -> Tuple[int, int]:
+    """Renames a group and sets its files to exactly `files`; returns (added, removed) counts.
+
+    Only the difference from the current membership is written, as multi-row inserts and
+    deletes inside a transaction, so concurrent readers never see the group empty.
+    """
+    wanted = _unique(files)
+    async with database.transaction():
+        # Locks the group row so concurrent updates of the same group apply one after the other
+        await database.execute(
+            file_groups.update().where(file_groups.c.id == group_id).values(group_name=group_name)
+        )
+        current = {
+            row['file_name'] for row in
+            await database.fetch_all(select(group_files.c.file_name).where(group_files.c.group_id == group_id))
+        }
+        added = [file for file in wanted if file not in current]
+        removed = list(current.difference(wanted))
+        for i in range(0, len(removed), GROUP_WRITE_BATCH):
+            await database.execute(group_files.delete().where(
+                group_files.c.group_id == group_id, group_files.c.file_name.in_(removed[i:i + GROUP_WRITE_BATCH])
+            ))
+        await _insert_files(group_id, added)
+    logger.info(f"Updated group {group_id}: {len(added)} file(s) added, {len(removed)} removed.")
+    return len(added), len(removed)
+
+
+async def delete_group(group_id: int):
+    """Deletes a group and its file associations in one transaction."""
+    async with database.transaction():
+        await database.execute(group_files.delete().where(group_files.c.group_id == group_id))
+        await database.execute(file_groups.delete().where(file_groups.c.id == group_id))
@@ -0,0 +1,150 @@
+# ingest_manifest.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from logging_config import get_logger
+
+logger = get_logger('ingest_manifest')
+
+# How often reads check whether another process (the ingestion leader) rewrote the file
+MANIFEST_RELOAD_SECONDS = float(os.getenv("MANIFEST_RELOAD_SECONDS", "1"))
+
+
+@dataclass
+class ManifestEntry:
+    """What was indexed for one file, used to detect changes between restarts."""
+    file_name: str
+    size: int
+    mtime: float
+    content_hash: str
+    chunk_count: int
+    embedding_model: str
+    indexed_at: float
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """JSON manifest of indexed files stored next to the vector store.
+
+    With several workers only the ingestion leader writes it; the others re-read the
+    file on access once it changes, checking at most every MANIFEST_RELOAD_SECONDS.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._mtime_ns = None
+        self._checked_at = time.monotonic()
+        # Records not yet saved; a reload would lose them
+        self._unsaved = False
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            self._mtime_ns = os.stat(self.path).st_mtime_ns
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = {name: ManifestEntry(**entry) for name, entry in json.load(f).items()}
+            logger.info(f"Loaded ingest manifest with {len(self._entries)} entries from {self.path}")
+        except Exception as e:
+            # A corrupt manifest only costs a re-check of every file
+            logger.error(f"Error loading ingest manifest {self.path}, starting empty: {str(e)}")
+
+    def _refresh(self):
+        """Re-reads the file if another process rewrote it; callers hold the lock."""
+        now = time.monotonic()
+        if self._unsaved or now - self._checked_at < MANIFEST_RELOAD_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns != self._mtime_ns:
+            self._load()
+
+    def get(self, file_name: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            self._refresh()
+            return self._entries.get(file_name)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return list(self._entries)
+
+    def record(self, file_path: str, content_hash: str, chunk_count: int, embedding_model: str, save: bool = True):
+        """Records a file as indexed with its current size and mtime; bulk callers pass save=False and call save()."""
+        stat = os.stat(file_path)
+        entry = ManifestEntry(
+            file_name=os.path.basename(file_path),
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            content_hash=content_hash,
+            chunk_count=chunk_count,
+            embedding_model=embedding_model,
+            indexed_at=time.time(),
+        )
+        with self._lock:
+            self._entries[entry.file_name] = entry
+            if save:
+                self._save()
+            else:
+                self._unsaved = True
+
+    def touch(self, file_path: str):
+        """Refreshes size and mtime for a file whose content hash is unchanged."""
+        file_name = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(file_name)
+            if entry:
+                entry.size = stat.st_size
+                entry.mtime = stat.st_mtime
+                self._save()
+
+    def remove(self, file_name: str):
+        with self._lock:
+            if self._entries.pop(file_name, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def is_unchanged(self, file_path: str, embedding_model: str) -> bool:
+        """Cheap check: same model, size and mtime as when the file was indexed."""
+        entry = self.get(os.path.basename(file_path))
+        if entry is None or entry.embedding_model != embedding_model:
+            return False
+        stat = os.stat(file_path)
+        return entry.size == stat.st_size and entry.mtime == stat.st_mtime
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        """Atomically writes the manifest; callers hold the lock."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: asdict(entry) for name, entry in self._entries.items()}, f)
+        os.replace(tmp_path, self.path)
+        self._mtime_ns = os.stat(self.path).st_mtime_ns
+        self._unsaved = False
@@ -0,0 +1,180 @@
+# ingest_pipeline.py
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+from chunking import Chunk, estimate_tokens
+from logging_config import get_logger
+
+logger = get_logger('ingest_pipeline')
+
+# Pipeline configuration
+INGEST_MAX_INFLIGHT_BYTES = int(os.getenv("INGEST_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))
+INGEST_PIPELINE_DEPTH = int(os.getenv("INGEST_PIPELINE_DEPTH", "4"))  # Embedding batches in flight per run
+# A Python list of floats costs roughly this much per dimension
+BYTES_PER_EMBEDDING_DIMENSION = 32
+
+
+@dataclass
+class DocumentEnd:
+    """Marks the end of a document's chunks in a pipeline stream."""
+    key: Hashable
+
+
+@dataclass
+class DocumentFailed:
+    """Marks a document whose chunks stopped early, e.g. because extraction failed."""
+    key: Hashable
+    error: Exception
+
+
+PipelineItem = Union[Tuple[Hashable, Chunk], DocumentEnd, DocumentFailed]
+
+
+@dataclass
+class _Batch:
+    items: List[Tuple[Hashable, Chunk]] = field(default_factory=list)
+    tokens: int = 0
+    bytes: int = 0
+    # Documents whose last chunk is in this batch or an earlier one
+    finished: List[Hashable] = field(default_factory=list)
+    future: Optional[Future] = None
+
+
+class IngestPipeline:
+    """Streams chunks through embedding and vector-store writes with bounded memory.
+
+    Chunks are pulled from the input only when there is room: at most `depth` embedding
+    batches are in flight and their text plus expected vectors stay under `max_bytes`.
+    When either limit is reached the oldest batch is written before reading further, so
+    extraction slows to the pace of embedding and memory does not grow with document size.
+    """
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        batch_tokens: int,
+        batch_size: int,
+        depth: int = INGEST_PIPELINE_DEPTH,
+        max_bytes: int = INGEST_MAX_INFLIGHT_BYTES,
+    ):
+        self.embed_fn = embed_fn
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="ingest-embed")
+        self._stats_lock = threading.Lock()
+        self._stats = {"runs": 0, "chunks": 0, "batches": 0, "failed_batches": 0, "stalls": 0, "peak_inflight_bytes": 0}
+
+    def run(
+        self,
+        items: Iterable[PipelineItem],
+        write_fn: Callable[[List[Tuple[Hashable, Chunk]], List[List[float]]], None],
+        done_fn: Callable[[Hashable, Optional[Exception]], None],
+        dimensions: int,
+    ) -> Dict[Hashable, Optional[Exception]]:
+        """Embeds and writes every chunk, calling done_fn once per document after all its chunks are written.
+
+        Returns the outcome of every document: its error, or None when it was stored.
+        """
+        bytes_per_chunk = dimensions * BYTES_PER_EMBEDDING_DIMENSION
+        # Keep single batches small enough that `depth` of them fit under the ceiling
+        batch_bytes_limit = max(1, self.max_bytes // self.depth)
+        errors: Dict[Hashable, Optional[Exception]] = {}
+        in_flight: "deque[_Batch]" = deque()
+        inflight_bytes = 0
+        current = _Batch()
+
+        def complete_oldest():
+            nonlocal inflight_bytes
+            batch = in_flight.popleft()
+            try:
+                embeddings = batch.future.result()
+                write_fn(batch.items, embeddings)
+            except Exception as e:
+                logger.error(f"Error embedding or writing a batch of {len(batch.items)} chunk(s): {str(e)}")
+                self._count("failed_batches")
+                for key, _ in batch.items:
+                    errors.setdefault(key, e)
+            inflight_bytes -= batch.bytes
+            for key in batch.finished:
+                finish(key)
+
+        def finish(key: Hashable):
+            error = errors.setdefault(key, None)
+            try:
+                done_fn(key, error)
+            except Exception as e:
+                logger.error(f"Error finalizing document {key}: {str(e)}")
+                errors[key] = e
+
+        def submit():
+            nonlocal current, inflight_bytes
+            # Backpressure: drain the oldest batches before taking on more memory
+            while in_flight and (len(in_flight) >= self.depth or inflight_bytes + current.bytes > self.max_bytes):
+                self._count("stalls")
+                complete_oldest()
+            texts = [chunk.text for _, chunk in current.items]
+            current.future = self._executor.submit(self.embed_fn, texts)
+            in_flight.append(current)
+            inflight_bytes += current.bytes
+            self._observe_bytes(inflight_bytes)
+            self._count("batches")
+            self._count("chunks", len(texts))
+            current = _Batch()
+
+        def end_document(key: Hashable):
+            if current.items:
+                current.finished.append(key)
+            elif in_flight:
+                in_flight[-1].finished.append(key)
+            else:
+                finish(key)
+
+        self._count("runs")
+        try:
+            for item in items:
+                if isinstance(item, DocumentFailed):
+                    errors[item.key] = item.error
+                    end_document(item.key)
+                    continue
+                if isinstance(item, DocumentEnd):
+                    end_document(item.key)
+                    continue
+                key, chunk = item
+                tokens = estimate_tokens(chunk.text)
+                size = len(chunk.text) * 2 + bytes_per_chunk
+                if current.items and (
+                    current.tokens + tokens > self.batch_tokens
+                    or len(current.items) >= self.batch_size
+                    or current.bytes + size > batch_bytes_limit
+                ):
+                    submit()
+                current.items.append((key, chunk))
+                current.tokens += tokens
+                current.bytes += size
+            if current.items:
+                submit()
+        finally:
+            while in_flight:
+                complete_oldest()
+        return errors
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _observe_bytes(self, inflight_bytes: int):
+        with self._stats_lock:
+            self._stats["peak_inflight_bytes"] = max(self._stats["peak_inflight_bytes"], inflight_bytes)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["max_inflight_bytes"] = self.max_bytes
+        stats["depth"] = self.depth
+        return stats
@@ -0,0 +1,177 @@
+# ingestion_queue.py
+
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import List, Optional, Set
+
+from sqlalchemy import func, select
+
+from blocking_pools import ingest_pool
+from coordination import coordinator
+from database import database
+from logging_config import get_logger
+from models import ingest_jobs
+from rag import process_file
+
+logger = get_logger('ingestion_queue')
+
+# Ingestion job configuration
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "5"))
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+class IngestionQueue:
+    """Runs document ingestion in background workers with job records kept in Postgres.
+
+    Jobs survive restarts: anything still queued or running when the server stopped is
+    picked up again on start. Failed attempts are retried with exponential backoff.
+    With several server workers only the ingestion leader runs jobs; the others record
+    them and tell the leader, which picks them up from the database.
+    """
+    def __init__(self, workers: int = INGEST_WORKERS, max_attempts: int = INGEST_MAX_ATTEMPTS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Jobs queued or running in this process
+        self._claimed: Set[str] = set()
+
+    async def start(self):
+        """Prepares the queue; workers run only while this process leads (see start_workers)."""
+        self._queue = asyncio.Queue()
+
+    async def stop(self):
+        """Cancels the workers; unfinished jobs stay queued in the database."""
+        await self.stop_workers()
+        logger.info("Ingestion queue stopped.")
+
+    async def start_workers(self):
+        """Starts the workers and re-enqueues unfinished jobs, e.g. from a previous run or a former leader."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        resumed = await self.resume()
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished ingestion job(s).")
+        logger.info(f"Ingestion queue started with {self.workers} worker(s).")
+
+    async def stop_workers(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._claimed.clear()
+        if self._queue is not None:
+            self._queue = asyncio.Queue()
+
+    async def resume(self) -> int:
+        """Queues every unfinished job in the database not already queued here; returns how many were added."""
+        if not self._tasks:
+            return 0
+        query = select(ingest_jobs).where(ingest_jobs.c.status.in_(["queued", "running"])).order_by(ingest_jobs.c.id)
+        added = 0
+        for job in await database.fetch_all(query):
+            if job['job_id'] not in self._claimed:
+                self._claim(job['job_id'], job['file_path'], job['attempts'])
+                added += 1
+        return added
+
+    def _claim(self, job_id: str, file_path: str, attempts: int):
+        self._claimed.add(job_id)
+        self._queue.put_nowait((job_id, file_path, attempts))
+
+    async def enqueue(self, file_name: str, file_path: str) -> str:
+        """Records a new job and hands it to the workers; returns the job ID."""
+        job_id = str(uuid.uuid4())
+        query = ingest_jobs.insert().values(
+            job_id=job_id,
+            file_name=file_name,
+            file_path=file_path,
+            status="queued",
+            attempts=0,
+            updated_at=datetime.now()
+        )
+        await database.execute(query)
+        if self._tasks:
+            self._claim(job_id, file_path, 0)
+        else:
+            # The leader's workers run it
+            await coordinator.publish("ingest_job", job_id)
+        logger.info(f"Queued ingestion job {job_id} for {file_name}.")
+        return job_id
+
+    async def _set_status(self, job_id: str, status: str, attempts: int, error: Optional[str] = None):
+        query = ingest_jobs.update().where(ingest_jobs.c.job_id == job_id).values(
+            status=status, attempts=attempts, error=error, updated_at=datetime.now()
+        )
+        await database.execute(query)
+
+    async def _worker(self, number: int):
+        while True:
+            job_id, file_path, attempts = await self._queue.get()
+            try:
+                await self._run(job_id, file_path, attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion worker {number} failed on job {job_id}: {str(e)}")
+            finally:
+                self._claimed.discard(job_id)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, file_path: str, attempts: int):
+        while attempts < self.max_attempts:
+            attempts += 1
+            await self._set_status(job_id, "running", attempts)
+            try:
+                # A retry must not ingest the file while a timed-out attempt still does
+                await ingest_pool.run_to_completion(process_file, file_path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if attempts >= self.max_attempts:
+                    await self._set_status(job_id, "failed", attempts, error)
+                    logger.error(f"Ingestion job {job_id} failed after {attempts} attempt(s): {error}")
+                    return
+                delay = INGEST_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                await self._set_status(job_id, "queued", attempts, error)
+                logger.warning(f"Ingestion job {job_id} attempt {attempts} failed, retrying in {delay:.0f}s: {error}")
+                await asyncio.sleep(delay)
+                continue
+            await self._set_status(job_id, "done", attempts)
+            logger.info(f"Ingestion job {job_id} done.")
+            return
+        await self._set_status(job_id, "failed", attempts, "Maximum attempts reached")
+
+    async def get_jobs(self, job_ids: List[str]) -> List[dict]:
+        """Returns the records of the given jobs."""
+        query = select(ingest_jobs).where(ingest_jobs.c.job_id.in_(job_ids))
+        return [
+            {
+                "job_id": row['job_id'],
+                "file_name": row['file_name'],
+                "status": row['status'],
+                "attempts": row['attempts'],
+                "error": row['error'],
+                "created_at": row['created_at'],
+                "updated_at": row['updated_at'],
+            }
+            for row in await database.fetch_all(query)
+        ]
+
+    async def summary(self) -> dict:
+        """Returns job counts per state and the in-memory queue depth."""
+        query = select(ingest_jobs.c.status, func.count()).group_by(ingest_jobs.c.status)
+        counts = {state: 0 for state in JOB_STATES}
+        for row in await database.fetch_all(query):
+            counts[row[0]] = row[1]
+        return {"jobs": counts, "queue_depth": self._queue.qsize() if self._queue else 0, "workers": len(self._tasks)}
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,214 @@
+# lexical_index.py
+
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from logging_config import get_logger
+
+logger = get_logger('lexical_index')
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words, numbers and dotted/slashed compounds such as "s.12", "2019/123" or "a-21"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+_PARTS = re.compile(r"[./\-]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text into terms, keeping citation-like compounds whole and also indexing their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in _PARTS.split(token) if part)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Merges ranked ID lists by summing 1 / (k + rank); returns (id, score) pairs, best first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class LexicalIndex:
+    """In-process BM25 inverted index over chunk text.
+
+    Postings are kept per term as two compact arrays (uint32 chunk slots and uint16 term
+    frequencies). Chunks can be added and removed at any time: removal only marks the
+    slot dead, and postings are compacted once dead slots exceed a quarter of the live ones.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.loaded = False
+
+    def _reset(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_len = array("I")
+        self._alive = bytearray()
+        self._slot_doc_code = array("I")
+        self._chunk_ids: List[Optional[str]] = []
+        self._slot_docs: List[Optional[str]] = []
+        self._slot_of: Dict[str, int] = {}
+        self._doc_slots: Dict[str, Set[int]] = {}
+        self._doc_codes: Dict[str, int] = {}
+        self._live = 0
+        self._total_len = 0
+
+    def clear(self):
+        """Forgets every chunk; the index stays loaded."""
+        with self._lock:
+            self._reset()
+
+    def unload(self):
+        """Forgets every chunk; the index is built again from the text store on next use."""
+        with self._lock:
+            self._reset()
+            self.loaded = False
+
+    def __len__(self) -> int:
+        return self._live
+
+    def add(self, chunk_ids: Sequence[str], doc_ids: Sequence[str], texts: Sequence[str]) -> None:
+        """Indexes chunks, replacing any already indexed under the same chunk ID."""
+        tokenized = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            for chunk_id, doc_id, counts in zip(chunk_ids, doc_ids, tokenized):
+                if chunk_id in self._slot_of:
+                    self._kill(self._slot_of[chunk_id])
+                slot = len(self._chunk_ids)
+                length = sum(counts.values())
+                self._chunk_ids.append(chunk_id)
+                self._slot_docs.append(doc_id)
+                self._doc_len.append(length)
+                self._alive.append(1)
+                self._slot_doc_code.append(self._doc_codes.setdefault(doc_id, len(self._doc_codes)))
+                self._slot_of[chunk_id] = slot
+                self._doc_slots.setdefault(doc_id, set()).add(slot)
+                for term, count in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(slot)
+                    postings[1].append(min(count, 65535))
+                self._live += 1
+                self._total_len += length
+
+    def _kill(self, slot: int):
+        chunk_id = self._chunk_ids[slot]
+        doc_id = self._slot_docs[slot]
+        del self._slot_of[chunk_id]
+        self._doc_slots.get(doc_id, set()).discard(slot)
+        self._chunk_ids[slot] = None
+        self._slot_docs[slot] = None
+        self._alive[slot] = 0
+        self._live -= 1
+        self._total_len -= self._doc_len[slot]
+
+    def remove_document(self, doc_id: str) -> int:
+        """Removes every chunk of a document and returns how many were dropped."""
+        with self._lock:
+            slots = self._doc_slots.pop(doc_id, set())
+            for slot in slots:
+                self._kill(slot)
+            if len(self._chunk_ids) - self._live > max(self._live // 4, 1024):
+                self._compact()
+            return len(slots)
+
+    def _compact(self):
+        """Drops dead slots from every posting list and renumbers the live ones."""
+        remap = np.full(len(self._chunk_ids), -1, dtype=np.int64)
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        remap[alive] = np.arange(int(alive.sum()))
+        postings = {}
+        for term, (slots, counts) in self._postings.items():
+            old = np.frombuffer(slots, dtype=np.uint32).astype(np.int64)
+            keep = alive[old]
+            if keep.any():
+                postings[term] = (
+                    array("I", remap[old[keep]].astype(np.uint32).tobytes()),
+                    array("H", np.frombuffer(counts, dtype=np.uint16)[keep].tobytes()),
+                )
+        live_slots = np.flatnonzero(alive)
+        self._postings = postings
+        self._doc_len = array("I", np.frombuffer(self._doc_len, dtype=np.uint32)[live_slots].tobytes())
+        self._slot_doc_code = array("I", np.frombuffer(self._slot_doc_code, dtype=np.uint32)[live_slots].tobytes())
+        self._chunk_ids = [self._chunk_ids[slot] for slot in live_slots]
+        self._slot_docs = [self._slot_docs[slot] for slot in live_slots]
+        self._alive = bytearray(b"\x01" * len(live_slots))
+        self._slot_of = {chunk_id: slot for slot, chunk_id in enumerate(self._chunk_ids)}
+        self._doc_slots = {}
+        for slot, doc_id in enumerate(self._slot_docs):
+            self._doc_slots.setdefault(doc_id, set()).add(slot)
+        logger.info(f"Lexical index compacted to {len(live_slots)} chunk(s) and {len(postings)} term(s).")
+
+    def search(self, query: str, k: int, doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, str, float]]:
+        """Returns up to k (chunk_id, doc_id, BM25 score) tuples, best first, optionally restricted to doc_ids."""
+        terms = set(tokenize(query))
+        with self._lock:
+            if self._live == 0 or not terms:
+                return []
+            slots_total = len(self._chunk_ids)
+            lengths = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (self._total_len / self._live))
+            scores = np.zeros(slots_total, dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                slots = np.frombuffer(postings[0], dtype=np.uint32).astype(np.int64)
+                counts = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                # Dead slots still count towards document frequency until the next compaction;
+                # capped at the live count so the idf never turns negative and hides live matches
+                frequency = min(len(slots), self._live)
+                idf = math.log(1 + (self._live - frequency + 0.5) / (frequency + 0.5))
+                scores[slots] += idf * counts * (BM25_K1 + 1) / (counts + norm[slots])
+
+            keep = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool) & (scores > 0)
+            if doc_ids is not None:
+                lookup = np.zeros(len(self._doc_codes), dtype=bool)
+                lookup[[self._doc_codes[doc_id] for doc_id in set(doc_ids) if doc_id in self._doc_codes]] = True
+                keep &= lookup[np.frombuffer(self._slot_doc_code, dtype=np.uint32).astype(np.int64)]
+            candidates = np.flatnonzero(keep)
+            if candidates.size == 0:
+                return []
+            k = min(k, candidates.size)
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            return [(self._chunk_ids[slot], self._slot_docs[slot], float(scores[slot])) for slot in top]
+
+    def load(self, chunks: Iterable[Tuple[str, str, str]], page_size: int = 5000) -> None:
+        """Indexes every (chunk_id, doc_id, text) triple, e.g. streamed from the text store."""
+        page = []
+        for chunk in chunks:
+            page.append(chunk)
+            if len(page) >= page_size:
+                self.add(*zip(*page))
+                page = []
+        if page:
+            self.add(*zip(*page))
+        self.loaded = True
+        logger.info(f"Lexical index loaded with {self._live} chunk(s) and {len(self._postings)} term(s).")
+
+    def stats(self) -> dict:
+        with self._lock:
+            postings = sum(len(slots) for slots, _ in self._postings.values())
+            return {
+                "chunks": self._live,
+                "dead_slots": len(self._chunk_ids) - self._live,
+                "terms": len(self._postings),
+                "postings": postings,
+                "postings_bytes": postings * 6,
+                "loaded": self.loaded,
+            }
@@ -4,20 +4,24 @@ import logging
 from logging.handlers import RotatingFileHandler
 import os
 
+class _LazyRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that creates the logs directory and file on the first record, not at import."""
+    def _open(self):
+        # Ensure the logs directory exists
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
 def get_logger(service_name):
     logger = logging.getLogger(service_name)
     logger.setLevel(logging.INFO)
     logger.propagate = False  # Prevent log propagation to the root logger
 
-    # Ensure the logs directory exists
-    if not os.path.exists('logs'):
-        os.makedirs('logs')  # Create the logs directory if it doesn't exist
-
     # Log rotation setup
-    handler = RotatingFileHandler(
+    handler = _LazyRotatingFileHandler(
         f'logs/{service_name}.log',  # Log file path
         maxBytes=5 * 1024 * 1024,    # 5 MB per file
-        backupCount=5                # Keep up to 5 backup files
+        backupCount=5,               # Keep up to 5 backup files
+        delay=True                   # Open the file when the first record is written
     )
     
     # Updated formatter to match Grok pattern
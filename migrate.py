@@ -1,78 +1,111 @@
-# # # migrate.py
+# migrate.py
+#
+# Versioned schema migrations. Each migration runs once, in its own transaction, and is
+# recorded in schema_migrations; run `python migrate.py` after deploying a new version, or
+# start the app with DB_AUTO_MIGRATE=true.
 
-# # from sqlalchemy import create_engine, MetaData
-# # from database import DATABASE_URL
-# # from models import meta_table  # Ensure the `models.py` defines the `meta_table`
+from typing import Callable, List, Tuple
 
-# # # Create the engine and bind the metadata to it
-# # engine = create_engine(DATABASE_URL)
-# # metadata = MetaData()
+from sqlalchemy import Boolean, Column, String, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
 
-# # # Create the meta_table in the database
-# # metadata.create_all(engine)
+from database import get_engine
+from logging_config import get_logger
+from models import chat_history, group_files, meta_table, metadata, questions, schema_migrations, sessions
 
-# # if __name__ == "__main__":
-# #     print("Meta table created successfully.")
+logger = get_logger('migrate')
 
 
-# # migrate.py
+def _create_tables(connection: Connection):
+    """Creates every table that does not exist yet, with its indexes."""
+    metadata.create_all(connection)
 
-# from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
-# from database import DATABASE_URL
-# from models import meta_table, sessions  # Ensure to import sessions
 
-# # Create the engine and bind the metadata to it
-# engine = create_engine(DATABASE_URL)
-# metadata = MetaData()
+def _add_session_columns(connection: Connection):
+    """Adds the archive flag and display name to sessions tables created before they existed."""
+    existing = {column['name'] for column in inspect(connection).get_columns('sessions')}
+    columns = [
+        Column('is_archived', Boolean, nullable=False, server_default=text('false')),
+        Column('session_name', String(255), nullable=True, server_default='Chat'),
+    ]
+    for column in columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=connection.dialect)
+            default = column.server_default.arg
+            default = default.text if hasattr(default, 'text') else f"'{default}'"
+            not_null = "" if column.nullable else " NOT NULL"
+            connection.execute(text(f"ALTER TABLE sessions ADD COLUMN {column.name} {column_type} DEFAULT {default}{not_null}"))
+            logger.info(f"Added '{column.name}' column to 'sessions' table.")
 
-# metadata.bind = engine
-# metadata.reflect()
 
-# # Check if 'session_name' column exists, if not, add it
-# if not hasattr(sessions.c, 'session_name'):
-#     with engine.connect() as connection:
-#         alter_table_query = "ALTER TABLE sessions ADD COLUMN session_name VARCHAR(255);"
-#         connection.execute(alter_table_query)
-#         print("Added 'session_name' column to 'sessions' table.")
-# else:
-#     print("'session_name' column already exists in 'sessions' table.")
+def _unique_group_files(connection: Connection):
+    """Drops duplicate (group_id, file_name) rows, then enforces uniqueness."""
+    connection.execute(text(
+        "DELETE FROM group_files WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM group_files GROUP BY group_id, file_name) AS kept)"
+    ))
+    _create_indexes(connection, group_files.indexes)
 
 
-# migrate.py
+def _listing_indexes(connection: Connection):
+    """Adds the indexes behind history reads and the paginated session and file listings."""
+    _create_indexes(connection, chat_history.indexes | sessions.indexes | questions.indexes | meta_table.indexes)
 
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, DateTime, Boolean
-from database import DATABASE_URL
-from models import sessions  # Ensure sessions are imported
 
-# Create the engine and bind the metadata to it
-engine = create_engine(DATABASE_URL)
-metadata = MetaData()
+def _create_indexes(connection: Connection, indexes):
+    for index in sorted(indexes, key=lambda index: index.name):
+        index.create(connection, checkfirst=True)
+        logger.info(f"Ensured index {index.name}.")
 
-metadata.bind = engine
-metadata.reflect()
 
-# Function to check and add a column if it doesn't exist
-def add_column_if_not_exists(table, column):
-    if not hasattr(table.c, column.name):
-        with engine.connect() as connection:
-            alter_table_query = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type} DEFAULT {column.default.arg} NOT NULL;"
-            connection.execute(alter_table_query)
-            print(f"Added '{column.name}' column to '{table.name}' table.")
-    else:
-        print(f"'{column.name}' column already exists in '{table.name}' table.")
+# Postgres advisory lock serializing concurrent runs, e.g. several workers starting with DB_AUTO_MIGRATE
+MIGRATION_LOCK_KEY = 824730
 
-# Define the new columns
-is_archived_column = Column('is_archived', Boolean, default=False, nullable=False)
-session_name_column = Column('session_name', String(255), nullable=True, server_default='Chat')
+# (version, name, migration); append new migrations with the next version number
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create tables", _create_tables),
+    (2, "session archive and name columns", _add_session_columns),
+    (3, "unique group files", _unique_group_files),
+    (4, "listing indexes", _listing_indexes),
+]
 
-# Add 'is_archived' column
-add_column_if_not_exists(sessions, is_archived_column)
 
-# Add 'session_name' column (if not already handled)
-if not hasattr(sessions.c, 'session_name'):
+def applied_versions(engine: Engine) -> List[int]:
+    schema_migrations.create(engine, checkfirst=True)
     with engine.connect() as connection:
-        alter_table_query = "ALTER TABLE sessions ADD COLUMN session_name VARCHAR(255) DEFAULT 'Chat';"
-        connection.execute(alter_table_query)
-        print("Added 'session_name' column to 'sessions' table.")
-else:
-    print("'session_name' column already exists in 'sessions' table.")
+        return [row[0] for row in connection.execute(select(schema_migrations.c.version))]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Applies every migration not yet recorded, in version order; returns the versions applied."""
+    if engine.dialect.name != "postgresql":
+        return _run_pending(engine)
+    with engine.connect() as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            return _run_pending(engine)
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def _run_pending(engine: Engine) -> List[int]:
+    done = set(applied_versions(engine))
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                migration(connection)
+                connection.execute(schema_migrations.insert().values(version=version, name=name))
+        except Exception as e:
+            logger.error(f"Migration {version} ({name}) failed: {str(e)}")
+            raise
+        logger.info(f"Applied migration {version}: {name}.")
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    applied = run_migrations(get_engine())
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
@@ -1,6 +1,5 @@
 
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Text, DateTime, ForeignKey , Boolean
-from database import DATABASE_URL
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, DateTime, ForeignKey , Boolean, Index
 from sqlalchemy.sql import func
 
 # Existing table definitions...
@@ -14,7 +13,8 @@ meta_table = Table(
     Column('file_name', String(255), nullable=False),
     Column('file_size', Integer, nullable=False),
     Column('upload_timestamp', String(255), nullable=False),
-    Column('user', String(255), nullable=True)
+    Column('user', String(255), nullable=True),
+    Index('ix_file_meta_file_name', 'file_name')
 )
 
 sessions = Table(
@@ -24,7 +24,9 @@ sessions = Table(
     Column('session_id', String(255), unique=True, nullable=False),
     Column('session_name', String(255), nullable=True, server_default='Chat'),  # Ensure server_default is set
     Column('created_at', DateTime, server_default=func.now()),
-    Column('is_archived', Boolean, default=False, nullable=False)
+    Column('is_archived', Boolean, default=False, nullable=False),
+    # Session lists filter by archive state, newest first
+    Index('ix_sessions_is_archived_created_at', 'is_archived', 'created_at', 'id')
 )
 
 
@@ -35,7 +37,8 @@ questions = Table(
     Column('session_id', String(255), ForeignKey('sessions.session_id'), nullable=False),
     Column('question_id', String(255), unique=True, nullable=False),
     Column('question_text', Text, nullable=False),
-    Column('created_at', DateTime, server_default=func.now())
+    Column('created_at', DateTime, server_default=func.now()),
+    Index('ix_questions_session_id', 'session_id')
 )
 
 file_groups = Table(
@@ -52,7 +55,9 @@ group_files = Table(
     Column('id', Integer, primary_key=True),
     Column('group_id', Integer, ForeignKey('file_groups.id'), nullable=False),
     Column('file_name', String(255), nullable=False),
-    Column('added_at', DateTime, server_default=func.now())
+    Column('added_at', DateTime, server_default=func.now()),
+    # A file is in a group at most once; also serves lookups by group_id
+    Index('ux_group_files_group_id_file_name', 'group_id', 'file_name', unique=True)
 )
 
 # New chat_history table
@@ -63,13 +68,50 @@ chat_history = Table(
     Column('session_id', String(255), ForeignKey('sessions.session_id'), nullable=False),
     Column('sender', String(50), nullable=False),  # 'user' or 'bot'
     Column('message', Text, nullable=False),
-    Column('timestamp', DateTime, server_default=func.now())
+    Column('timestamp', DateTime, server_default=func.now()),
+    # History is read per session in insertion (id) order
+    Index('ix_chat_history_session_id_id', 'session_id', 'id')
+)
+
+# Applied versions of migrate.py's schema migrations
+schema_migrations = Table(
+    'schema_migrations',
+    metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(255), nullable=False),
+    Column('applied_at', DateTime, server_default=func.now())
+)
+
+# Background ingestion jobs created by /upload
+ingest_jobs = Table(
+    'ingest_jobs',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('job_id', String(255), unique=True, nullable=False),
+    Column('file_name', String(255), nullable=False),
+    Column('file_path', Text, nullable=False),
+    Column('status', String(20), nullable=False, server_default='queued'),  # queued, running, done, failed
+    Column('attempts', Integer, nullable=False, server_default='0'),
+    Column('error', Text, nullable=True),
+    Column('created_at', DateTime, server_default=func.now()),
+    Column('updated_at', DateTime, server_default=func.now())
 )
 
+# Rolling per-session summary of the chat_history messages that have aged out of the prompt window
+session_summaries = Table(
+    'session_summaries',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('session_id', String(255), ForeignKey('sessions.session_id'), unique=True, nullable=False),
+    Column('summary', Text, nullable=False, server_default=''),
+    Column('summarized_until', Integer, nullable=False, server_default='0'),  # chat_history.id of the last folded message
+    Column('summarized_messages', Integer, nullable=False, server_default='0'),
+    Column('updated_at', DateTime, server_default=func.now())
+)
 
-# Create engine and execute the table creation
-engine = create_engine(DATABASE_URL)
-metadata.create_all(engine)
 
+# Tables are created by migrate.py (or at startup with DB_AUTO_MIGRATE), never on import
 if __name__ == "__main__":
+    from database import get_engine
+    metadata.create_all(get_engine())
     print("file_meta and chat_history tables created successfully.")
@@ -0,0 +1,42 @@
+# pagination.py
+
+import base64
+import json
+import os
+from typing import Any, List, Optional
+
+from fastapi import HTTPException, Response
+
+# Keyset pagination: list endpoints return one page and put an opaque cursor for the
+# next one in this header; it is absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encodes the sort key of the last row returned as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str], length: int) -> Optional[list]:
+    """Returns the sort key a cursor encodes, None without a cursor; a malformed cursor is a 400."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(values, list) or len(values) != length:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
+
+
+def page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX))
+
+
+def set_next_cursor(response: Response, values: Optional[List[Any]]):
+    """Sets the next-page header when there are more rows after this page."""
+    if values is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
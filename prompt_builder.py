@@ -0,0 +1,205 @@
+# prompt_builder.py
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from chunking import CHARS_PER_TOKEN, estimate_tokens
+from logging_config import get_logger
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a character-based estimate
+    tiktoken = None
+
+logger = get_logger('prompt_builder')
+
+# Prompt budget configuration
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "4096"))  # Model context window
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))  # Share of the free budget kept for history
+PROMPT_MIN_PASSAGE_TOKENS = int(os.getenv("PROMPT_MIN_PASSAGE_TOKENS", "64"))  # Shorter truncated passages are dropped
+PROMPT_MAX_QUESTION_SHARE = 0.5
+# Per-request framing the chat API adds around a single message
+MESSAGE_OVERHEAD_TOKENS = 8
+
+TRUNCATION_MARK = " [...]"
+
+
+@dataclass
+class PromptBreakdown:
+    """Token accounting for one assembled prompt."""
+    budget: int
+    instructions: int = 0
+    question: int = 0
+    summary: int = 0
+    history: int = 0
+    passages: int = 0
+    total: int = 0
+    history_messages: int = 0
+    history_dropped: int = 0
+    passages_included: int = 0
+    passages_truncated: int = 0
+    passages_dropped: int = 0
+    question_truncated: bool = False
+    tokenizer: str = "estimate"
+
+
+class PromptBuilder:
+    """Assembles chat prompts from history, retrieved passages and instructions within a token budget.
+
+    The instructions and the current question are always kept. What is left is split
+    between recent history (newest first, up to PROMPT_HISTORY_SHARE unless passages
+    leave more room) and retrieved passages in rank order; a passage that does not fit
+    is cut to the remaining budget, and anything still over budget is dropped.
+    """
+    def __init__(self, context_tokens: int = PROMPT_CONTEXT_TOKENS, reply_tokens: int = 150, model: str = "gpt-3.5-turbo"):
+        self.context_tokens = context_tokens
+        self.reply_tokens = reply_tokens
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                logger.warning(f"No tiktoken encoding for {model}, estimating token counts: {str(e)}")
+        self._stats_lock = threading.Lock()
+        self._stats = {"turns": 0, "tokens": 0, "max_tokens": 0, "truncated_turns": 0, "passages_dropped": 0, "history_dropped": 0}
+
+    @property
+    def budget(self) -> int:
+        return self.context_tokens - self.reply_tokens - MESSAGE_OVERHEAD_TOKENS
+
+    def count(self, text: str) -> int:
+        """Returns the number of tokens in text."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cuts text to at most max_tokens tokens, marking the cut."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max(0, max_tokens - self.count(TRUNCATION_MARK))
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:limit]) + TRUNCATION_MARK
+        cut = text[:limit * CHARS_PER_TOKEN]
+        # Prefer ending on a word boundary
+        space = cut.rfind(" ", len(cut) // 2)
+        return (cut[:space] if space > 0 else cut) + TRUNCATION_MARK
+
+    def build(
+        self,
+        history: Sequence[Tuple[str, str]],
+        instruction: str,
+        passages: Optional[Sequence[Tuple[str, str, Optional[float]]]] = None,
+        summary: str = "",
+    ) -> Tuple[str, PromptBreakdown]:
+        """Builds the prompt for a turn.
+
+        `history` is the chronological (sender, message) list ending with the current
+        question; `passages` are (case ID, text, score) in rank order, or None when
+        there is nothing to cite. `summary` condenses the conversation before `history`
+        and shares the history budget, ahead of the raw messages.
+        """
+        breakdown = PromptBreakdown(budget=self.budget, tokenizer="tiktoken" if self._encoding else "estimate")
+        remaining = self.budget
+
+        instruction_block = f"\n\n{instruction}" if passages else f"\n{instruction}"
+        breakdown.instructions = self.count(instruction_block) + (self.count("\nRelevant Cases:\n") if passages else 0)
+        remaining -= breakdown.instructions
+
+        # The question is the newest history entry and is never dropped
+        older = list(history[:-1])
+        question_line = ""
+        if history:
+            sender, message = history[-1]
+            prefix = f"{sender.capitalize()}: "
+            limit = int(remaining * PROMPT_MAX_QUESTION_SHARE) - self.count(prefix)
+            kept = self.truncate(message, limit)
+            breakdown.question_truncated = kept != message
+            question_line = prefix + kept
+            breakdown.question = self.count(question_line) + 1
+            remaining -= breakdown.question
+
+        passage_blocks = [
+            (f"Case ID: {case_id}\nText: ", text, f"\nSimilarity: {score}" if score is not None else "")
+            for case_id, text, score in (passages or [])
+        ]
+        passages_needed = sum(self.count(head + text + tail) + 1 for head, text, tail in passage_blocks)
+        history_budget = max(int(remaining * PROMPT_HISTORY_SHARE), remaining - passages_needed)
+
+        summary_line = ""
+        if summary:
+            prefix = "Conversation so far: "
+            kept = self.truncate(summary, history_budget - self.count(prefix) - 1)
+            if kept:
+                summary_line = prefix + kept
+                breakdown.summary = self.count(summary_line) + 1
+                history_budget -= breakdown.summary
+
+        # Newest history first, so the oldest messages are the ones dropped
+        history_lines: List[str] = []
+        for position, (sender, message) in enumerate(reversed(older)):
+            line = f"{sender.capitalize()}: {message}"
+            cost = self.count(line) + 1
+            if cost > history_budget - breakdown.history:
+                breakdown.history_dropped = len(older) - position
+                break
+            history_lines.insert(0, line)
+            breakdown.history += cost
+            breakdown.history_messages += 1
+        remaining -= breakdown.history + breakdown.summary
+
+        included: List[str] = []
+        for head, text, tail in passage_blocks:
+            cost = self.count(head + text + tail) + 1
+            if cost <= remaining:
+                included.append(head + text + tail)
+                remaining -= cost
+                breakdown.passages += cost
+                continue
+            frame = self.count(head + tail) + 1
+            if remaining - frame >= PROMPT_MIN_PASSAGE_TOKENS:
+                cut = self.truncate(text, remaining - frame)
+                cost = self.count(head + cut + tail) + 1
+                included.append(head + cut + tail)
+                remaining -= cost
+                breakdown.passages += cost
+                breakdown.passages_truncated += 1
+            else:
+                breakdown.passages_dropped += 1
+        breakdown.passages_included = len(included)
+
+        context = "\n".join(([summary_line] if summary_line else []) + history_lines + ([question_line] if history else []))
+        if passages:
+            prompt = f"{context}\nRelevant Cases:\n" + "\n".join(included) + instruction_block
+        else:
+            prompt = context + instruction_block
+        breakdown.total = self.count(prompt)
+        self._record(breakdown)
+        return prompt, breakdown
+
+    def _record(self, breakdown: PromptBreakdown):
+        truncated = bool(breakdown.passages_truncated or breakdown.passages_dropped
+                         or breakdown.history_dropped or breakdown.question_truncated)
+        with self._stats_lock:
+            self._stats["turns"] += 1
+            self._stats["tokens"] += breakdown.total
+            self._stats["max_tokens"] = max(self._stats["max_tokens"], breakdown.total)
+            self._stats["truncated_turns"] += int(truncated)
+            self._stats["passages_dropped"] += breakdown.passages_dropped
+            self._stats["history_dropped"] += breakdown.history_dropped
+
+    def stats(self) -> dict:
+        """Returns the budget and cumulative prompt size figures."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        turns = stats.pop("turns")
+        tokens = stats.pop("tokens")
+        stats["turns"] = turns
+        stats["avg_prompt_tokens"] = round(tokens / turns, 1) if turns else 0.0
+        stats["budget"] = self.budget
+        stats["tokenizer"] = "tiktoken" if self._encoding else "estimate"
+        return stats
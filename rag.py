@@ -2,53 +2,385 @@
 
 from fastapi import HTTPException
 import openai
-import chromadb
-import fitz  # For PDF processing
-from docx import Document  # For Word document processing
 import os
+import re
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging_config import get_logger
 import numpy as np
-from typing import List, Tuple
-from chromadb.errors import InvalidCollectionException  # Correctly import the exception
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from chunking import Chunk, Section, iter_chunks, chunk_id, estimate_tokens
+from embedding_cache import EmbeddingCache, normalize_text
+from ingest_manifest import IngestManifest, hash_file
+from vector_index import GROUP_POSTFILTER_FRACTION, VectorIndex
+from query_cache import TTLCache
+from text_store import TextStore
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from extraction import extract_pdf_pages, extract_word_paragraphs, iter_pdf_pages
+from ingest_pipeline import DocumentEnd, DocumentFailed, IngestPipeline, PipelineItem
 
 logger = get_logger('rag')
 
-# Set OpenAI API key
+# Set OpenAI API key; the server reports whether it is missing at startup
 openai.api_key = os.getenv("OPENAI_API_KEY")
-if openai.api_key:
-    logger.info("OpenAI API key loaded.")
-else:
-    logger.error("OpenAI API key not found in environment variables.")
 
-# Initialize ChromaDB client
-client = chromadb.Client()
+# Persistent ChromaDB storage so vectors survive restarts
+CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+# A ChromaDB server shared by every worker; required when running more than one
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST", "")
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", "8000"))
 collection_name = "court_cases"
 
-# Check if collection exists, else create
-try:
-    collection = client.get_collection(name=collection_name)
-    logger.info(f"ChromaDB collection '{collection_name}' fetched successfully.")
-except InvalidCollectionException:
-    collection = client.create_collection(name=collection_name)
-    logger.info(f"ChromaDB collection '{collection_name}' created successfully.")
+# HNSW graph parameters, applied when the collection is created: higher M and
+# construction_ef build a better graph, higher search_ef raises recall at query time
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "50"))
+
+# Global search backend: 'chroma' (HNSW) or 'ivf' (the in-process IVF-flat index)
+ANN_BACKEND = os.getenv("ANN_BACKEND", "chroma")
+# Unfiltered hits fetched per wanted hit, scaled by how much of the collection a group covers
+GROUP_OVERFETCH = int(os.getenv("GROUP_OVERFETCH", "2"))
+
+# The ChromaDB client and collection are opened on first use, not at import
+_collection = None
+_collection_lock = threading.Lock()
+
+def get_collection():
+    """Returns the ChromaDB collection, opening the client and creating the collection on first use."""
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                _collection = _open_collection()
+    return _collection
+
+def _open_collection():
+    # Imported here: chromadb is the slowest import of the app
+    import chromadb
+
+    started = time.monotonic()
+    if CHROMA_SERVER_HOST:
+        client = chromadb.HttpClient(host=CHROMA_SERVER_HOST, port=CHROMA_SERVER_PORT)
+    else:
+        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
+    # Fetch the collection, or create it; atomic on a server shared with other workers
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        metadata={"hnsw:M": HNSW_M, "hnsw:construction_ef": HNSW_CONSTRUCTION_EF, "hnsw:search_ef": HNSW_SEARCH_EF}
+    )
+    location = f"server {CHROMA_SERVER_HOST}:{CHROMA_SERVER_PORT}" if CHROMA_SERVER_HOST else CHROMA_PERSIST_DIRECTORY
+    logger.info(f"ChromaDB collection '{collection_name}' opened from {location} in {time.monotonic() - started:.2f}s "
+                f"with metadata {collection.metadata}.")
+    return collection
+
+# Embedding configuration
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # 'openai' or 'fake' for offline runs
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "2048"))  # Provider limit on inputs per request
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", "1.0"))
+DEFAULT_EMBEDDING_DIMENSIONS = 1536  # text-embedding-ada-002
+FAKE_EMBEDDING_DIMENSIONS = int(os.getenv("FAKE_EMBEDDING_DIMENSIONS", str(DEFAULT_EMBEDDING_DIMENSIONS)))
+FAKE_EMBEDDING_LATENCY = float(os.getenv("FAKE_EMBEDDING_LATENCY", "0"))
+# Plain-text files are streamed in blocks of about this many characters
+TEXT_SECTION_CHARS = int(os.getenv("TEXT_SECTION_CHARS", str(64 * 1024)))
+
+# Errors worth retrying; anything else (bad input, auth) fails immediately
+RETRYABLE_EMBEDDING_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+
+def openai_embedding_fn(texts: List[str]) -> List[List[float]]:
+    """Embeds one batch of texts with a single OpenAI Embedding API call."""
+    response = openai.Embedding.create(
+        model=EMBEDDING_MODEL,
+        input=texts  # Ensure this is a list of strings
+    )
+    # The API may return items out of order; restore input order
+    data = sorted(response['data'], key=lambda item: item['index'])
+    return [item['embedding'] for item in data]
+
+def fake_embedding_fn(texts: List[str]) -> List[List[float]]:
+    """Deterministic offline embeddings (hashed bag of words) for tests and benchmarks."""
+    if FAKE_EMBEDDING_LATENCY:
+        time.sleep(FAKE_EMBEDDING_LATENCY)
+    embeddings = []
+    for text in texts:
+        vector = np.zeros(FAKE_EMBEDDING_DIMENSIONS, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % FAKE_EMBEDDING_DIMENSIONS
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        embeddings.append(vector.tolist())
+    return embeddings
+
+EMBEDDING_BACKENDS = {
+    "openai": openai_embedding_fn,
+    "fake": fake_embedding_fn,
+}
+
+class EmbeddingBatcher:
+    """Packs texts into token-bounded embedding requests and runs a bounded number of them concurrently."""
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_seconds: float = EMBEDDING_BACKOFF_SECONDS,
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # The semaphore bounds provider calls across all callers; the pool fans batches out
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embedding")
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "texts": 0, "tokens": 0, "retries": 0, "failures": 0, "call_seconds": 0.0}
+        self._started = time.monotonic()
+
+    def pack(self, texts: List[str]) -> List[List[int]]:
+        """Groups text indices into batches that respect the token and input-count limits."""
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Runs one provider call, retrying transient failures with exponential backoff and jitter."""
+        attempt = 0
+        while True:
+            with self._in_flight:
+                started = time.monotonic()
+                try:
+                    embeddings = self.embed_fn(texts)
+                except RETRYABLE_EMBEDDING_ERRORS as e:
+                    error = e
+                else:
+                    error = None
+                elapsed = time.monotonic() - started
+
+            with self._stats_lock:
+                self._stats["calls"] += 1
+                self._stats["call_seconds"] += elapsed
+                if error is None:
+                    self._stats["texts"] += len(texts)
+                    self._stats["tokens"] += sum(estimate_tokens(text) for text in texts)
+                elif attempt < self.max_retries:
+                    self._stats["retries"] += 1
+                else:
+                    self._stats["failures"] += 1
+
+            if error is None:
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}.")
+                return embeddings
+            if attempt >= self.max_retries:
+                raise error
+
+            delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"Embedding call failed ({type(error).__name__}), retrying in {delay:.1f}s "
+                           f"(attempt {attempt + 1}/{self.max_retries}).")
+            time.sleep(delay)
+            attempt += 1
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds any number of texts, preserving input order."""
+        batches = self.pack(texts)
+        if len(batches) == 1:
+            return self._embed_batch(texts)
+
+        futures = [self._executor.submit(self._embed_batch, [texts[i] for i in batch]) for batch in batches]
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, future in zip(batches, futures):
+            for i, embedding in zip(batch, future.result()):
+                embeddings[i] = embedding
+        return embeddings
+
+    def stats(self) -> dict:
+        """Returns cumulative call counts and throughput figures."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        uptime = time.monotonic() - self._started
+        stats["uptime_seconds"] = round(uptime, 3)
+        stats["call_seconds"] = round(stats["call_seconds"], 3)
+        stats["texts_per_second"] = round(stats["texts"] / uptime, 2) if uptime else 0.0
+        stats["tokens_per_second"] = round(stats["tokens"] / uptime, 2) if uptime else 0.0
+        stats["avg_call_seconds"] = round(stats["call_seconds"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
+
+embedding_batcher = EmbeddingBatcher(EMBEDDING_BACKENDS[EMBEDDING_BACKEND])
+
+# Cache entries are namespaced by model so fake and real vectors never mix
+embedding_model_name = EMBEDDING_MODEL if EMBEDDING_BACKEND == "openai" else f"{EMBEDDING_BACKEND}-{FAKE_EMBEDDING_DIMENSIONS}"
+
+# Persistent embedding cache consulted before any provider call
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+def _ensure_parent_directory(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+# Opened on first use, like the collection
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the embedding cache, opening its database on first use; None when the cache is disabled."""
+    global _embedding_cache
+    if EMBEDDING_CACHE_ENABLED and _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _ensure_parent_directory(EMBEDDING_CACHE_PATH)
+                _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    return _embedding_cache
+
+# In-process copy of the vectors for fast group-restricted search; kept in step with
+# ChromaDB on every insert and delete
+vector_index = VectorIndex()
+_vector_index_load_lock = threading.Lock()
+
+# Callbacks notified of ingestion events, e.g. to invalidate caches
+_index_listeners: List[Tuple[Callable[[str], None], bool]] = []
+
+# Hot-question caches: query embeddings by normalized text, and retrieval results by
+# (query, file set, index version)
+index_version = 0
+_index_version_lock = threading.Lock()
+query_embedding_cache = TTLCache(
+    int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000")),
+    float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400")),
+)
+retrieval_cache = TTLCache(
+    int(os.getenv("RETRIEVAL_CACHE_SIZE", "5000")),
+    float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600")),
+)
+
+# Manifest of indexed files so startup only re-ingests what changed
+manifest = IngestManifest(os.path.join(CHROMA_PERSIST_DIRECTORY, "ingest_manifest.json"))
+
+# Chunk text lives outside ChromaDB, compressed and keyed by chunk ID
+TEXT_STORE_PATH = os.getenv("TEXT_STORE_PATH", os.path.join(CHROMA_PERSIST_DIRECTORY, "chunk_text.db"))
+TEXT_STORE_COMPRESSION_LEVEL = int(os.getenv("TEXT_STORE_COMPRESSION_LEVEL", "6"))
+_text_store: Optional[TextStore] = None
+_text_store_lock = threading.Lock()
+
+def get_text_store() -> TextStore:
+    """Returns the chunk text store, opening its database on first use."""
+    global _text_store
+    if _text_store is None:
+        with _text_store_lock:
+            if _text_store is None:
+                _ensure_parent_directory(TEXT_STORE_PATH)
+                _text_store = TextStore(TEXT_STORE_PATH, TEXT_STORE_COMPRESSION_LEVEL)
+    return _text_store
+
+# BM25 index over chunk text for exact citations, section numbers and party names
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # 'hybrid', 'vector' or 'lexical'
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))  # Hits per retriever per wanted result
+RRF_K = int(os.getenv("RRF_K", "60"))
+QUERY_EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("QUERY_EMBEDDING_TIMEOUT_SECONDS", "5"))
+EMBEDDING_COOLDOWN_SECONDS = float(os.getenv("EMBEDDING_COOLDOWN_SECONDS", "30"))
+lexical_index = LexicalIndex()
+_lexical_index_load_lock = threading.Lock()
+_query_embedding_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embedding")
+_embedding_unavailable_until = 0.0
+_retrieval_stats = {"lexical_fallbacks": 0}
+_retrieval_stats_lock = threading.Lock()
+
+def set_embedding_function(embed_fn: Callable[[List[str]], List[List[float]]], model_name: Optional[str] = None):
+    """Replaces the function used for provider calls, e.g. with fake_embedding_fn for offline benchmarks."""
+    global embedding_model_name
+    embedding_batcher.embed_fn = embed_fn
+    if model_name:
+        embedding_model_name = model_name
+
+def get_embedding_stats() -> dict:
+    """Returns throughput statistics for the embedding pipeline."""
+    return embedding_batcher.stats()
+
+def get_vector_index_stats() -> dict:
+    """Returns size and version information for the in-process vector index."""
+    return vector_index.stats()
+
+def get_embedding_cache_stats() -> dict:
+    """Returns hit/miss counters for the persistent embedding cache."""
+    embedding_cache = get_embedding_cache()
+    return embedding_cache.stats() if embedding_cache else {"enabled": False}
 
 def get_openai_embeddings(texts: List[str]) -> List[List[float]]:
-    """Generates embeddings for a list of texts using OpenAI's Embedding API."""
+    """Generates embeddings for a list of texts, serving cached vectors and batching the rest into as few API calls as possible."""
     if not texts:
         raise ValueError("No texts provided for embedding.")
     try:
-        logger.info(f"Generating embeddings for {len(texts)} text(s)...")
-        response = openai.Embedding.create(
-            model="text-embedding-ada-002",
-            input=texts  # Ensure this is a list of strings
-        )
-        embeddings = [data['embedding'] for data in response['data']]
-        logger.info("Embeddings successfully generated.")
+        embedding_cache = get_embedding_cache()
+        if embedding_cache is None:
+            embeddings = [None] * len(texts)
+        else:
+            embeddings = embedding_cache.get_many(embedding_model_name, texts)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+        if missing:
+            logger.info(f"Generating embeddings for {len(missing)} of {len(texts)} text(s)...")
+            missing_texts = [texts[positions[0]] for positions in missing.values()]
+            new_embeddings = embedding_batcher.embed(missing_texts)
+            for positions, embedding in zip(missing.values(), new_embeddings):
+                for i in positions:
+                    embeddings[i] = embedding
+            if embedding_cache is not None:
+                embedding_cache.put_many(embedding_model_name, missing_texts, new_embeddings)
+            logger.info("Embeddings successfully generated.")
+        else:
+            logger.info(f"All {len(texts)} embedding(s) served from cache.")
         return embeddings
     except Exception as e:
         logger.error(f"Error generating embeddings: {str(e)}")
         raise
 
+ingest_pipeline = IngestPipeline(
+    get_openai_embeddings,
+    batch_tokens=embedding_batcher.max_batch_tokens,
+    batch_size=embedding_batcher.max_batch_size,
+)
+
+def get_ingest_pipeline_stats() -> dict:
+    """Returns batch, backpressure and peak memory figures for the ingestion pipeline."""
+    return ingest_pipeline.stats()
+
 def read_text_file(file_path: str) -> str:
     """Reads and returns text from a .txt file."""
     try:
@@ -59,180 +391,587 @@ def read_text_file(file_path: str) -> str:
         logger.error(f"Error reading text file: {file_path}, Error: {str(e)}")
         raise
 
-def read_pdf_file(file_path: str) -> str:
-    """Reads and returns text from a PDF file."""
+def read_pdf_pages(file_path: str) -> List[Tuple[int, str]]:
+    """Reads a PDF file and returns the text of each page with its 1-based page number."""
     try:
         logger.info(f"Reading PDF file: {file_path}")
-        document = fitz.open(file_path)
-        text = ""
-        for page in document:
-            text += page.get_text()
-        document.close()
+        # Large PDFs are split into page ranges parsed on several cores
+        pages = extract_pdf_pages(file_path)
         logger.info(f"Successfully read PDF file: {file_path}")
-        return text
+        return pages
     except Exception as e:
         logger.error(f"Error reading PDF file: {file_path}, Error: {str(e)}")
         raise
 
-def read_word_file(file_path: str) -> str:
-    """Reads and returns text from a Word (.docx) file."""
+def read_pdf_file(file_path: str) -> str:
+    """Reads and returns text from a PDF file."""
+    return "".join(text for _, text in read_pdf_pages(file_path))
+
+def read_word_paragraphs(file_path: str) -> List[str]:
+    """Reads a Word (.docx) file and returns the text of each paragraph."""
     try:
         logger.info(f"Reading Word file: {file_path}")
-        doc = Document(file_path)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        paragraphs = extract_word_paragraphs(file_path)
         logger.info(f"Successfully read Word file: {file_path}")
-        return text
+        return paragraphs
     except Exception as e:
         logger.error(f"Error reading Word file: {file_path}, Error: {str(e)}")
         raise
 
-def process_file(file_path: str):
-    """Processes a file based on its type and adds it to ChromaDB."""
-    try:
-        logger.info(f"Processing file: {file_path}")
-        file_extension = file_path.split('.')[-1].lower()
-
-        if file_extension == 'txt':
-            text = read_text_file(file_path)
-        elif file_extension == 'pdf':
-            text = read_pdf_file(file_path)
-        elif file_extension == 'docx':
-            text = read_word_file(file_path)
-        else:
-            logger.warning(f"Unsupported file type for file: {file_path}")
-            return
-
-        # Generate embeddings
-        embeddings = get_openai_embeddings([text])
-
-        # Insert into ChromaDB
+def read_word_file(file_path: str) -> str:
+    """Reads and returns text from a Word (.docx) file."""
+    return "\n".join(read_word_paragraphs(file_path))
+
+def iter_text_sections(file_path: str) -> Iterator[Section]:
+    """Yields a .txt file in paragraph-aligned blocks of roughly TEXT_SECTION_CHARS characters."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        block = []
+        size = 0
+        for line in file:
+            block.append(line)
+            size += len(line)
+            # Cut only at blank lines so no paragraph is split between sections
+            if size >= TEXT_SECTION_CHARS and not line.strip():
+                yield None, "".join(block)
+                block = []
+                size = 0
+        if block:
+            yield None, "".join(block)
+
+def iter_document_sections(file_path: str) -> Optional[Tuple[Iterator[Section], str]]:
+    """Returns a lazy (page, text) section stream for a supported file plus the separator that joins sections, or None if unsupported."""
+    file_extension = file_path.split('.')[-1].lower()
+
+    if file_extension == 'txt':
+        logger.info(f"Reading text file: {file_path}")
+        return iter_text_sections(file_path), ""
+    elif file_extension == 'pdf':
+        logger.info(f"Reading PDF file: {file_path}")
+        return iter_pdf_pages(file_path), ""
+    elif file_extension == 'docx':
+        # Each paragraph is its own section so the chunker never splits mid-paragraph unless it must
+        return ((None, paragraph) for paragraph in read_word_paragraphs(file_path)), "\n"
+    return None
+
+def delete_document(doc_id: str):
+    """Removes every chunk of a document from ChromaDB and forgets it in the manifest."""
+    _remove_chunks(doc_id)
+    manifest.remove(doc_id)
+    _notify_index_changed(doc_id)
+    logger.info(f"Document '{doc_id}' removed from ChromaDB.")
+
+def _remove_chunks(doc_id: str):
+    """Deletes a document's chunks from every store and in-process index."""
+    # Under the load locks, so a first load running meanwhile cannot read the chunks back in
+    with _vector_index_load_lock:
+        get_collection().delete(where={"doc_id": doc_id})
+        vector_index.remove_document(doc_id)
+    with _lexical_index_load_lock:
+        lexical_index.remove_document(doc_id)
+        get_text_store().delete_document(doc_id)
+
+def check_needs_ingest(file_path: str, doc_id: str) -> Tuple[bool, Optional[str]]:
+    """Decides whether a file must be (re)indexed and returns its content hash when it was computed.
+
+    Stale vectors of a changed file are deleted so the new version can be inserted.
+    """
+    present = is_document_present(doc_id)
+    if present and manifest.is_unchanged(file_path, embedding_model_name):
+        return False, None
+
+    content_hash = hash_file(file_path)
+    entry = manifest.get(doc_id)
+    if present and entry is None:
+        # Indexed before the manifest existed; adopt it instead of paying for embeddings again
+        chunk_count = len(get_collection().get(where={"doc_id": doc_id}, include=[])['ids'])
+        manifest.record(file_path, content_hash, chunk_count, embedding_model_name)
+        return False, content_hash
+    if present and entry.content_hash == content_hash and entry.embedding_model == embedding_model_name:
+        manifest.touch(file_path)
+        return False, content_hash
+    if present:
+        logger.info(f"Document '{doc_id}' changed since it was indexed; replacing its vectors.")
+        delete_document(doc_id)
+    return True, content_hash
+
+def _iter_ingest_items(file_paths: List[str], documents: dict) -> Iterator[PipelineItem]:
+    """Streams the chunks of every file that needs ingestion, recording each document's details in `documents`."""
+    for file_path in file_paths:
         doc_id = os.path.basename(file_path)  # Using filename as document ID
-        # Check if document already exists to prevent duplication
-        if is_document_present(doc_id):
-            logger.info(f"Document '{doc_id}' already exists in ChromaDB. Skipping insertion.")
+        try:
+            logger.info(f"Processing file: {file_path}")
+            # Check the manifest before paying for extraction and embeddings
+            needed, content_hash = check_needs_ingest(file_path, doc_id)
+            if not needed:
+                logger.info(f"Document '{doc_id}' already exists in ChromaDB and is unchanged. Skipping insertion.")
+                continue
+            document = iter_document_sections(file_path)
+            if document is None:
+                logger.warning(f"Unsupported file type for file: {file_path}")
+                continue
+            sections, separator = document
+            documents[doc_id] = {"file_path": file_path, "content_hash": content_hash, "chunks": 0}
+            for chunk in iter_chunks(sections, separator):
+                documents[doc_id]["chunks"] += 1
+                yield doc_id, chunk
+        except Exception as e:
+            logger.error(f"Error processing file: {file_path}, Error: {str(e)}")
+            yield DocumentFailed(doc_id, e)
+            continue
+        if documents[doc_id]["chunks"] == 0:
+            logger.warning(f"No text extracted from file: {file_path}")
+            continue
+        yield DocumentEnd(doc_id)
+
+def ingest_files(file_paths: List[str]) -> Dict[str, Optional[Exception]]:
+    """Streams files through extraction, chunking, embedding and vector writes with bounded memory.
+
+    Chunks of consecutive files share embedding calls. Returns the outcome of every file
+    that was (re)ingested, keyed by document ID: None on success, else the error.
+    """
+    documents = {}
+
+    def write_chunks(items: List[Tuple[str, Chunk]], embeddings: List[List[float]]):
+        ids = [chunk_id(doc_id, chunk.index) for doc_id, chunk in items]
+        # Text first, so a chunk is never found by a query before its text can be fetched
+        get_text_store().put_many((id_, doc_id, chunk.text) for id_, (doc_id, chunk) in zip(ids, items))
+        get_collection().add(
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=[chunk_metadata(doc_id, chunk) for doc_id, chunk in items]
+        )
+        vector_index.add(ids, [doc_id for doc_id, _ in items], embeddings)
+        # An index not loaded yet picks the chunks up from the text store when it is
+        with _lexical_index_load_lock:
+            if lexical_index.loaded:
+                lexical_index.add(ids, [doc_id for doc_id, _ in items], [chunk.text for _, chunk in items])
+
+    def finish_document(doc_id: str, error: Optional[Exception]):
+        document = documents.get(doc_id)
+        if document is None:
             return
+        if error is None:
+            manifest.record(document["file_path"], document["content_hash"], document["chunks"], embedding_model_name, save=False)
+            _notify_index_changed(doc_id)
+            logger.info(f"Data from {document['file_path']} inserted into ChromaDB successfully as {document['chunks']} chunk(s).")
+        else:
+            # Drop whatever part of the document was already written so a retry starts clean
+            _remove_chunks(doc_id)
+            _notify_index_changed(doc_id)
 
-        collection.add(
-            ids=[doc_id],             # Unique identifier for each document
-            embeddings=embeddings,    # List of embeddings
-            metadatas=[{"text": text}]  # Metadata for each document
-        )
-        logger.info(f"Data from {file_path} inserted into ChromaDB successfully.")
-    except Exception as e:
-        logger.error(f"Error processing file: {file_path}, Error: {str(e)}")
-        raise
+    # Assume the backend's default embedding size until the index knows the real dimensions
+    dimensions = vector_index.dimensions or (FAKE_EMBEDDING_DIMENSIONS if EMBEDDING_BACKEND == "fake" else DEFAULT_EMBEDDING_DIMENSIONS)
+    try:
+        return ingest_pipeline.run(_iter_ingest_items(file_paths, documents), write_chunks, finish_document, dimensions)
+    finally:
+        manifest.save()
+
+def process_file(file_path: str):
+    """Processes a file based on its type and adds its chunks to ChromaDB, unless it is already indexed and unchanged."""
+    error = ingest_files([file_path]).get(os.path.basename(file_path))
+    if error is not None:
+        raise error
+
+def process_files(file_paths: List[str]) -> int:
+    """Processes many files, packing chunks from several documents into shared embedding calls.
+
+    Failures are logged per file. Returns the number of documents inserted.
+    """
+    outcomes = ingest_files(file_paths)
+    inserted = sum(1 for error in outcomes.values() if error is None)
+    logger.info(f"Processed {len(file_paths)} file(s), inserted {inserted} document(s). Embedding stats: {get_embedding_stats()}")
+    return inserted
+
+def sync_folder(folder_path: str) -> dict:
+    """Brings the vector store in line with a folder: ingests new or changed files and drops deleted ones.
+
+    Unchanged files are recognised from the manifest by size and mtime alone, so a
+    restart over a populated store costs O(changed files).
+    """
+    file_paths = [
+        os.path.join(folder_path, name)
+        for name in os.listdir(folder_path)
+        if os.path.isfile(os.path.join(folder_path, name))
+    ]
+    on_disk = {os.path.basename(path) for path in file_paths}
+
+    if manifest.names() and get_collection().count() == 0:
+        # The vector store was wiped under us; the manifest no longer describes it
+        logger.warning("ChromaDB collection is empty but the manifest is not; re-indexing everything.")
+        manifest.clear()
+        get_text_store().clear()
+        reset_indexes()
+
+    deleted = [name for name in manifest.names() if name not in on_disk]
+    for doc_id in deleted:
+        try:
+            delete_document(doc_id)
+        except Exception as e:
+            logger.error(f"Error removing deleted document '{doc_id}': {str(e)}")
+
+    candidates = [path for path in file_paths if not manifest.is_unchanged(path, embedding_model_name)]
+    inserted = process_files(candidates) if candidates else 0
+
+    summary = {
+        "files": len(file_paths),
+        "unchanged": len(file_paths) - len(candidates),
+        "checked": len(candidates),
+        "inserted": inserted,
+        "deleted": len(deleted),
+    }
+    logger.info(f"Folder sync of {folder_path} finished: {summary}")
+    return summary
+
+def chunk_metadata(doc_id: str, chunk: Chunk) -> dict:
+    """Builds the ChromaDB metadata stored alongside a chunk's embedding; the text itself goes to the text store."""
+    metadata = {
+        "doc_id": doc_id,
+        "chunk_index": chunk.index,
+        "start_char": chunk.start_char,
+        "end_char": chunk.end_char,
+    }
+    if chunk.page is not None:
+        metadata["page"] = chunk.page
+    return metadata
+
+def get_vector_index() -> VectorIndex:
+    """Returns the in-process vector index, loading it from ChromaDB on first use."""
+    if not vector_index.loaded:
+        with _vector_index_load_lock:
+            if not vector_index.loaded:
+                vector_index.load_from_collection(get_collection())
+    return vector_index
+
+def fetch_chunk_texts(chunk_ids: List[str]) -> dict:
+    """Fetches the stored text of the given chunks, keyed by chunk ID."""
+    if not chunk_ids:
+        return {}
+    texts = get_text_store().get_many(chunk_ids)
+    missing = [id_ for id_ in chunk_ids if id_ not in texts]
+    if missing:
+        # Chunks indexed before the text store existed still carry their text in ChromaDB;
+        # copy it over on first read
+        result = get_collection().get(ids=missing, include=["metadatas"])
+        legacy = [
+            (id_, meta['doc_id'], meta['text'])
+            for id_, meta in zip(result['ids'], result['metadatas'])
+            if meta and 'text' in meta
+        ]
+        if legacy:
+            get_text_store().put_many(legacy)
+            texts.update((id_, text) for id_, _, text in legacy)
+    return texts
+
+def get_lexical_index() -> LexicalIndex:
+    """Returns the in-process BM25 index, building it from the text store on first use."""
+    if not lexical_index.loaded:
+        with _lexical_index_load_lock:
+            if not lexical_index.loaded:
+                lexical_index.load(get_text_store().iter_all())
+    return lexical_index
+
+def get_lexical_index_stats() -> dict:
+    """Returns size figures for the BM25 index and how often retrieval fell back to it."""
+    stats = lexical_index.stats()
+    with _retrieval_stats_lock:
+        stats.update(_retrieval_stats)
+    stats["mode"] = RETRIEVAL_MODE
+    return stats
+
+def get_text_store_stats() -> dict:
+    """Returns size and compression figures for the chunk text store."""
+    return get_text_store().stats()
+
+def documents_present(doc_ids: List[str]) -> set:
+    """Returns which of the given documents are indexed, from the manifest plus one ChromaDB lookup for any it does not list."""
+    present = {doc_id for doc_id in doc_ids if manifest.get(doc_id) is not None}
+    # Documents indexed before the manifest existed are only known to ChromaDB
+    unknown = sorted(set(doc_ids) - present)
+    if unknown:
+        result = get_collection().get(where={"doc_id": {"$in": unknown}}, include=["metadatas"])
+        present.update(meta['doc_id'] for meta in result['metadatas'])
+    return present
+
+def add_index_listener(listener: Callable[[Optional[str]], None], local_only: bool = False):
+    """Registers a callback invoked with the document ID whenever a document is added to or removed from the index.
+
+    It is invoked with None when the whole index may have changed, see reset_indexes.
+
+    With local_only it only hears of changes made by this process, not those applied
+    from another worker through refresh_document.
+    """
+    _index_listeners.append((listener, local_only))
+
+def _notify_index_changed(doc_id: Optional[str], local: bool = True):
+    global index_version
+    # Cached retrieval results are keyed by version, so bumping it invalidates them
+    with _index_version_lock:
+        index_version += 1
+    retrieval_cache.clear()
+    for listener, local_only in _index_listeners:
+        if local_only and not local:
+            continue
+        try:
+            listener(doc_id)
+        except Exception as e:
+            logger.error(f"Index listener failed for '{doc_id}': {str(e)}")
+
+def reset_indexes(local: bool = True):
+    """Unloads the in-process indexes and drops every cache derived from the index.
+
+    Used when the store was wiped, or when changes by other workers may have been
+    missed; the indexes are rebuilt from ChromaDB and the text store on next use.
+    """
+    with _vector_index_load_lock:
+        vector_index.unload()
+    with _lexical_index_load_lock:
+        lexical_index.unload()
+    _notify_index_changed(None, local=local)
+    logger.info("In-process indexes reset; they reload on next use.")
+
+def refresh_document(doc_id: Optional[str]):
+    """Applies a change another worker made to a document: reloads its chunks into the in-process indexes and drops stale caches.
+
+    None stands for a change to the whole index.
+    """
+    if doc_id is None:
+        reset_indexes(local=False)
+        return
+    if vector_index.loaded:
+        vector_index.remove_document(doc_id)
+        result = get_collection().get(where={"doc_id": doc_id}, include=["embeddings"])
+        if result['ids']:
+            vector_index.add(result['ids'], [doc_id] * len(result['ids']), np.asarray(result['embeddings']))
+    if lexical_index.loaded:
+        lexical_index.remove_document(doc_id)
+        chunks = get_text_store().get_document(doc_id)
+        if chunks:
+            lexical_index.add([id_ for id_, _ in chunks], [doc_id] * len(chunks), [text for _, text in chunks])
+    _notify_index_changed(doc_id, local=False)
+    logger.info(f"Document '{doc_id}' refreshed after a change by another worker.")
 
 def is_document_present(doc_id: str) -> bool:
-    """Checks if a document with the given ID exists in ChromaDB."""
+    """Checks if any chunk of the document with the given ID exists in ChromaDB."""
     try:
-        result = collection.get(ids=[doc_id])
-        exists = bool(result.get('ids') and len(result['ids']) > 0 and result['ids'][0] == doc_id)
-        logger.info(f"Document '{doc_id}' presence in ChromaDB: {exists}")
+        result = get_collection().get(where={"doc_id": doc_id}, limit=1, include=[])
+        exists = bool(result.get('ids'))
+        logger.debug(f"Document '{doc_id}' presence in ChromaDB: {exists}")
         return exists
     except Exception as e:
         logger.error(f"Error checking document presence for '{doc_id}': {str(e)}")
         return False
 
-def query_cases(query_text: str, n_results: int = 3) -> Tuple[List[str], List[str], List[float]]:
-    """Queries ChromaDB for similar cases based on the input text."""
-    try:
-        logger.info(f"Querying cases with text: '{query_text}'")
-        query_embedding = get_openai_embeddings([query_text])[0]
-        query_embedding_np = np.array(query_embedding)
-        query_embedding_np /= np.linalg.norm(query_embedding_np)  # Normalize
-
-        results = collection.query(
-            query_embeddings=[query_embedding_np.tolist()],
-            n_results=n_results,
-            include=["distances", "metadatas"]
-        )
+def normalize_query(query_text: str) -> str:
+    """Normalizes a question so repeated phrasings differing only in case and spacing share cache entries."""
+    return normalize_text(query_text).casefold()
 
-        logger.info(f"Results from ChromaDB: {results}")
+def get_query_embedding(query_text: str, timeout: Optional[float] = None) -> List[float]:
+    """Returns the embedding of a query, served from the in-memory query cache when possible.
 
-        if 'ids' in results and len(results['ids']) > 0:
-            similar_cases_ids = results['ids'][0]
-            similar_cases_texts = [meta['text'] for meta in results['metadatas'][0]]
-            similar_cases_distances = results['distances'][0]
-            # Convert distances to similarity scores
-            similar_cases_similarities = [1 / (1 + d) for d in similar_cases_distances]
-            logger.info(f"Query successful, found {len(similar_cases_ids)} matching case(s).")
+    With a timeout the provider call is abandoned (and a TimeoutError raised) once it takes longer.
+    """
+    key = (embedding_model_name, normalize_query(query_text))
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        if timeout is None:
+            embedding = get_openai_embeddings([query_text])[0]
         else:
-            similar_cases_ids = []
-            similar_cases_texts = []
-            similar_cases_similarities = []
-            logger.info("No matching cases found.")
-
-        return similar_cases_ids, similar_cases_texts, similar_cases_similarities
+            embedding = _query_embedding_executor.submit(get_openai_embeddings, [query_text]).result(timeout=timeout)[0]
+        query_embedding_cache.put(key, embedding)
+    return embedding
+
+def try_query_embedding(query_text: str) -> Optional[List[float]]:
+    """Returns the query embedding, or None when the embedding service is failing or too slow.
+
+    After a failure the service is skipped for EMBEDDING_COOLDOWN_SECONDS so queries do
+    not each wait out the timeout while it is down.
+    """
+    global _embedding_unavailable_until
+    if time.monotonic() < _embedding_unavailable_until:
+        key = (embedding_model_name, normalize_query(query_text))
+        return query_embedding_cache.get(key)
+    try:
+        return get_query_embedding(query_text, timeout=QUERY_EMBEDDING_TIMEOUT_SECONDS)
     except Exception as e:
-        logger.error(f"Error querying cases: {str(e)}")
-        raise
-
-# rag.py
-
-def query_cases_by_group(file_names: List[str], query_text: str, threshold: float, n_results: int = 3) -> Tuple[List[str], List[str], List[float]]:
-    """Queries ChromaDB for similar cases within specific file groups based on the input text."""
+        _embedding_unavailable_until = time.monotonic() + EMBEDDING_COOLDOWN_SECONDS
+        logger.warning(f"Query embedding unavailable ({type(e).__name__}: {str(e)}); "
+                       f"using lexical retrieval for {EMBEDDING_COOLDOWN_SECONDS:.0f}s.")
+        return None
+
+def document_versions(doc_ids: List[str]) -> Dict[str, str]:
+    """Returns the indexed content hash of each document, or an empty string when it is not in the manifest."""
+    versions = {}
+    for doc_id in set(doc_ids):
+        entry = manifest.get(doc_id)
+        versions[doc_id] = entry.content_hash if entry else ""
+    return versions
+
+def get_query_cache_stats() -> dict:
+    """Returns hit ratios for the query embedding and retrieval result caches."""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrieval_results": retrieval_cache.stats(),
+        "index_version": index_version,
+    }
+
+def _query_collection(query_embedding: List[float], n_results: int, file_names: Optional[List[str]]) -> dict:
+    """Runs a ChromaDB top-k query, restricted to the given documents when file_names is set."""
+    collection = get_collection()
+    if file_names is None:
+        return collection.query(query_embeddings=[query_embedding], n_results=n_results, include=["distances", "metadatas"])
+
+    total = collection.count()
+    group_chunks = sum(entry.chunk_count for entry in (manifest.get(name) for name in set(file_names)) if entry)
+    if group_chunks * GROUP_POSTFILTER_FRACTION > total:
+        # The group covers much of the collection: over-fetch unfiltered and keep its hits
+        wanted = set(file_names)
+        fetch = min(total, n_results * GROUP_OVERFETCH * -(-total // max(group_chunks, 1)))
+        results = collection.query(query_embeddings=[query_embedding], n_results=fetch, include=["distances", "metadatas"])
+        keep = [i for i, meta in enumerate(results['metadatas'][0]) if meta['doc_id'] in wanted][:n_results]
+        if len(keep) >= min(n_results, group_chunks):
+            return {key: [[results[key][0][i] for i in keep]] for key in ("ids", "distances", "metadatas")}
+        logger.info(f"Post-filtered query found {len(keep)} of {n_results} hit(s); retrying with a doc_id filter.")
+    # Small groups are pre-filtered so the index only considers their chunks
+    return collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        where={"doc_id": {"$in": sorted(set(file_names))}},
+        include=["distances", "metadatas"]
+    )
+
+def _collection_hits(query_embedding: List[float], n_results: int, file_names: Optional[List[str]]) -> List[Tuple[str, str, float]]:
+    """Returns (chunk_id, doc_id, similarity) hits from ChromaDB."""
+    query_embedding_np = np.array(query_embedding)
+    query_embedding_np /= np.linalg.norm(query_embedding_np)  # Normalize
+    results = _query_collection(query_embedding_np.tolist(), n_results, file_names)
+    if not results.get('ids') or not results['ids'][0]:
+        return []
+    logger.info(f"Results from ChromaDB: {results['ids'][0]} with distances: {results['distances'][0]}")
+    # Convert distances to similarity scores
+    return [
+        (id_, meta['doc_id'], 1 / (1 + distance))
+        for id_, meta, distance in zip(results['ids'][0], results['metadatas'][0], results['distances'][0])
+    ]
+
+def _vector_scores(query_embedding: List[float], chunk_ids: List[str], use_collection: bool) -> Dict[str, float]:
+    """Scores chunks found by another retriever against the query embedding, on the same scale as the vector hits."""
+    if not chunk_ids:
+        return {}
+    if not use_collection:
+        return get_vector_index().similarities(query_embedding, chunk_ids)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= np.linalg.norm(query)
+    result = get_collection().get(ids=chunk_ids, include=["embeddings"])
+    if not result['ids']:
+        return {}
+    # Same squared L2 distance ChromaDB ranks by, converted as in _collection_hits
+    distances = np.sum((np.asarray(result['embeddings'], dtype=np.float32) - query) ** 2, axis=1)
+    return {id_: float(1 / (1 + distance)) for id_, distance in zip(result['ids'], distances)}
+
+def query_cases(query_text: str, n_results: int = 3, file_names: Optional[List[str]] = None, nprobe: Optional[int] = None, exact: bool = False, mode: Optional[str] = None) -> Tuple[List[str], List[str], List[Optional[float]]]:
+    """Queries the indexes for the chunks most relevant to the input text and returns their document IDs, texts and scores.
+
+    `file_names` restricts the search to those documents inside the index: small groups
+    are pre-filtered with a doc_id filter, large ones are post-filtered from an
+    over-fetched unrestricted query. With ANN_BACKEND=ivf the in-process index answers
+    instead of ChromaDB; `nprobe` and `exact` then tune its recall per request. `mode`
+    overrides RETRIEVAL_MODE.
+    """
+    if file_names is not None and not file_names:
+        return [], [], []
+    return _retrieve(file_names, query_text, None, n_results, nprobe, exact, mode, use_collection=ANN_BACKEND == "chroma")
+
+def query_cases_by_group(file_names: List[str], query_text: str, threshold: float, n_results: int = 3, nprobe: Optional[int] = None, exact: bool = False, mode: Optional[str] = None) -> Tuple[List[str], List[str], List[Optional[float]]]:
+    """Finds the chunks most relevant to the input text within the given files using the in-process indexes.
+
+    `threshold` applies to vector similarity, in hybrid mode also to chunks only the
+    lexical index found; lexical-only retrieval cannot apply it.
+    """
+    return _retrieve(file_names, query_text, threshold, n_results, nprobe, exact, mode, use_collection=False)
+
+def _retrieve(
+    file_names: Optional[List[str]],
+    query_text: str,
+    threshold: Optional[float],
+    n_results: int,
+    nprobe: Optional[int],
+    exact: bool,
+    mode: Optional[str],
+    use_collection: bool,
+) -> Tuple[List[str], List[str], List[Optional[float]]]:
+    """Runs vector, lexical or hybrid retrieval and returns document IDs, texts and scores.
+
+    Hybrid mode merges both rankings with reciprocal rank fusion, and every passage keeps
+    its vector similarity as its score. Lexical-only results have no similarity and carry
+    None. If the query cannot be embedded in time, retrieval falls back to the lexical
+    index alone.
+    """
+    mode = mode or RETRIEVAL_MODE
+    scope = "all" if file_names is None else frozenset(file_names)
+    cache_key = (scope, use_collection, normalize_query(query_text), threshold, n_results, nprobe, exact, mode, index_version)
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Retrieval results for '{query_text}' served from cache.")
+        return cached
     try:
-        logger.info(f"Querying cases for files {file_names} with text: '{query_text}'")
-        query_embedding = get_openai_embeddings([query_text])[0]
-        query_embedding_np = np.array(query_embedding)
-        query_embedding_np /= np.linalg.norm(query_embedding_np)  # Normalize
-
-        # Fetch embeddings and metadata for the specified file_names
-        group_docs = collection.get(ids=file_names, include=["embeddings", "metadatas"])
-
-        if not group_docs.get('ids'):
-            logger.info("No matching cases found for the selected group(s).")
-            return [], [], []
-
-        # Correctly assign fetched data
-        fetched_ids = group_docs['ids']
-        fetched_metadatas = group_docs['metadatas']
-        fetched_embeddings = group_docs['embeddings']
-
-        if not fetched_ids:
-            logger.info("No matching cases found for the selected group(s).")
-            return [], [], []
-
-        if not (len(fetched_ids) == len(fetched_metadatas) == len(fetched_embeddings)):
-            logger.error("Mismatch in lengths of ids, metadatas, and embeddings from ChromaDB.")
-            return [], [], []
-
-        # Compute cosine similarity between query_embedding and each document embedding
-        similarities = []
-        for doc_embedding in fetched_embeddings:
-            doc_embedding_np = np.array(doc_embedding)
-            norm = np.linalg.norm(doc_embedding_np)
-            if norm == 0:
-                similarity = 0.0
+        logger.info(f"Querying cases ({mode}) for files {file_names if file_names is not None else 'all'} with text: '{query_text}'")
+        # Each retriever contributes a deeper list than needed so fusion has overlap to work with
+        fetch = n_results * HYBRID_CANDIDATES if mode == "hybrid" else n_results
+        vector_hits = []
+        lexical_hits = []
+        fallback = False
+
+        if mode != "lexical":
+            query_embedding = try_query_embedding(query_text)
+            if query_embedding is None:
+                fallback = True
+                with _retrieval_stats_lock:
+                    _retrieval_stats["lexical_fallbacks"] += 1
+            elif use_collection:
+                vector_hits = _collection_hits(query_embedding, fetch, file_names)
             else:
-                doc_embedding_np /= norm  # Normalize
-                similarity = float(np.dot(query_embedding_np, doc_embedding_np))
-            similarities.append(similarity)
-
-        # Combine into list of tuples
-        combined = list(zip(fetched_ids, [meta['text'] for meta in fetched_metadatas], similarities))
-
-        # Filter based on threshold
-        filtered = [doc for doc in combined if doc[2] >= threshold]
-
-        if not filtered:
-            logger.info("No documents with similarity above the threshold.")
-            return [], [], []
-
-        # Sort by similarity descending
-        filtered.sort(key=lambda x: x[2], reverse=True)
-
-        # Select top N
-        top_docs = filtered[:n_results]
-
-        ids = [doc[0] for doc in top_docs]
-        texts = [doc[1] for doc in top_docs]
-        sims = [doc[2] for doc in top_docs]
-
-        logger.info(f"Top {len(top_docs)} similar documents: {ids} with similarities: {sims}")
-
-        return ids, texts, sims
+                # One matrix-vector product over the candidate rows plus a top-k partition; large
+                # candidate sets are narrowed to the nearest IVF lists first
+                vector_hits = get_vector_index().search(
+                    query_embedding, k=fetch, doc_ids=file_names, threshold=threshold, nprobe=nprobe, exact=exact
+                )
+        if mode != "vector" or fallback:
+            lexical_hits = get_lexical_index().search(query_text, fetch, doc_ids=file_names)
+
+        if mode == "hybrid" and not fallback:
+            doc_of = {chunk: doc_id for chunk, doc_id, _ in lexical_hits + vector_hits}
+            fused = reciprocal_rank_fusion(
+                [[chunk for chunk, _, _ in vector_hits], [chunk for chunk, _, _ in lexical_hits]], k=RRF_K
+            )
+            # Fusion decides the order; the prompt and the threshold see vector similarity
+            similarity = {chunk: score for chunk, _, score in vector_hits}
+            similarity.update(_vector_scores(
+                query_embedding, [chunk for chunk, _ in fused if chunk not in similarity], use_collection
+            ))
+            hits = [
+                (chunk, doc_of[chunk], similarity[chunk]) for chunk, _ in fused
+                if chunk in similarity and (threshold is None or similarity[chunk] >= threshold)
+            ][:n_results]
+        elif vector_hits:
+            hits = vector_hits[:n_results]
+        else:
+            hits = [(chunk, doc_id, None) for chunk, doc_id, _ in lexical_hits[:n_results]]
 
+        if not hits:
+            logger.info("No matching cases found.")
+            result = ([], [], [])
+        else:
+            chunk_texts = fetch_chunk_texts([chunk for chunk, _, _ in hits])
+            ids = [doc_id for _, doc_id, _ in hits]
+            texts = [chunk_texts.get(chunk, "") for chunk, _, _ in hits]
+            scores = [score for _, _, score in hits]
+            logger.info(f"Top {len(hits)} passages from documents: {ids} with scores: {scores}")
+            result = (ids, texts, scores)
+
+        # A degraded answer should not outlive the outage
+        if not fallback:
+            retrieval_cache.put(cache_key, result)
+        return result
     except Exception as e:
-        logger.error(f"Error querying cases by group: {str(e)}")
+        logger.error(f"Error querying cases: {str(e)}")
         raise
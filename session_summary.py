@@ -0,0 +1,219 @@
+# session_summary.py
+
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import openai
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from coordination import coordinator
+from database import PreparedQuery, database
+from logging_config import get_logger
+from models import chat_history, session_summaries
+from prompt_builder import PromptBuilder
+from query_cache import TTLCache
+from write_buffer import write_buffer
+
+logger = get_logger('session_summary')
+
+# Rolling summary configuration
+SUMMARY_FOLD_MESSAGES = int(os.getenv("SUMMARY_FOLD_MESSAGES", "8"))  # Aged-out messages collected before a summary update
+SUMMARY_MAX_FOLD_MESSAGES = int(os.getenv("SUMMARY_MAX_FOLD_MESSAGES", "40"))  # Upper bound folded per update call
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "250"))  # Length cap of the stored summary
+SUMMARY_MESSAGE_TOKENS = int(os.getenv("SUMMARY_MESSAGE_TOKENS", "400"))  # Long messages are cut before folding
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "30"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))  # Sessions whose summary is kept in memory
+
+SUMMARY_INSTRUCTION = (
+    "Update the running summary of this conversation with the new messages. Keep the facts, "
+    "case IDs, names and open questions the user may refer back to; drop pleasantries. "
+    "Reply with the updated summary only, in at most {words} words."
+)
+
+
+class SessionSummarizer:
+    """Keeps a rolling summary per chat session so prompts stay the same size as sessions grow.
+
+    Prompts carry the summary plus only the messages that have not been folded into it yet.
+    After each bot reply the session is scheduled for an update in the background: once
+    more than `recent_messages + SUMMARY_FOLD_MESSAGES` messages are unsummarized, the
+    oldest ones beyond the recent window are folded into the summary by the chat model.
+    A failed update keeps the previous summary and is retried after the next reply.
+    """
+    def __init__(self, prompt_builder: PromptBuilder, recent_messages: int = 5, fold_messages: int = SUMMARY_FOLD_MESSAGES):
+        self.prompt_builder = prompt_builder
+        self.recent_messages = max(1, recent_messages)
+        self.fold_messages = max(1, fold_messages)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Sessions that got another reply while their update was running
+        self._dirty: Set[str] = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {"updates": 0, "failed_updates": 0, "messages_folded": 0, "summary_tokens": 0}
+        # (summary, summarized_until) per session; updates by other workers arrive as "summary" events
+        self._summaries = TTLCache(SUMMARY_CACHE_SIZE, 3600)
+        # Hot per-turn reads, prepared once
+        self._summary_query = PreparedQuery(
+            select(session_summaries.c.summary, session_summaries.c.summarized_until)
+            .where(session_summaries.c.session_id == bindparam('session_id')),
+            database,
+        )
+        self._history_query = PreparedQuery(
+            select(chat_history.c.sender, chat_history.c.message, chat_history.c.timestamp)
+            .where(chat_history.c.session_id == bindparam('session_id'), chat_history.c.id > bindparam('until'))
+            .order_by(chat_history.c.id.desc())
+            .limit(self.window),
+            database,
+        )
+
+    @property
+    def window(self) -> int:
+        """Largest number of unsummarized messages a prompt can carry."""
+        return self.recent_messages + self.fold_messages
+
+    def forget(self, session_id: Optional[str] = None):
+        """Drops a session's cached summary after another worker updated it (all sessions if None)."""
+        if session_id is None:
+            self._summaries.clear()
+        else:
+            self._summaries.pop(session_id)
+
+    def new_session(self, session_id: str):
+        """Records that a just-created session has no summary, sparing the lookup on its first turn."""
+        self._summaries.put(session_id, ("", 0))
+
+    async def context(self, session_id: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """Returns the session summary and its unsummarized (sender, message) pairs, oldest first.
+
+        Messages still in the write buffer are included, so the current question is always there.
+        """
+        cached = self._summaries.get(session_id)
+        if cached is None:
+            record = await self._summary_query.fetch_one(session_id=session_id)
+            cached = (record['summary'], record['summarized_until']) if record else ("", 0)
+            self._summaries.put(session_id, cached)
+        summary, until = cached
+        # Taken before the query: anything committed after this is still in the snapshot
+        pending = write_buffer.pending_messages(session_id)
+        records = await self._history_query.fetch_all(session_id=session_id, until=until)
+        stored = [(record['sender'], record['message'], record['timestamp']) for record in reversed(records)]
+        seen = set(stored)
+        messages = stored + [row for row in pending if row not in seen]
+        return summary, [(sender, message) for sender, message, _ in messages[-self.window:]]
+
+    def schedule(self, session_id: str):
+        """Queues a background summary update for a session; at most one runs per session."""
+        task = self._tasks.get(session_id)
+        if task is not None and not task.done():
+            self._dirty.add(session_id)
+            return
+        self._tasks[session_id] = asyncio.create_task(self._run(session_id))
+
+    async def stop(self):
+        """Cancels pending updates; they are redone after the session's next reply."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+        self._dirty.clear()
+
+    async def _run(self, session_id: str):
+        try:
+            while True:
+                self._dirty.discard(session_id)
+                try:
+                    await self.update(session_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._count("failed_updates")
+                    logger.error(f"Error updating summary of session {session_id}: {str(e)}")
+                    return
+                if session_id not in self._dirty:
+                    return
+        finally:
+            if self._tasks.get(session_id) is asyncio.current_task():
+                del self._tasks[session_id]
+
+    async def update(self, session_id: str) -> int:
+        """Folds aged-out messages into the session summary; returns how many were folded."""
+        record = await database.fetch_one(select(session_summaries).where(session_summaries.c.session_id == session_id))
+        summary = record['summary'] if record else ""
+        until = record['summarized_until'] if record else 0
+        query = (
+            select(chat_history.c.id, chat_history.c.sender, chat_history.c.message)
+            .where(chat_history.c.session_id == session_id, chat_history.c.id > until)
+            .order_by(chat_history.c.id)
+            .limit(SUMMARY_MAX_FOLD_MESSAGES + self.window)
+        )
+        pending = await database.fetch_all(query)
+        if len(pending) < self.window:
+            return 0
+        folded = pending[:min(len(pending) - self.recent_messages, SUMMARY_MAX_FOLD_MESSAGES)]
+        messages = [(row['sender'], row['message']) for row in folded]
+        summary = await self._summarize(summary, messages)
+        values = {
+            "summary": summary,
+            "summarized_until": folded[-1]['id'],
+            "summarized_messages": (record['summarized_messages'] if record else 0) + len(folded),
+            "updated_at": datetime.now(),
+        }
+        # Another worker may be summarizing the same session; the summary that covers more wins
+        insert = (pg_insert if database.is_postgres else sqlite_insert)(session_summaries).values(session_id=session_id, **values)
+        await database.execute(insert.on_conflict_do_update(
+            index_elements=[session_summaries.c.session_id],
+            set_=values,
+            where=session_summaries.c.summarized_until < insert.excluded.summarized_until,
+        ))
+        self._summaries.put(session_id, (summary, values["summarized_until"]))
+        # A session's turns may be answered by any worker
+        await coordinator.publish("summary", session_id)
+        tokens = self.prompt_builder.count(summary)
+        with self._stats_lock:
+            self._stats["updates"] += 1
+            self._stats["messages_folded"] += len(folded)
+            self._stats["summary_tokens"] += tokens
+        logger.info(f"Folded {len(folded)} message(s) of session {session_id} into a {tokens}-token summary.")
+        return len(folded)
+
+    async def _summarize(self, summary: str, messages: List[Tuple[str, str]]) -> str:
+        lines = "\n".join(
+            f"{sender.capitalize()}: {self.prompt_builder.truncate(message, SUMMARY_MESSAGE_TOKENS)}"
+            for sender, message in messages
+        )
+        prompt = (
+            f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{lines}\n\n"
+            + SUMMARY_INSTRUCTION.format(words=int(SUMMARY_MAX_TOKENS * 0.75))
+        )
+        response = await asyncio.wait_for(
+            openai.ChatCompletion.acreate(
+                model=SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=SUMMARY_MAX_TOKENS,
+                request_timeout=SUMMARY_TIMEOUT_SECONDS
+            ),
+            SUMMARY_TIMEOUT_SECONDS
+        )
+        text = response.choices[0].message['content'].strip()
+        if not text:
+            raise ValueError("empty summary returned")
+        return self.prompt_builder.truncate(text, SUMMARY_MAX_TOKENS)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        summary_tokens = stats.pop("summary_tokens")
+        stats["avg_summary_tokens"] = round(summary_tokens / stats["updates"], 1) if stats["updates"] else 0.0
+        stats["pending"] = sum(1 for task in self._tasks.values() if not task.done())
+        stats["window"] = self.window
+        return stats
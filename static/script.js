@@ -7,6 +7,19 @@ let existingFiles = [];
 let selectedGroupIds = []; // Global variable to store selected group IDs
 let currentChatIndex = -1;
 
+// List endpoints return one page at a time; follows X-Next-Cursor and returns every page's JSON
+async function fetchAllPages(url) {
+  const pages = [];
+  let cursor = null;
+  do {
+    const separator = url.includes("?") ? "&" : "?";
+    const response = await fetch(cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url);
+    pages.push(await response.json());
+    cursor = response.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return pages;
+}
+
 // WebSocket setup
 function connectWebSocket() {
   websocket = new WebSocket("ws://127.0.0.1:8000/ws/chat");
@@ -20,6 +33,37 @@ function connectWebSocket() {
   // Receive message from WebSocket server (OpenAI response)
   websocket.onmessage = (event) => {
     const chatArea = document.getElementById("chatArea");
+
+    // Streamed answers arrive as JSON start/delta/end frames; plain text is a complete answer
+    let frame = null;
+    try {
+      frame = JSON.parse(event.data);
+    } catch (e) {
+      frame = null;
+    }
+
+    if (frame && frame.type) {
+      if (frame.type === "start") {
+        const botChatBubble = document.createElement("div");
+        botChatBubble.classList.add("chat-bubble", "bot");
+        botChatBubble.setAttribute("data-question-id", frame.question_id);
+        botChatBubble.textContent = "Bot: ";
+        chatArea.appendChild(botChatBubble);
+        // The first frame arrived, so the response is no longer pending
+        hideSpinner();
+        isProcessing = false;
+      } else {
+        const botChatBubble = chatArea.querySelector(`.chat-bubble.bot[data-question-id='${frame.question_id}']`);
+        if (botChatBubble && frame.type === "delta") {
+          botChatBubble.textContent += frame.content;
+        } else if (botChatBubble && frame.type === "end") {
+          botChatBubble.textContent = `Bot: ${frame.answer}`;
+        }
+      }
+      chatArea.scrollTop = chatArea.scrollHeight;
+      return;
+    }
+
     const botChatBubble = document.createElement("div");
     botChatBubble.classList.add("chat-bubble", "bot");
     botChatBubble.textContent = `Bot: ${event.data}`;
@@ -96,7 +140,8 @@ async function sendMessage() {
       const messageData = {
         session_id: currentSessionId,
         message: messageInput,
-        group_ids: selectedGroupIds // Include selected group IDs
+        group_ids: selectedGroupIds, // Include selected group IDs
+        stream: true // Receive the answer token by token
       };
 
       console.log("Sending message:", messageData); // Log the message data
@@ -177,9 +222,9 @@ async function loadChat(event, sessionId) {
 
   currentSessionId = sessionId; // Set current session ID
 
-  // Fetch chat history for the selected session
-  const response = await fetch(`/get-chat-history?session_id=${sessionId}`);
-  const chatHistoryData = await response.json();
+  // Fetch chat history for the selected session; pages go from the newest messages back to the oldest
+  const pages = await fetchAllPages(`/get-chat-history?session_id=${sessionId}`);
+  const chatHistoryData = pages.reverse().flat();
 
   // Display messages in the chat area
   chatHistoryData.forEach(chat => {
@@ -198,11 +243,13 @@ async function loadChat(event, sessionId) {
 }
 
 async function loadSessions() {
-  const activeSessionsResponse = await fetch("/get-active-sessions/");
-  const archivedSessionsResponse = await fetch("/get-archived-sessions/");
+  const [activePages, archivedPages] = await Promise.all([
+    fetchAllPages("/get-active-sessions/"),
+    fetchAllPages("/get-archived-sessions/")
+  ]);
 
-  const activeData = await activeSessionsResponse.json();
-  const archivedData = await archivedSessionsResponse.json();
+  const activeData = activePages.flat();
+  const archivedData = archivedPages.flat();
 
   const chatList = document.getElementById("chatList");
   chatList.innerHTML = ""; // Clear existing list
@@ -349,8 +396,9 @@ function renameChat(sessionId) {
 
 // Export chat
 function exportChat(sessionId) {
-  fetch(`/get-chat-history?session_id=${sessionId}`)
-    .then(response => response.json())
+  // Pages go from the newest messages back to the oldest
+  fetchAllPages(`/get-chat-history?session_id=${sessionId}`)
+    .then(pages => pages.reverse().flat())
     .then(chatHistoryData => {
       if (chatHistoryData && chatHistoryData.length > 0) {
         let exportContent = '';
@@ -525,8 +573,8 @@ function hideFileGroupModal() {
 }
 
 function loadExistingFiles() {
-  fetch("/get-existing-files")
-    .then((response) => response.json())
+  fetchAllPages("/get-existing-files")
+    .then((pages) => pages.flat())
     .then((files) => {
       existingFiles = files;
       displayExistingFiles();
@@ -1172,8 +1220,12 @@ async function deleteGroup(groupId) {
 }
 
 function editGroup(groupId) {
-  fetch(`/get-group-files/${groupId}`)
-    .then(response => response.json())
+  fetchAllPages(`/get-group-files/${groupId}`)
+    .then(pages => ({
+      group_name: pages[0].group_name,
+      group_files: pages.flatMap(page => page.group_files),
+      all_files: pages.flatMap(page => page.all_files),
+    }))
     .then(data => {
       showEditGroupModal(groupId, data.group_name, data.group_files, data.all_files);
     })
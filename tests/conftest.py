@@ -0,0 +1,11 @@
+# conftest.py
+
+import os
+import sys
+import tempfile
+
+# Modules live at the repository root and are imported by name, as the app does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never touch the deployment database; a throwaway SQLite file stands in
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='rag-tests-'), 'test.sqlite')}")
@@ -0,0 +1,58 @@
+# test_chunking.py
+
+import random
+
+from chunking import chunk_id, chunk_sections, chunk_text, estimate_tokens
+
+
+def _random_document(rng: random.Random) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(1, 30)):
+        words = [rng.choice(["case", "court", "appeal", "section", "12", "damages", "x" * rng.randint(1, 40)])
+                 for _ in range(rng.randint(1, 120))]
+        paragraphs.append(" ".join(words))
+    return rng.choice(["\n\n", "\n \n", "\n\n\n"]).join(paragraphs)
+
+
+def test_chunk_offsets_size_and_coverage():
+    rng = random.Random(7)
+    for _ in range(200):
+        text = _random_document(rng)
+        size = rng.randint(20, 400)
+        overlap = rng.randint(0, size)
+        chunks = chunk_text(text, chunk_size=size, chunk_overlap=overlap, unit="chars")
+        covered = bytearray(len(text))
+        for i, chunk in enumerate(chunks):
+            assert chunk.index == i
+            assert text[chunk.start_char:chunk.end_char] == chunk.text
+            assert chunk.text == chunk.text.strip() and chunk.text
+            assert len(chunk.text) <= size
+            covered[chunk.start_char:chunk.end_char] = b"\x01" * (chunk.end_char - chunk.start_char)
+        # Every non-blank character ends up in some chunk
+        assert all(covered[i] or text[i].isspace() for i in range(len(text)))
+        starts = [chunk.start_char for chunk in chunks]
+        assert starts == sorted(starts)
+
+
+def test_chunks_never_span_pages():
+    pages = [(1, "first page text. " * 50), (2, "second page."), (3, "third page text. " * 30)]
+    separator = "\n\n"
+    document = separator.join(text for _, text in pages)
+    chunks = chunk_sections(pages, separator, chunk_size=100, chunk_overlap=20, unit="chars")
+    page_spans = {}
+    offset = 0
+    for page, text in pages:
+        page_spans[page] = (offset, offset + len(text))
+        offset += len(text) + len(separator)
+    for chunk in chunks:
+        start, end = page_spans[chunk.page]
+        assert start <= chunk.start_char and chunk.end_char <= end
+        assert document[chunk.start_char:chunk.end_char] == chunk.text
+    assert {chunk.page for chunk in chunks} == {1, 2, 3}
+
+
+def test_token_windows_and_ids():
+    chunks = chunk_text("word " * 1000, chunk_size=50, chunk_overlap=0, unit="tokens")
+    assert all(estimate_tokens(chunk.text) <= 50 for chunk in chunks)
+    assert chunk_text("   \n\n  ") == []
+    assert chunk_id("a.pdf", 3) != chunk_id("a.pdf", 4)
@@ -0,0 +1,85 @@
+# test_lexical_index.py
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def _index():
+    index = LexicalIndex()
+    index.add(
+        ["a1", "a2", "b1", "c1"],
+        ["a", "a", "b", "c"],
+        [
+            "The tenant must pay rent under s.12 of the lease.",
+            "Rent reviews happen every five years.",
+            "The landlord repairs the roof and the walls.",
+            "Case 2019/123 concerned unpaid rent and rent arrears.",
+        ],
+    )
+    return index
+
+
+def test_tokenize_keeps_citations_and_their_parts():
+    assert tokenize("See s.12 and Case 2019/123!") == ["see", "s.12", "s", "12", "and", "case", "2019/123", "2019", "123"]
+
+
+def test_search_ranks_and_filters():
+    index = _index()
+    hits = index.search("rent arrears", 10)
+    assert hits[0][:2] == ("c1", "c")
+    assert {chunk for chunk, _, _ in hits} == {"a1", "a2", "c1"}
+    assert all(hits[i][2] >= hits[i + 1][2] for i in range(len(hits) - 1))
+    assert index.search("s.12", 1)[0][0] == "a1"
+    assert [chunk for chunk, _, _ in index.search("rent", 10, doc_ids=["a"])] in (["a1", "a2"], ["a2", "a1"])
+    assert index.search("rent", 10, doc_ids=["missing"]) == []
+    assert index.search("nothing matches", 10) == []
+    assert index.search("", 10) == []
+
+
+def test_replacing_and_removing_chunks():
+    index = _index()
+    index.add(["a2"], ["a"], ["Roof repairs only."])
+    assert index.search("reviews", 5) == []
+    assert index.search("roof", 5)[0][0] in ("a2", "b1")
+    assert index.remove_document("a") == 2
+    assert index.remove_document("a") == 0
+    assert len(index) == 2
+    assert {chunk for chunk, _, _ in index.search("rent roof", 10)} == {"b1", "c1"}
+    assert index.stats()["dead_slots"] == 3
+
+
+def test_compaction_keeps_results():
+    index = LexicalIndex()
+    rows = 3000
+    index.add(
+        [f"c{i}" for i in range(rows)],
+        [f"d{i % 3}" for i in range(rows)],
+        [f"common word{i} group{i % 3}" for i in range(rows)],
+    )
+    assert index.remove_document("d0") == 1000
+    assert index.remove_document("d1") == 1000
+    stats = index.stats()
+    assert stats["chunks"] == 1000 and stats["dead_slots"] == 0
+    assert index.search("word2", 1)[0][:2] == ("c2", "d2")
+    assert index.search("word3", 1) == []
+    assert len(index.search("common", rows)) == 1000
+    index.add(["new"], ["d0"], ["common word3"])
+    assert index.search("word3", 5)[0][:2] == ("new", "d0")
+
+
+def test_load_clear_and_unload():
+    index = LexicalIndex()
+    assert not index.loaded
+    index.load(((f"c{i}", "d", f"term{i}") for i in range(25)), page_size=10)
+    assert index.loaded and len(index) == 25
+    index.clear()
+    assert index.loaded and len(index) == 0
+    index.add(["c"], ["d"], ["term"])
+    index.unload()
+    assert not index.loaded and index.search("term", 5) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+    assert [item for item, _ in fused] == ["y", "x", "w", "z"]
+    assert abs(dict(fused)["y"] - (1 / 62 + 1 / 61)) < 1e-12
+    assert reciprocal_rank_fusion([]) == []
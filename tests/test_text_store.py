@@ -0,0 +1,74 @@
+# test_text_store.py
+
+import sqlite3
+import zlib
+
+from text_store import TextStore
+
+
+def _totals(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(text)), 0) FROM chunk_text"
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def _stats_totals(store):
+    stats = store.stats()
+    return stats["chunks"], stats["raw_bytes"], stats["stored_bytes"]
+
+
+def test_round_trip_and_lookups(tmp_path):
+    store = TextStore(str(tmp_path / "text.db"))
+    items = [(f"c{i}", f"d{i % 3}", f"chunk {i} – ünïcode " * (i + 1)) for i in range(1200)]
+    store.put_many(items)
+    # More IDs than one SQL batch, with duplicates and unknown IDs
+    wanted = [chunk_id for chunk_id, _, _ in items] + ["c5", "missing"]
+    found = store.get_many(wanted)
+    assert found == {chunk_id: text for chunk_id, _, text in items}
+    stats = store.stats()
+    assert stats["reads"] == 1200 and stats["misses"] == 1
+    assert sorted(store.get_document("d1")) == sorted((c, t) for c, d, t in items if d == "d1")
+    assert list(store.iter_all(page_size=7)) == sorted(items)
+    assert sorted(store.document_ids()) == ["d0", "d1", "d2"]
+
+
+def test_totals_follow_inserts_replaces_and_deletes(tmp_path):
+    path = str(tmp_path / "text.db")
+    store = TextStore(path)
+    assert _stats_totals(store) == (0, 0, 0)
+    store.put_many([("a", "d1", "alpha " * 50), ("b", "d1", "beta"), ("c", "d2", "gamma")])
+    assert _stats_totals(store) == _totals(path)
+    store.put_many([("a", "d1", "short"), ("d", "d2", "delta " * 10)])
+    assert _stats_totals(store) == _totals(path)
+    assert store.get_many(["a"]) == {"a": "short"}
+    assert store.delete_document("d1") == 2
+    assert store.delete_document("d1") == 0
+    assert _stats_totals(store) == _totals(path)
+    assert _stats_totals(store)[:2] == (2, len("gamma") + len("delta " * 10))
+    store.clear()
+    assert _stats_totals(store) == (0, 0, 0)
+    assert store.stats()["compression_ratio"] == 0.0
+
+
+def test_totals_seeded_from_a_store_without_them(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE chunk_text (chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, raw_size INTEGER NOT NULL, text BLOB NOT NULL)"
+    )
+    for i in range(10):
+        raw = f"legacy chunk {i}".encode("utf-8")
+        conn.execute("INSERT INTO chunk_text VALUES (?, ?, ?, ?)", (f"c{i}", "old", len(raw), zlib.compress(raw)))
+    conn.commit()
+    conn.close()
+
+    store = TextStore(path)
+    assert _stats_totals(store) == _totals(path)
+    store.put_many([("c0", "old", "replaced"), ("new", "d", "fresh")])
+    assert _stats_totals(store) == _totals(path)
+    # Reopening must not count the existing rows a second time
+    assert _stats_totals(TextStore(path)) == _totals(path)
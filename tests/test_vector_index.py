@@ -0,0 +1,120 @@
+# test_vector_index.py
+
+import time
+
+import numpy as np
+
+import vector_index
+from vector_index import VectorIndex, normalize_rows
+
+
+def _build(rows: int = 2000, dimensions: int = 32, documents: int = 50, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(rows, dimensions)).astype(np.float32)
+    chunk_ids = [f"c{i}" for i in range(rows)]
+    doc_ids = [f"d{i % documents}" for i in range(rows)]
+    index = VectorIndex(initial_capacity=16)
+    # Added in several calls so the matrix has to grow
+    for start in range(0, rows, 300):
+        index.add(chunk_ids[start:start + 300], doc_ids[start:start + 300], embeddings[start:start + 300])
+    return index, embeddings, chunk_ids, doc_ids
+
+
+def _brute_force(embeddings, chunk_ids, doc_ids, query, k, allowed=None, threshold=None):
+    scores = normalize_rows(embeddings) @ normalize_rows(query)[0]
+    hits = [
+        (chunk_ids[i], doc_ids[i], float(scores[i])) for i in range(len(chunk_ids))
+        if (allowed is None or doc_ids[i] in allowed) and (threshold is None or scores[i] >= threshold)
+    ]
+    return sorted(hits, key=lambda hit: -hit[2])[:k]
+
+
+def _assert_same(hits, expected):
+    assert [chunk for chunk, _, _ in hits] == [chunk for chunk, _, _ in expected]
+    assert np.allclose([score for _, _, score in hits], [score for _, _, score in expected], atol=1e-5)
+
+
+def test_filtered_search_matches_exact_scan():
+    index, embeddings, chunk_ids, doc_ids = _build()
+    rng = np.random.default_rng(1)
+    # A small group is pre-filtered, one covering most documents is post-filtered
+    for allowed in (None, {"d3"}, {"d1", "d2", "d7"}, {f"d{i}" for i in range(40)}):
+        for _ in range(5):
+            query = rng.normal(size=32)
+            expected = _brute_force(embeddings, chunk_ids, doc_ids, query, 10, allowed)
+            _assert_same(index.search(query, 10, doc_ids=allowed), expected)
+    assert index.search(rng.normal(size=32), 5, doc_ids={"missing"}) == []
+
+
+def test_threshold_and_similarities():
+    index, embeddings, chunk_ids, doc_ids = _build(rows=500)
+    query = embeddings[42]
+    expected = _brute_force(embeddings, chunk_ids, doc_ids, query, 500, threshold=0.2)
+    _assert_same(index.search(query, 500, threshold=0.2), expected)
+    assert index.search(query, 1)[0][0] == "c42"
+    similarities = index.similarities(query, ["c42", "c7", "unknown"])
+    assert set(similarities) == {"c42", "c7"}
+    assert abs(similarities["c42"] - 1.0) < 1e-5
+
+
+def test_remove_document_keeps_rows_consistent():
+    index, embeddings, chunk_ids, doc_ids = _build(rows=600, documents=20)
+    assert index.remove_document("d5") == 30
+    assert index.remove_document("d5") == 0
+    assert not index.has_document("d5")
+    assert len(index) == 570
+    kept = [i for i in range(600) if doc_ids[i] != "d5"]
+    query = embeddings[5]
+    expected = _brute_force(embeddings[kept], [chunk_ids[i] for i in kept], [doc_ids[i] for i in kept], query, 15)
+    _assert_same(index.search(query, 15), expected)
+    # Re-adding a chunk replaces its row instead of duplicating it
+    index.add(["c0"], ["d0"], embeddings[1:2])
+    assert len(index) == 570
+    assert index.search(embeddings[1], 2)[0][0] in ("c0", "c1")
+
+
+def test_ivf_search_with_every_list_probed_is_exact(monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_EXACT_MAX_ROWS", 10)
+    index, embeddings, chunk_ids, doc_ids = _build(rows=3000)
+    index.train(nlist=16)
+    stats = index.stats()
+    assert stats["ann_lists"] == 16 and stats["ann_trained_rows"] == 3000
+    assert (index._row_list[:len(index)] >= 0).all()
+    rng = np.random.default_rng(2)
+    for allowed in (None, {f"d{i}" for i in range(30)}):
+        query = rng.normal(size=32)
+        expected = _brute_force(embeddings, chunk_ids, doc_ids, query, 10, allowed)
+        _assert_same(index.search(query, 10, doc_ids=allowed, nprobe=16), expected)
+        # Fewer lists probed still returns k results, all from the allowed documents
+        hits = index.search(query, 10, doc_ids=allowed, nprobe=2)
+        assert len(hits) == 10 and all(allowed is None or doc in allowed for _, doc, _ in hits)
+
+
+def test_training_runs_in_the_background(monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_MIN_ROWS", 1000)
+    train_centroids = vector_index.train_centroids
+
+    def slow_train(*args, **kwargs):
+        time.sleep(0.3)
+        return train_centroids(*args, **kwargs)
+
+    monkeypatch.setattr(vector_index, "train_centroids", slow_train)
+    index, embeddings, chunk_ids, doc_ids = _build(rows=1500)
+    # Searches stay exact until the lists are swapped in
+    assert index.stats()["ann_training"]
+    assert index.stats()["ann_lists"] == 0
+    index.add(["late"], ["d0"], embeddings[:1])
+    deadline = time.monotonic() + 10
+    while index.stats()["ann_training"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stats = index.stats()
+    assert stats["ann_lists"] > 0
+    assert (index._row_list[:len(index)] >= 0).all()
+
+
+def test_unload_forgets_rows():
+    index, _, _, _ = _build(rows=100)
+    version = index.version
+    index.unload()
+    assert len(index) == 0 and not index.loaded and index.dimensions is None
+    assert index.version > version
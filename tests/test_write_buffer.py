@@ -0,0 +1,124 @@
+# test_write_buffer.py
+
+import asyncio
+import uuid
+
+import pytest
+
+from database import database, get_engine
+from migrate import run_migrations
+from models import chat_history, questions, sessions
+from write_buffer import ChatWriteBuffer
+
+
+@pytest.fixture(scope="module", autouse=True)
+def migrated():
+    run_migrations(get_engine())
+
+
+def _run(test):
+    async def wrapper():
+        await database.connect()
+        try:
+            await test()
+        finally:
+            await database.disconnect()
+    asyncio.run(wrapper())
+
+
+async def _count(table, session_id):
+    return len(await database.fetch_all(table.select().where(table.c.session_id == session_id)))
+
+
+def test_buffered_rows_are_written_on_flush():
+    async def test():
+        session_id = str(uuid.uuid4())
+        buffer = ChatWriteBuffer(max_rows=1000, flush_seconds=60)
+        await buffer.start()
+        await buffer.ensure_session(session_id)
+        await buffer.add_question(session_id, str(uuid.uuid4()), "What is the notice period?")
+        await buffer.add_message(session_id, "user", "What is the notice period?")
+        await buffer.add_message(session_id, "bot", "Three months.")
+        assert buffer.buffered == 4
+        assert [sender for sender, _, _ in buffer.pending_messages(session_id)] == ["user", "bot"]
+        await buffer.flush()
+        assert buffer.buffered == 0 and buffer.pending_messages(session_id) == []
+        assert await _count(sessions, session_id) == 1
+        assert await _count(questions, session_id) == 1
+        assert await _count(chat_history, session_id) == 2
+        # A known session is not looked up or inserted again
+        await buffer.ensure_session(session_id)
+        await buffer.stop()
+        stats = buffer.stats()
+        assert stats["session_lookups"] == 1 and stats["known_session_hits"] == 1
+        assert stats["rows"] == 4 and stats["dropped_rows"] == 0
+    _run(test)
+
+
+def test_rows_without_text_are_rejected():
+    async def test():
+        session_id = str(uuid.uuid4())
+        buffer = ChatWriteBuffer()
+        await buffer.start()
+        with pytest.raises(ValueError):
+            await buffer.add_question(session_id, str(uuid.uuid4()), None)
+        with pytest.raises(ValueError):
+            await buffer.add_message(session_id, "user", None)
+        assert buffer.buffered == 0 and buffer.pending_messages(session_id) == []
+        await buffer.stop()
+    _run(test)
+
+
+def test_unwritable_row_is_dropped_and_the_rest_written():
+    async def test():
+        session_id = str(uuid.uuid4())
+        buffer = ChatWriteBuffer(max_rows=1000, flush_seconds=60)
+        await buffer.start()
+        await buffer.create_session(session_id)
+        await buffer.add_question(session_id, str(uuid.uuid4()), "first")
+        # Bypasses validation, as a row that only fails in the database would
+        buffer._questions.append({"session_id": session_id, "question_id": str(uuid.uuid4()), "question_text": None})
+        await buffer.add_question(session_id, str(uuid.uuid4()), "second")
+        await buffer.add_message(session_id, "user", "first")
+        await buffer.flush()
+        stats = buffer.stats()
+        assert stats["failed_flushes"] == 1 and stats["dropped_rows"] == 1
+        assert buffer.buffered == 0 and buffer.pending_messages(session_id) == []
+        assert await _count(sessions, session_id) == 1
+        assert await _count(questions, session_id) == 2
+        assert await _count(chat_history, session_id) == 1
+        # Later flushes are not held back
+        await buffer.add_message(session_id, "bot", "reply")
+        await buffer.flush()
+        assert await _count(chat_history, session_id) == 2
+        await buffer.stop()
+    _run(test)
+
+
+def test_rows_are_kept_while_the_database_is_unreachable(monkeypatch):
+    async def test():
+        session_id = str(uuid.uuid4())
+        buffer = ChatWriteBuffer(max_rows=1000, flush_seconds=60)
+        await buffer.start()
+        await buffer.create_session(session_id)
+        buffer._questions.append({"session_id": session_id, "question_id": str(uuid.uuid4()), "question_text": None})
+        await buffer.add_message(session_id, "user", "hello")
+
+        async def unreachable():
+            return False
+
+        monkeypatch.setattr(ChatWriteBuffer, "_database_reachable", staticmethod(unreachable))
+        with pytest.raises(Exception):
+            await buffer.flush()
+        assert buffer.buffered == 3
+        assert buffer.stats()["dropped_rows"] == 0
+        assert [message for _, message, _ in buffer.pending_messages(session_id)] == ["hello"]
+        assert await _count(sessions, session_id) == 0
+        assert await _count(chat_history, session_id) == 0
+
+        monkeypatch.undo()
+        await buffer.flush()
+        assert buffer.buffered == 0 and buffer.stats()["dropped_rows"] == 1
+        assert await _count(chat_history, session_id) == 1
+        await buffer.stop()
+    _run(test)
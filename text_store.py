@@ -0,0 +1,147 @@
+# text_store.py
+
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from logging_config import get_logger
+
+logger = get_logger('text_store')
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+class TextStore:
+    """Compressed chunk text kept in SQLite and referenced by chunk ID from the vector store.
+
+    Vector records carry only small metadata, so similarity queries move no text; the
+    text of the final top-k is fetched here by primary key.
+    """
+    def __init__(self, path: str, compression_level: int = 6):
+        self.path = path
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_text ("
+            "chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, raw_size INTEGER NOT NULL, text BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_text_doc_id ON chunk_text (doc_id)")
+        self._create_totals()
+        self.reads = 0
+        self.misses = 0
+        logger.info(f"Text store opened at {path}.")
+
+    def _create_totals(self):
+        """Keeps chunk and byte totals in a one-row table maintained by triggers, so stats never scan."""
+        # REPLACE deletes the old row; the delete trigger only sees that with recursive triggers on
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_text_totals ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), chunks INTEGER NOT NULL, raw_bytes INTEGER NOT NULL, stored_bytes INTEGER NOT NULL)"
+        )
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS chunk_text_totals_insert AFTER INSERT ON chunk_text BEGIN "
+                "UPDATE chunk_text_totals SET chunks = chunks + 1, raw_bytes = raw_bytes + NEW.raw_size, "
+                "stored_bytes = stored_bytes + LENGTH(NEW.text); END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS chunk_text_totals_delete AFTER DELETE ON chunk_text BEGIN "
+                "UPDATE chunk_text_totals SET chunks = chunks - 1, raw_bytes = raw_bytes - OLD.raw_size, "
+                "stored_bytes = stored_bytes - LENGTH(OLD.text); END"
+            )
+            # Stores created before the totals existed are counted once
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chunk_text_totals (id, chunks, raw_bytes, stored_bytes) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(text)), 0) FROM chunk_text"
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def put_many(self, items: Iterable[Tuple[str, str, str]]):
+        """Stores (chunk_id, doc_id, text) triples, replacing existing chunks with the same ID."""
+        rows = []
+        for chunk_id, doc_id, text in items:
+            raw = text.encode("utf-8")
+            rows.append((chunk_id, doc_id, len(raw), zlib.compress(raw, self.compression_level)))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_text (chunk_id, doc_id, raw_size, text) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_many(self, chunk_ids: Sequence[str]) -> Dict[str, str]:
+        """Returns the text of the given chunks keyed by chunk ID; unknown IDs are left out."""
+        found = {}
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), _SQL_BATCH):
+                batch = unique_ids[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT chunk_id, text FROM chunk_text WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall())
+            self.reads += len(found)
+            self.misses += len(unique_ids) - len(found)
+        return {chunk_id: zlib.decompress(blob).decode("utf-8") for chunk_id, blob in found.items()}
+
+    def iter_all(self, page_size: int = 5000) -> Iterator[Tuple[str, str, str]]:
+        """Yields every stored (chunk_id, doc_id, text), reading the table in pages."""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT chunk_id, doc_id, text FROM chunk_text WHERE chunk_id > ? ORDER BY chunk_id LIMIT ?",
+                    (last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for chunk_id, doc_id, blob in rows:
+                yield chunk_id, doc_id, zlib.decompress(blob).decode("utf-8")
+            last = rows[-1][0]
+
+    def get_document(self, doc_id: str) -> List[Tuple[str, str]]:
+        """Returns every (chunk_id, text) stored for a document."""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, text FROM chunk_text WHERE doc_id = ?", (doc_id,)).fetchall()
+        return [(chunk_id, zlib.decompress(blob).decode("utf-8")) for chunk_id, blob in rows]
+
+    def delete_document(self, doc_id: str) -> int:
+        """Removes every chunk of a document and returns how many were dropped."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM chunk_text WHERE doc_id = ?", (doc_id,)).rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk_text")
+
+    def document_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT doc_id FROM chunk_text")]
+
+    def stats(self) -> dict:
+        with self._lock:
+            chunks, raw_bytes, stored_bytes = self._conn.execute(
+                "SELECT chunks, raw_bytes, stored_bytes FROM chunk_text_totals"
+            ).fetchone()
+            return {
+                "chunks": chunks,
+                "raw_bytes": raw_bytes,
+                "stored_bytes": stored_bytes,
+                "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else 0.0,
+                "reads": self.reads,
+                "misses": self.misses,
+            }
@@ -0,0 +1,438 @@
+# vector_index.py
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from logging_config import get_logger
+
+logger = get_logger('vector_index')
+
+# Rows fetched per page when loading from ChromaDB
+LOAD_PAGE_SIZE = 5000
+
+# IVF-flat approximate search: rows are clustered into inverted lists by k-means and a
+# query scores only the rows of the `nprobe` lists whose centroids are closest
+ANN_ENABLED = os.getenv("ANN_ENABLED", "true").lower() == "true"
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "50000"))  # Below this every search is exact
+ANN_EXACT_MAX_ROWS = int(os.getenv("ANN_EXACT_MAX_ROWS", "20000"))  # Searches over fewer candidate rows stay exact
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 picks about 4 * sqrt(rows)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_TRAIN_ITERATIONS = int(os.getenv("ANN_TRAIN_ITERATIONS", "10"))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "100000"))
+# Groups holding more than 1/GROUP_POSTFILTER_FRACTION of the rows are post-filtered
+GROUP_POSTFILTER_FRACTION = int(os.getenv("GROUP_POSTFILTER_FRACTION", "4"))
+# Rows assigned per lock acquisition while (re)building the lists
+_ASSIGN_BLOCK = 16384
+
+
+def train_centroids(sample: np.ndarray, nlist: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Runs spherical k-means on normalized rows and returns nlist normalized centroids."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, sample.shape[0])
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        # Sum each list's rows with one sorted reduceat instead of a scatter-add
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=nlist)
+        used = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[used] = np.add.reduceat(sample[order], np.concatenate(([0], np.cumsum(counts[used])[:-1])), axis=0)
+        empty = counts == 0
+        # Re-seed empty lists from random rows so every list stays in use
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Returns L2-normalized float32 rows; zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """In-process index of pre-normalized chunk embeddings in one contiguous float32 matrix.
+
+    Rows are keyed by chunk ID and grouped by document ID so a group query is a single
+    matrix-vector product over the group's rows followed by an argpartition top-k.
+    Deletions swap the last row into the hole to keep the matrix dense.
+
+    Once the index holds ANN_MIN_ROWS rows it also keeps IVF-flat inverted lists, and
+    searches over more than ANN_EXACT_MAX_ROWS candidate rows score only the rows of the
+    nearest `nprobe` lists. Rows not yet assigned to a list are always scored. The lists
+    are trained on a background thread; searches use the previous lists, or stay exact,
+    until the new ones are complete.
+    """
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self.version = 0
+        self._training = False
+        # Bumped by unload, so a training run started before it is discarded
+        self._epoch = 0
+        self._reset()
+
+    def _reset(self):
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._chunk_ids: List[str] = []
+        self._row_docs: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._doc_rows: Dict[str, Set[int]] = {}
+        # Integer code of every row's document, so large-group membership is one vectorized lookup
+        self._doc_codes: Dict[str, int] = {}
+        self._row_doc_code: Optional[np.ndarray] = None
+        self.loaded = False
+        # Inverted list of every row (-1 while unassigned) and the list centroids
+        self._row_list: Optional[np.ndarray] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_rows = 0
+        # Lists being built by a training run, kept in step with row moves until swapped in
+        self._pending_row_list: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def unload(self):
+        """Forgets every row; the index is filled again from ChromaDB on next use."""
+        with self._lock:
+            self._reset()
+            self.version += 1
+            self._epoch += 1
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    def _ensure_capacity(self, rows: int, dimensions: int):
+        if self._matrix is None:
+            self._matrix = np.zeros((max(self._initial_capacity, rows), dimensions), dtype=np.float32)
+            self._row_list = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+            self._row_doc_code = np.zeros(self._matrix.shape[0], dtype=np.int32)
+            return
+        if self._matrix.shape[1] != dimensions:
+            raise ValueError(f"Embedding has {dimensions} dimensions, index has {self._matrix.shape[1]}.")
+        needed = self._size + rows
+        if needed > self._matrix.shape[0]:
+            capacity = self._matrix.shape[0]
+            while capacity < needed:
+                capacity *= 2
+            grown = np.zeros((capacity, dimensions), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+            row_list = np.full(capacity, -1, dtype=np.int32)
+            row_list[:self._size] = self._row_list[:self._size]
+            self._row_list = row_list
+            row_doc_code = np.zeros(capacity, dtype=np.int32)
+            row_doc_code[:self._size] = self._row_doc_code[:self._size]
+            self._row_doc_code = row_doc_code
+            if self._pending_row_list is not None:
+                pending_row_list = np.full(capacity, -1, dtype=np.int32)
+                pending_row_list[:self._size] = self._pending_row_list[:self._size]
+                self._pending_row_list = pending_row_list
+
+    def add(self, chunk_ids: Sequence[str], doc_ids: Sequence[str], embeddings) -> None:
+        """Adds or replaces chunk embeddings."""
+        self._add(chunk_ids, doc_ids, embeddings)
+        self.maybe_train()
+
+    def _add(self, chunk_ids: Sequence[str], doc_ids: Sequence[str], embeddings) -> None:
+        if not chunk_ids:
+            return
+        vectors = normalize_rows(embeddings)
+        with self._lock:
+            self._ensure_capacity(len(chunk_ids), vectors.shape[1])
+            lists = None if self._centroids is None else np.argmax(vectors @ self._centroids.T, axis=1)
+            for i, (chunk_id, doc_id, vector) in enumerate(zip(chunk_ids, doc_ids, vectors)):
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._chunk_ids.append(chunk_id)
+                    self._row_docs.append(doc_id)
+                    self._row_of[chunk_id] = row
+                elif self._row_docs[row] != doc_id:
+                    self._doc_rows[self._row_docs[row]].discard(row)
+                    self._row_docs[row] = doc_id
+                self._matrix[row] = vector
+                self._row_list[row] = -1 if lists is None else lists[i]
+                if self._pending_row_list is not None:
+                    self._pending_row_list[row] = -1
+                self._row_doc_code[row] = self._doc_codes.setdefault(doc_id, len(self._doc_codes))
+                self._doc_rows.setdefault(doc_id, set()).add(row)
+            self.version += 1
+
+    def remove_document(self, doc_id: str) -> int:
+        """Removes every chunk of a document and returns how many rows were dropped."""
+        with self._lock:
+            rows = self._doc_rows.pop(doc_id, None)
+            if not rows:
+                return 0
+            # Fill holes from the end, highest rows first, so moved rows are never holes themselves
+            for row in sorted(rows, reverse=True):
+                last = self._size - 1
+                removed_id = self._chunk_ids[row]
+                if row != last:
+                    moved_id = self._chunk_ids[last]
+                    moved_doc = self._row_docs[last]
+                    self._matrix[row] = self._matrix[last]
+                    self._row_list[row] = self._row_list[last]
+                    if self._pending_row_list is not None:
+                        self._pending_row_list[row] = self._pending_row_list[last]
+                    self._row_doc_code[row] = self._row_doc_code[last]
+                    self._chunk_ids[row] = moved_id
+                    self._row_docs[row] = moved_doc
+                    self._row_of[moved_id] = row
+                    moved_rows = self._doc_rows[moved_doc]
+                    moved_rows.discard(last)
+                    moved_rows.add(row)
+                del self._row_of[removed_id]
+                self._chunk_ids.pop()
+                self._row_docs.pop()
+                self._size -= 1
+            self.version += 1
+            return len(rows)
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return bool(self._doc_rows.get(doc_id))
+
+    def document_ids(self) -> Set[str]:
+        with self._lock:
+            return {doc_id for doc_id, rows in self._doc_rows.items() if rows}
+
+    def similarities(self, query_embedding, chunk_ids: Iterable[str]) -> Dict[str, float]:
+        """Returns the cosine similarity of the query to each given chunk held in the index."""
+        query = normalize_rows(query_embedding)[0]
+        with self._lock:
+            found = [(chunk_id, self._row_of[chunk_id]) for chunk_id in chunk_ids if chunk_id in self._row_of]
+            if not found:
+                return {}
+            scores = self._matrix[[row for _, row in found]] @ query
+        return {chunk_id: float(score) for (chunk_id, _), score in zip(found, scores)}
+
+    def _rows_for(self, doc_ids: Iterable[str]) -> np.ndarray:
+        rows = [row for doc_id in set(doc_ids) for row in self._doc_rows.get(doc_id, ())]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def _member_lookup(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """Returns a boolean table indexed by document code that is True for the given documents."""
+        lookup = np.zeros(len(self._doc_codes), dtype=bool)
+        codes = [self._doc_codes[doc_id] for doc_id in doc_ids if doc_id in self._doc_codes]
+        lookup[codes] = True
+        return lookup
+
+    def search(
+        self,
+        query_embedding,
+        k: int,
+        doc_ids: Optional[Iterable[str]] = None,
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[Tuple[str, str, float]]:
+        """Returns up to k (chunk_id, doc_id, cosine similarity) tuples, best first.
+
+        When doc_ids is given only chunks of those documents are scored. Small groups are
+        pre-filtered (only their rows are touched); groups covering a large share of the
+        index are post-filtered from the unrestricted candidates, so a group query costs
+        about the same as a global one. `nprobe` trades recall for latency on approximate
+        searches and is widened automatically when too few group rows are found; `exact`
+        forces a full scan.
+        """
+        query = normalize_rows(query_embedding)[0]
+        with self._lock:
+            if self._size == 0:
+                return []
+            rows = None
+            member = None
+            candidates = self._size
+            if doc_ids is not None:
+                doc_ids = set(doc_ids)
+                candidates = sum(len(self._doc_rows.get(doc_id, ())) for doc_id in doc_ids)
+                if candidates == 0:
+                    return []
+                if candidates * GROUP_POSTFILTER_FRACTION <= self._size:
+                    rows = self._rows_for(doc_ids)
+                else:
+                    member = self._member_lookup(doc_ids)
+
+            if not exact and self._centroids is not None and candidates > ANN_EXACT_MAX_ROWS:
+                rows = self._probe(query, k, rows, member, nprobe or ANN_NPROBE)
+                member = None
+                if rows.size == 0:
+                    return []
+            elif member is not None:
+                rows = np.flatnonzero(member[self._row_doc_code[:self._size]])
+
+            if rows is None:
+                scores = self._matrix[:self._size] @ query
+            # Scoring everything and gathering is cheaper than copying out a large subset
+            elif rows.size * 4 > self._size:
+                scores = (self._matrix[:self._size] @ query)[rows]
+            else:
+                scores = self._matrix[rows] @ query
+
+            if threshold is not None:
+                keep = np.flatnonzero(scores >= threshold)
+                scores = scores[keep]
+                rows = keep if rows is None else rows[keep]
+            if scores.size == 0:
+                return []
+
+            k = min(k, scores.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            result_rows = top if rows is None else rows[top]
+            return [
+                (self._chunk_ids[row], self._row_docs[row], float(scores[i]))
+                for i, row in zip(top, result_rows)
+            ]
+
+    def _probe(
+        self,
+        query: np.ndarray,
+        k: int,
+        rows: Optional[np.ndarray],
+        member: Optional[np.ndarray],
+        nprobe: int,
+    ) -> np.ndarray:
+        """Returns the candidate rows in the nearest lists, restricted to `rows` or to documents in `member`.
+
+        The number of probed lists doubles until at least k candidates are found, so a
+        selective filter over-fetches instead of returning too few results.
+        """
+        nlist = self._centroids.shape[0]
+        order = np.argsort(-(self._centroids @ query))
+        nprobe = min(max(1, nprobe), nlist)
+        while True:
+            probed = np.zeros(nlist + 1, dtype=bool)
+            probed[order[:nprobe]] = True
+            probed[-1] = True  # Unassigned rows (list -1) are always candidates
+            if rows is not None:
+                candidates = rows[probed[self._row_list[rows]]]
+            else:
+                candidates = np.flatnonzero(probed[self._row_list[:self._size]])
+                if member is not None:
+                    candidates = candidates[member[self._row_doc_code[candidates]]]
+            if candidates.size >= k or nprobe >= nlist:
+                return candidates
+            nprobe = min(nprobe * 2, nlist)
+
+    def maybe_train(self):
+        """(Re)builds the inverted lists when the index first crosses ANN_MIN_ROWS or has doubled or halved since."""
+        with self._lock:
+            if not ANN_ENABLED or self._training or self._size < ANN_MIN_ROWS:
+                return
+            if self._centroids is not None and self._trained_rows / 2 <= self._size <= self._trained_rows * 2:
+                return
+            # Claimed here so concurrent adds start a single run
+            self._training = True
+        # k-means over a large index takes tens of seconds; ingestion must not wait for it
+        threading.Thread(target=self._train, name="vector-index-train", daemon=True).start()
+
+    def train(self, nlist: Optional[int] = None):
+        """Clusters the current rows with k-means and assigns every row to its nearest list.
+
+        Centroids are fitted on a sample outside the lock and rows are assigned into new
+        lists in blocks, so searches keep running on the previous lists, or exactly, until
+        the new lists are swapped in at the end.
+        """
+        with self._lock:
+            if self._training:
+                return
+            self._training = True
+        self._train(nlist)
+
+    def _train(self, nlist: Optional[int] = None):
+        with self._lock:
+            if self._size == 0:
+                self._training = False
+                return
+            epoch = self._epoch
+            size = self._size
+            nlist = nlist or ANN_NLIST or max(1, int(4 * np.sqrt(size)))
+            rng = np.random.default_rng(self.version)
+            # About 40 rows per list fit the centroids well; more mostly costs time
+            sample_size = min(size, max(nlist, min(ANN_TRAIN_SAMPLE, 40 * nlist)))
+            sample_rows = np.sort(rng.choice(size, sample_size, replace=False))
+            sample = self._matrix[sample_rows].copy()
+        try:
+            started = time.monotonic()
+            centroids = train_centroids(sample, nlist, ANN_TRAIN_ITERATIONS)
+            del sample
+            with self._lock:
+                if epoch != self._epoch:
+                    return
+                self._pending_row_list = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+            start = 0
+            while True:
+                with self._lock:
+                    if epoch != self._epoch:
+                        return
+                    if start >= self._size:
+                        break
+                    end = min(start + _ASSIGN_BLOCK, self._size)
+                    pending = np.flatnonzero(self._pending_row_list[start:end] == -1) + start
+                    if pending.size:
+                        self._pending_row_list[pending] = np.argmax(self._matrix[pending] @ centroids.T, axis=1)
+                start = end
+            with self._lock:
+                if epoch != self._epoch:
+                    return
+                # Rows added meanwhile, or moved into assigned blocks by deletions, are still unassigned
+                pending = np.flatnonzero(self._pending_row_list[:self._size] == -1)
+                if pending.size:
+                    self._pending_row_list[pending] = np.argmax(self._matrix[pending] @ centroids.T, axis=1)
+                self._row_list = self._pending_row_list
+                self._centroids = centroids
+                self._trained_rows = self._size
+            logger.info(f"Vector index trained {centroids.shape[0]} IVF list(s) over {size} row(s) "
+                        f"in {time.monotonic() - started:.2f}s.")
+        except Exception as e:
+            logger.error(f"Error training the vector index: {str(e)}")
+            raise
+        finally:
+            with self._lock:
+                self._pending_row_list = None
+                self._training = False
+
+    def load_from_collection(self, collection) -> None:
+        """Fills the index from every embedding stored in a ChromaDB collection."""
+        with self._lock:
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings", "metadatas"], limit=LOAD_PAGE_SIZE, offset=offset)
+                ids = page.get('ids') or []
+                if not ids:
+                    break
+                self._add(ids, [meta['doc_id'] for meta in page['metadatas']], np.asarray(page['embeddings']))
+                offset += len(ids)
+            self.loaded = True
+            logger.info(f"Vector index loaded with {self._size} chunk(s).")
+        self.maybe_train()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chunks": self._size,
+                "documents": sum(1 for rows in self._doc_rows.values() if rows),
+                "dimensions": self.dimensions,
+                "capacity": 0 if self._matrix is None else self._matrix.shape[0],
+                "version": self.version,
+                "loaded": self.loaded,
+                "ann_lists": 0 if self._centroids is None else self._centroids.shape[0],
+                "ann_trained_rows": self._trained_rows,
+                "ann_training": self._training,
+                "ann_nprobe": ANN_NPROBE,
+            }
@@ -0,0 +1,247 @@
+# write_buffer.py
+
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select
+
+from database import PreparedQuery, database
+from logging_config import get_logger
+from models import chat_history, questions, sessions
+
+logger = get_logger('write_buffer')
+
+# Write-behind buffer configuration
+WRITE_BUFFER_MAX_ROWS = int(os.getenv("WRITE_BUFFER_MAX_ROWS", "200"))  # Buffered rows that trigger an immediate flush
+WRITE_BUFFER_FLUSH_SECONDS = float(os.getenv("WRITE_BUFFER_FLUSH_SECONDS", "0.25"))  # Longest a row waits to be written
+# Past this many unwritten rows (e.g. while the database is down) writers wait for a flush
+WRITE_BUFFER_MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "10000"))
+KNOWN_SESSIONS_MAX = int(os.getenv("KNOWN_SESSIONS_MAX", "100000"))
+
+# Hot statements, prepared once
+_session_lookup = PreparedQuery(select(sessions.c.id).where(sessions.c.session_id == bindparam('session_id')), database)
+_insert_sessions = PreparedQuery(sessions.insert(), database, columns=['session_id', 'is_archived'])
+_insert_questions = PreparedQuery(questions.insert(), database, columns=['session_id', 'question_id', 'question_text'])
+_insert_messages = PreparedQuery(chat_history.insert(), database, columns=['session_id', 'sender', 'message', 'timestamp'])
+
+
+class ChatWriteBuffer:
+    """Write-behind buffer for chat sessions, questions and chat_history rows.
+
+    Writers only append to memory; a background task writes everything buffered with one
+    prepared executemany per table inside a single transaction, when WRITE_BUFFER_MAX_ROWS
+    rows are waiting or WRITE_BUFFER_FLUSH_SECONDS after the first one arrived, and on
+    shutdown. Messages stay visible through `pending_messages` until their flush commits,
+    so a session reads its own writes. Sessions known to exist are remembered, so only
+    the first message of a session in this process queries the sessions table.
+
+    If a batch fails while the database is reachable its rows are written one at a time,
+    and rows that fail on their own are dropped with an error, so one bad row cannot
+    hold back every session's writes. While the database is down the batch is kept.
+    """
+    def __init__(self, max_rows: int = WRITE_BUFFER_MAX_ROWS, flush_seconds: float = WRITE_BUFFER_FLUSH_SECONDS):
+        self.max_rows = max(1, max_rows)
+        self.flush_seconds = flush_seconds
+        self._sessions: List[dict] = []
+        self._questions: List[dict] = []
+        self._messages: List[dict] = []
+        # Unwritten messages per session, kept until their flush commits
+        self._pending: Dict[str, List[dict]] = {}
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"flushes": 0, "failed_flushes": 0, "rows": 0, "session_lookups": 0, "known_session_hits": 0, "stalls": 0, "dropped_rows": 0}
+
+    @property
+    def buffered(self) -> int:
+        return len(self._sessions) + len(self._questions) + len(self._messages)
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._flusher())
+        logger.info(f"Chat write buffer started (max {self.max_rows} rows, {self.flush_seconds}s).")
+
+    async def stop(self):
+        """Stops the background flusher and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Later writes go straight to the database
+        self._wakeup = None
+        try:
+            await self.flush()
+        except Exception:
+            pass
+        if self.buffered:
+            logger.error(f"Chat write buffer stopped with {self.buffered} unwritten row(s).")
+        else:
+            logger.info("Chat write buffer stopped.")
+
+    def _remember(self, session_id: str):
+        self._known[session_id] = None
+        self._known.move_to_end(session_id)
+        while len(self._known) > KNOWN_SESSIONS_MAX:
+            self._known.popitem(last=False)
+
+    async def ensure_session(self, session_id: str):
+        """Makes sure a session exists, queuing its insert if it is new."""
+        if session_id in self._known:
+            self._known.move_to_end(session_id)
+            self._stats["known_session_hits"] += 1
+            return
+        self._stats["session_lookups"] += 1
+        existing = await _session_lookup.fetch_one(session_id=session_id)
+        if session_id in self._known:
+            # Another message of the same session got here first
+            return
+        self._remember(session_id)
+        if not existing:
+            await self._append(self._sessions, {"session_id": session_id, "is_archived": False})
+
+    async def create_session(self, session_id: str):
+        """Queues the insert of a session that cannot exist yet, e.g. one with a fresh ID."""
+        self._remember(session_id)
+        await self._append(self._sessions, {"session_id": session_id, "is_archived": False})
+
+    async def add_question(self, session_id: str, question_id: str, question_text: str):
+        if not isinstance(question_text, str):
+            raise ValueError(f"Question {question_id} of session {session_id} has no text.")
+        await self._append(self._questions, {"session_id": session_id, "question_id": question_id, "question_text": question_text})
+
+    async def add_message(self, session_id: str, sender: str, message: str):
+        if not isinstance(message, str):
+            raise ValueError(f"{sender.capitalize()} message of session {session_id} has no text.")
+        row = {"session_id": session_id, "sender": sender, "message": message, "timestamp": datetime.now()}
+        self._pending.setdefault(session_id, []).append(row)
+        await self._append(self._messages, row)
+
+    def pending_messages(self, session_id: str) -> List[Tuple[str, str, datetime]]:
+        """Returns the session's (sender, message, timestamp) rows not yet committed, oldest first."""
+        return [(row["sender"], row["message"], row["timestamp"]) for row in self._pending.get(session_id, ())]
+
+    async def _append(self, rows: List[dict], row: dict):
+        rows.append(row)
+        if self._wakeup is None:
+            # Not started (e.g. scripts and tests): write through
+            await self.flush()
+            return
+        if self.buffered >= WRITE_BUFFER_MAX_PENDING:
+            self._stats["stalls"] += 1
+            await self.flush()
+        else:
+            self._wakeup.set()
+
+    async def _flusher(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.buffered < self.max_rows:
+                # Give the batch time to fill unless it is already full
+                try:
+                    await asyncio.wait_for(self._full(), self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception:
+                # Already logged; retry the kept rows after a pause
+                await asyncio.sleep(max(self.flush_seconds, 1.0))
+                self._wakeup.set()
+
+    async def _full(self):
+        while self.buffered < self.max_rows:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    async def flush(self):
+        """Writes every buffered row now; failed rows stay buffered for the next flush."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self.buffered:
+                return
+            new_sessions, self._sessions = self._sessions, []
+            new_questions, self._questions = self._questions, []
+            new_messages, self._messages = self._messages, []
+            try:
+                async with database.transaction():
+                    if new_sessions:
+                        new_sessions = await self._unwritten_sessions(new_sessions)
+                        await _insert_sessions.execute_many(new_sessions)
+                    await _insert_questions.execute_many(new_questions)
+                    await _insert_messages.execute_many(new_messages)
+            except Exception as e:
+                self._stats["failed_flushes"] += 1
+                if not await self._database_reachable():
+                    self._sessions[:0] = new_sessions
+                    self._questions[:0] = new_questions
+                    self._messages[:0] = new_messages
+                    logger.error(f"Error flushing chat writes, {self.buffered} row(s) kept for retry: {str(e)}")
+                    raise
+                logger.error(f"Error flushing chat writes, retrying {len(new_sessions) + len(new_questions) + len(new_messages)} row(s) one at a time: {str(e)}")
+                new_sessions = await self._insert_each(_insert_sessions, await self._unwritten_sessions(new_sessions))
+                new_questions = await self._insert_each(_insert_questions, new_questions)
+                written_messages = await self._insert_each(_insert_messages, new_messages)
+                # Dropped messages must not linger in the session's pending view either
+                self._forget_pending(new_messages)
+                new_messages = written_messages
+            else:
+                self._forget_pending(new_messages)
+            self._stats["flushes"] += 1
+            self._stats["rows"] += len(new_sessions) + len(new_questions) + len(new_messages)
+
+    def _forget_pending(self, rows: List[dict]):
+        done = {id(row) for row in rows}
+        for session_id in {row["session_id"] for row in rows}:
+            left = [row for row in self._pending.get(session_id, ()) if id(row) not in done]
+            if left:
+                self._pending[session_id] = left
+            else:
+                self._pending.pop(session_id, None)
+
+    @staticmethod
+    async def _unwritten_sessions(rows: List[dict]) -> List[dict]:
+        # Another process may have created some of them in the meantime
+        ids = list(dict.fromkeys(row["session_id"] for row in rows))
+        existing = {
+            row["session_id"] for row in
+            await database.fetch_all(select(sessions.c.session_id).where(sessions.c.session_id.in_(ids)))
+        }
+        return [{"session_id": session_id, "is_archived": False} for session_id in ids if session_id not in existing]
+
+    @staticmethod
+    async def _database_reachable() -> bool:
+        try:
+            await database.fetch_one("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    async def _insert_each(self, statement: PreparedQuery, rows: List[dict]) -> List[dict]:
+        """Inserts rows one by one, dropping those that fail; returns the rows written."""
+        written = []
+        for row in rows:
+            try:
+                await statement.execute_many([row])
+            except Exception as e:
+                self._stats["dropped_rows"] += 1
+                logger.error(f"Dropped unwritable chat row {row}: {str(e)}")
+                continue
+            written.append(row)
+        return written
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["buffered"] = self.buffered
+        stats["avg_rows_per_flush"] = round(stats["rows"] / stats["flushes"], 1) if stats["flushes"] else 0.0
+        stats["known_sessions"] = len(self._known)
+        return stats
+
+
+write_buffer = ChatWriteBuffer()